@@ -0,0 +1,35 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+
+
+def parse_lods(value):
+    """
+    Parses LOD triangle ratios, e.g. "0.5,0.25,0.1".
+    """
+    try:
+        results = [float(i) for i in filter(None, value.split(','))]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid ratios: {}'.format(value))
+
+    if not all(0 < i < 1 for i in results):
+        raise argparse.ArgumentTypeError(
+            'ratios should be between 0 and 1: {}'.format(value))
+    if results != sorted(results, reverse=True):
+        raise argparse.ArgumentTypeError(
+            'ratios should be in descending order: {}'.format(value))
+
+    return results
@@ -0,0 +1,156 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+
+# cached data layout version, older entries are never matched
+VERSION = 1
+
+# default cache size in megabytes
+CACHE_SIZE = 1024
+
+
+def get_cache_dir():
+    """
+    Returns the default cache directory.
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'kitsunetsuki')
+
+
+class GeomCache(object):
+    """
+    On-disk cache of the exported geometry by the content hash.
+    Every entry is a NumPy .npz file of the arrays with a JSON header.
+    Least recently used entries are removed
+    when the size of the cache exceeds the limit (in bytes).
+    """
+    def __init__(self, path, max_size=CACHE_SIZE * 1024 * 1024):
+        self._path = path
+        self._max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+        self._size = sum(size for _, size, _ in self._get_entries())
+
+    def _get_entries(self):
+        """
+        Returns (modification time, size, file path) of every entry.
+        """
+        results = []
+        for name in os.listdir(self._path):
+            if not name.endswith('.npz'):
+                continue
+
+            filepath = os.path.join(self._path, name)
+            try:
+                stat = os.stat(filepath)
+            except OSError:  # removed meanwhile
+                continue
+            results.append((stat.st_mtime, stat.st_size, filepath))
+
+        return results
+
+    def _get_filepath(self, key):
+        return os.path.join(self._path, '{}.npz'.format(key))
+
+    def get_key(self, *parts):
+        """
+        Returns the hash of the arrays and JSON serializable parts.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(VERSION).encode())
+
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update('{}{}'.format(part.dtype, part.shape).encode())
+                h.update(memoryview(np.ascontiguousarray(part)).cast('B'))
+            else:
+                h.update(json.dumps(part, sort_keys=True).encode())
+
+        return h.hexdigest()
+
+    def load(self, key):
+        """
+        Returns the header and the arrays of the entry or None.
+        Missing, damaged and concurrently removed entries are not found.
+        """
+        filepath = self._get_filepath(key)
+        try:
+            with np.load(filepath, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            header = json.loads(str(arrays.pop('header')))
+            os.utime(filepath)  # recently used
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+
+        return header, arrays
+
+    def save(self, key, header, arrays):
+        """
+        Writes the entry and evicts the least recently used ones.
+        The entry is written into a temporary file and moved in place,
+        so it's never read half-written.
+        Entries which fail to be written are skipped.
+        """
+        filepath = self._get_filepath(key)
+        try:
+            fd, temp_filepath = tempfile.mkstemp(dir=self._path, suffix='.tmp')
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, header=np.array(json.dumps(header)), **arrays)
+            size = os.path.getsize(temp_filepath)
+
+            old_size = 0
+            if os.path.exists(filepath):
+                old_size = os.path.getsize(filepath)
+            os.replace(temp_filepath, filepath)
+        except OSError:
+            try:
+                os.remove(temp_filepath)
+            except OSError:
+                pass
+            return
+
+        self._size += size - old_size
+
+        if self._size > self._max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits.
+        """
+        entries = self._get_entries()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, filepath in sorted(entries):
+            if self._size <= self._max_size:
+                break
+
+            try:
+                os.remove(filepath)
+            except OSError:
+                continue
+            self._size -= size
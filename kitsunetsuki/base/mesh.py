@@ -15,28 +15,256 @@
 
 import bpy
 import bmesh
+import collections
+import itertools
+import mathutils  # make sure to "import bpy" before
+import numpy as np
+import operator
 
+from kitsunetsuki.base.objects import SKIPPED_MODIFIERS
+
+
+# loop triangle with the attributes of its polygon
+Triangle = collections.namedtuple('Triangle', (
+    'vertices', 'loop_indices', 'material_index', 'use_smooth', 'normal'))
 
-def obj2mesh(obj, triangulate=True):
-    # convert the object to a mesh, so we can read the polygons
-    # https://docs.blender.org/api/blender2.8/bpy.types.Object.html?highlight=to_mesh#bpy.types.Object.to_mesh
-    # mesh = obj.to_mesh(
-    #     bpy.context.depsgraph, apply_modifiers=True, calc_undeformed=True)
-    mesh = obj.to_mesh()
 
-    # get a BMesh representation
-    b_mesh = bmesh.new()
-    b_mesh.from_mesh(mesh)
+def has_ngons(mesh):
+    loop_total = get_array(mesh.polygons, 'loop_total', np.int32)
+    return bool(len(loop_total)) and int(loop_total.max()) > 4
+
+
+def _prepare_mesh(mesh, triangulate=True, loop_triangles=False):
+    # loop triangles are read from the mesh as it is,
+    # n-gons are triangulated anyway, tangents are calculated for quads at most
+    if triangulate and loop_triangles:
+        triangulate = has_ngons(mesh)
 
-    # triangulate the mesh
     if triangulate:
+        # get a BMesh representation
+        b_mesh = bmesh.new()
+        b_mesh.from_mesh(mesh)
+
+        # triangulate the mesh
         bmesh.ops.triangulate(b_mesh, faces=b_mesh.faces)
 
-    # copy the bmesh back to the original mesh
-    b_mesh.to_mesh(mesh)
+        # copy the bmesh back to the original mesh
+        b_mesh.to_mesh(mesh)
+        b_mesh.free()
 
     # calculate the per-vertex normals, in case blender did not do that yet.
     mesh.calc_normals()
     mesh.calc_normals_split()
 
     return mesh
+
+
+def obj2mesh(obj, triangulate=True, loop_triangles=False):
+    # convert the object to a mesh, so we can read the polygons
+    # https://docs.blender.org/api/blender2.8/bpy.types.Object.html?highlight=to_mesh#bpy.types.Object.to_mesh
+    # mesh = obj.to_mesh(
+    #     bpy.context.depsgraph, apply_modifiers=True, calc_undeformed=True)
+    mesh = obj.to_mesh()
+
+    return _prepare_mesh(
+        mesh, triangulate=triangulate, loop_triangles=loop_triangles)
+
+
+def _new_evaluated_mesh(obj):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    return bpy.data.meshes.new_from_object(
+        obj.evaluated_get(depsgraph),
+        preserve_all_data_layers=True, depsgraph=depsgraph)
+
+
+def _eval2mesh_shape_keys(obj):
+    """
+    Returns a new mesh of the object evaluated with its modifiers
+    and with its shape keys, which are lost on evaluation.
+    Every shape key is evaluated alone and stored into the new mesh.
+    """
+    key_blocks = obj.data.shape_keys.key_blocks
+    show_only_shape_key = obj.show_only_shape_key
+    active_shape_key_index = obj.active_shape_key_index
+
+    try:
+        obj.show_only_shape_key = True
+        obj.active_shape_key_index = 0
+        mesh = _new_evaluated_mesh(obj)  # reference shape key
+        positions = [get_array(mesh.vertices, 'co', size=3)]
+
+        for i, key_block in enumerate(key_blocks[1:], 1):
+            obj.active_shape_key_index = i
+            sk_mesh = _new_evaluated_mesh(obj)
+            positions.append(get_array(sk_mesh.vertices, 'co', size=3))
+            bpy.data.meshes.remove(sk_mesh)
+
+            if len(positions[-1]) != len(positions[0]):
+                bpy.data.meshes.remove(mesh)
+                raise ValueError(
+                    'Modifiers of object "{}" change the topology '
+                    'of shape key "{}".'.format(obj.name, key_block.name))
+    finally:
+        obj.show_only_shape_key = show_only_shape_key
+        obj.active_shape_key_index = active_shape_key_index
+
+    # shape keys are added through a temporary object
+    sk_obj = bpy.data.objects.new(obj.name, mesh)
+    try:
+        for key_block, co in zip(key_blocks, positions):
+            sk = sk_obj.shape_key_add(name=key_block.name, from_mix=False)
+            sk.data.foreach_set('co', co.reshape(-1))
+            sk.slider_min = key_block.slider_min
+            sk.slider_max = key_block.slider_max
+            sk.value = key_block.value
+            sk.mute = key_block.mute
+    finally:
+        bpy.data.objects.remove(sk_obj)
+
+    sk_blocks = mesh.shape_keys.key_blocks
+    for key_block, sk in zip(key_blocks, sk_blocks):
+        if key_block.relative_key:
+            sk.relative_key = sk_blocks[key_block.relative_key.name]
+    mesh.shape_keys.use_relative = obj.data.shape_keys.use_relative
+
+    return mesh
+
+
+def eval2mesh(obj, triangulate=True, scale=1, loop_triangles=False):
+    """
+    Returns a new mesh of the object evaluated with its modifiers
+    without changing the scene, remove it with bpy.data.meshes.remove.
+    Armature and collision modifiers are disabled during evaluation.
+    Shape keys are evaluated with the modifiers one by one,
+    modifiers which change the topology of the shape keys raise ValueError.
+    """
+    modifiers = [
+        mod for mod in obj.modifiers
+        if mod.show_viewport and mod.type in SKIPPED_MODIFIERS]
+    has_modifiers = any(
+        mod.show_viewport and mod.type not in SKIPPED_MODIFIERS
+        for mod in obj.modifiers)
+    for mod in modifiers:
+        mod.show_viewport = False
+
+    try:
+        if obj.type == 'MESH' and obj.data.shape_keys:
+            if has_modifiers:
+                mesh = _eval2mesh_shape_keys(obj)
+            else:
+                mesh = obj.data.copy()
+        else:
+            mesh = _new_evaluated_mesh(obj)
+    finally:
+        for mod in modifiers:
+            mod.show_viewport = True
+
+    if scale != 1:
+        mesh.transform(mathutils.Matrix.Scale(scale, 4), shape_keys=True)
+
+    return _prepare_mesh(
+        mesh, triangulate=triangulate, loop_triangles=loop_triangles)
+
+
+def get_array(collection, attr, dtype=np.float32, size=1):
+    """
+    Reads the attribute of every item of the Blender collection
+    into a NumPy array of shape (count, size) with foreach_get.
+    """
+    values = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attr, values)
+    if size > 1:
+        values = values.reshape(-1, size)
+    return values
+
+
+def get_vertex_groups(mesh):
+    """
+    Returns the vertex group counts of every vertex
+    and the flat vertex group indices and weights in order of vertices.
+    Blender has no foreach_get for the vertex groups of the whole mesh,
+    so the group elements are chained and read by NumPy in C loops.
+    """
+    vertex_groups = list(map(operator.attrgetter('groups'), mesh.vertices))
+    counts = np.fromiter(
+        map(len, vertex_groups), dtype=np.int64, count=len(vertex_groups))
+
+    elements = list(itertools.chain.from_iterable(vertex_groups))
+    groups = np.fromiter(
+        map(operator.attrgetter('group'), elements),
+        dtype=np.int32, count=len(elements))
+    weights = np.fromiter(
+        map(operator.attrgetter('weight'), elements),
+        dtype=np.float32, count=len(elements))
+
+    return counts, groups, weights
+
+
+def get_loop_triangles(mesh):
+    """
+    Returns loop indices (triangles, 3), polygon indices
+    and normals of the mesh loop triangles.
+    """
+    mesh.calc_loop_triangles()
+    return {
+        'loops': get_array(mesh.loop_triangles, 'loops', np.int32, size=3),
+        'polygons': get_array(mesh.loop_triangles, 'polygon_index', np.int32),
+        'normals': get_array(mesh.loop_triangles, 'normal', size=3),
+    }
+
+
+def get_triangles(mesh):
+    """
+    Returns loop triangles of the mesh as the polygon-like tuples.
+    """
+    triangles = get_loop_triangles(mesh)
+    vertex_ids = get_array(mesh.loops, 'vertex_index', np.int32)
+    material_ids = get_array(mesh.polygons, 'material_index', np.int32)
+    use_smooth = get_array(mesh.polygons, 'use_smooth', bool)
+
+    polygon_ids = triangles['polygons']
+    return [
+        Triangle(*args) for args in zip(
+            vertex_ids[triangles['loops']].tolist(),
+            triangles['loops'].tolist(),
+            material_ids[polygon_ids].tolist(),
+            use_smooth[polygon_ids].tolist(),
+            map(mathutils.Vector, triangles['normals'].tolist()))
+    ]
+
+
+def get_mesh_data(mesh, loop_triangles=False):
+    """
+    Returns the mesh data as arrays and names,
+    which are hashed into the geometry cache key.
+    """
+    results = [
+        get_array(mesh.vertices, 'co', size=3),
+        get_array(mesh.vertices, 'normal', size=3),
+        get_array(mesh.edges, 'vertices', np.int32, size=2),
+        get_array(mesh.edges, 'use_edge_sharp', bool),
+        get_array(mesh.loops, 'vertex_index', np.int32),
+        get_array(mesh.loops, 'normal', size=3),
+        get_array(mesh.polygons, 'loop_start', np.int32),
+        get_array(mesh.polygons, 'loop_total', np.int32),
+        get_array(mesh.polygons, 'material_index', np.int32),
+        get_array(mesh.polygons, 'use_smooth', bool),
+        get_array(mesh.polygons, 'normal', size=3),
+        *get_vertex_groups(mesh),
+        mesh.use_auto_smooth,
+        [material.name if material else None for material in mesh.materials],
+    ]
+
+    for uv_name, uv_layer in mesh.uv_layers.items():
+        results.append([uv_name, uv_layer.active])
+        results.append(get_array(uv_layer.data, 'uv', size=2))
+
+    if mesh.shape_keys:
+        for sk_name, key_block in mesh.shape_keys.key_blocks.items():
+            results.append(sk_name)
+            results.append(get_array(key_block.data, 'co', size=3))
+
+    if loop_triangles:
+        results.append(get_loop_triangles(mesh)['loops'])
+
+    return results
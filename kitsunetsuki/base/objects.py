@@ -17,6 +17,45 @@ import bpy
 import json
 
 
+# modifiers which are not applied to the exported meshes
+SKIPPED_MODIFIERS = ('ARMATURE', 'COLLISION')
+
+
+def get_modifiers_key(obj):
+    """
+    Returns hashable settings of the modifiers applied to the object.
+    """
+    results = []
+    for mod in obj.modifiers:
+        if not mod or not mod.show_viewport:
+            continue
+
+        if mod.type in SKIPPED_MODIFIERS:
+            continue
+
+        settings = [mod.type]
+        for prop in mod.bl_rna.properties:
+            if prop.identifier in ('rna_type', 'name', 'show_expanded'):
+                continue
+
+            value = getattr(mod, prop.identifier, None)
+            if isinstance(value, (bool, int, float, str, type(None))):
+                pass
+            elif isinstance(value, bpy.types.ID):
+                value = value.name
+            else:
+                try:
+                    value = tuple(value)
+                    hash(value)
+                except TypeError:
+                    value = repr(value)  # unique, never shared
+            settings.append((prop.identifier, value))
+
+        results.append(tuple(settings))
+
+    return tuple(results)
+
+
 def get_object_properties(obj):
     text = bpy.data.texts.get(obj.name)
     if text:
@@ -56,7 +95,7 @@ def apply_modifiers(obj, triangulate=False, apply_scale=False):
         if not mod or not mod.show_viewport:
             continue
 
-        if mod.type in ('ARMATURE', 'COLLISION'):
+        if mod.type in SKIPPED_MODIFIERS:
             continue
 
         if not is_activated:
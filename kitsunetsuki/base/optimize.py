@@ -0,0 +1,302 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Triangle and vertex order optimizations for the GPU vertex caches
+and the overdraw.
+"""
+
+import collections
+
+import numpy as np
+
+
+# post-transform vertex cache size
+CACHE_SIZE = 16
+
+# max ACMR degradation allowed by the overdraw optimization
+OVERDRAW_THRESHOLD = 1.05
+
+
+def _get_vertex_triangles(triangles, vertex_count):
+    """
+    Returns triangle IDs of every vertex as (offsets, triangle IDs)
+    and the number of triangles of every vertex.
+    """
+    corners = triangles.reshape(-1)
+    order = np.argsort(corners, kind='stable')
+    counts = np.bincount(corners, minlength=vertex_count)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return offsets.tolist(), (order // 3).tolist(), counts.tolist()
+
+
+def get_triangle_order(indices, vertex_count, cache_size=CACHE_SIZE):
+    """
+    Returns triangle IDs ordered for the post-transform vertex cache
+    with the Tipsify algorithm by Sander, Nehab and Barczak.
+    """
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    if not len(triangles):
+        return []
+
+    offsets, adjacency, live = _get_vertex_triangles(triangles, vertex_count)
+    corners = triangles.tolist()
+
+    cache_time = [0] * vertex_count
+    emitted = bytearray(len(corners))
+    dead_end = []
+    order = []
+
+    timestamp = cache_size + 1
+    cursor = 0
+    fanning = int(triangles[0, 0])
+    while fanning >= 0:
+        candidates = []
+
+        # emit all the triangles of the fanning vertex
+        for triangle_id in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle_id]:
+                continue
+
+            emitted[triangle_id] = 1
+            order.append(triangle_id)
+            for vertex_id in corners[triangle_id]:
+                dead_end.append(vertex_id)
+                candidates.append(vertex_id)
+                live[vertex_id] -= 1
+                if timestamp - cache_time[vertex_id] > cache_size:
+                    cache_time[vertex_id] = timestamp
+                    timestamp += 1
+
+        # next fanning vertex is the oldest one which stays in cache
+        fanning = -1
+        best = -1
+        for vertex_id in candidates:
+            if live[vertex_id] <= 0:
+                continue
+
+            priority = 0
+            age = timestamp - cache_time[vertex_id]
+            if age + 2 * live[vertex_id] <= cache_size:
+                priority = age
+            if priority > best:
+                best = priority
+                fanning = vertex_id
+
+        if fanning >= 0:
+            continue
+
+        # skip dead end, recently used vertices first
+        while dead_end:
+            vertex_id = dead_end.pop()
+            if live[vertex_id] > 0:
+                fanning = vertex_id
+                break
+        else:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fanning = cursor
+                    break
+                cursor += 1
+
+    return order
+
+
+def tipsify(indices, vertex_count, cache_size=CACHE_SIZE):
+    """
+    Returns triangle list indices reordered for the vertex cache.
+    """
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    order = get_triangle_order(triangles, vertex_count, cache_size)
+    return triangles[order].reshape(-1)
+
+
+def _update_cache(triangle, cache_time, timestamp, cache_size):
+    """
+    Pushes missed vertices of the triangle into the vertex cache.
+    Returns the number of misses and the next timestamp.
+    """
+    misses = 0
+    for vertex_id in triangle:
+        if timestamp - cache_time[vertex_id] > cache_size:
+            cache_time[vertex_id] = timestamp
+            timestamp += 1
+            misses += 1
+    return misses, timestamp
+
+
+def _get_clusters(triangles, vertex_count, threshold, cache_size):
+    """
+    Splits the triangles ordered for the vertex cache into clusters,
+    which can be reordered without much of the vertex cache degradation.
+    Returns the first triangle ID of every cluster.
+    """
+    # hard boundaries, where all the vertices are missed by the cache,
+    # usually a disjoint patch of the mesh
+    cache_time = [0] * vertex_count
+    timestamp = cache_size + 1
+    hard = []
+    for i, triangle in enumerate(triangles):
+        misses, timestamp = _update_cache(
+            triangle, cache_time, timestamp, cache_size)
+        if i == 0 or misses == 3:
+            hard.append(i)
+    hard.append(len(triangles))
+
+    # soft boundaries, where ACMR of the cluster rendered after
+    # a cache flush reaches ACMR of the hard cluster
+    cache_time = [0] * vertex_count
+    timestamp = 0
+    results = []
+    for start, end in zip(hard[:-1], hard[1:]):
+        timestamp += cache_size + 1
+        misses = 0
+        for triangle in triangles[start:end]:
+            count, timestamp = _update_cache(
+                triangle, cache_time, timestamp, cache_size)
+            misses += count
+        limit = threshold * misses / (end - start)
+
+        first = len(results)
+        results.append(start)
+        timestamp += cache_size + 1
+        misses = 0
+        for i in range(start, end):
+            count, timestamp = _update_cache(
+                triangles[i], cache_time, timestamp, cache_size)
+            misses += count
+            if misses <= limit * (i + 1 - results[-1]):
+                results.append(i + 1)
+                timestamp += cache_size + 1
+                misses = 0
+
+        # the last cluster is empty or it doesn't reach the limit,
+        # it's merged with the previous one
+        if len(results) - first > 1:
+            results.pop()
+
+    return results
+
+
+def get_overdraw_order(indices, positions, threshold=OVERDRAW_THRESHOLD,
+                       cache_size=CACHE_SIZE):
+    """
+    Returns triangle IDs reordered to reduce the overdraw, the indices
+    should be ordered for the vertex cache first. Clusters of triangles
+    facing outwards are drawn first, occluding the rest of the mesh,
+    as in Tipsify by Sander, Nehab and Barczak.
+    The threshold is the max ACMR degradation of the clusters.
+    """
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    if not len(triangles):
+        return []
+
+    positions = np.asarray(positions, dtype=np.float64)
+    clusters = _get_clusters(
+        triangles.tolist(), len(positions), threshold, cache_size)
+
+    # area weighted normals and centroids of the clusters
+    corners = positions[triangles]
+    normals = np.cross(
+        corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(normals, axis=-1)
+    centroids = corners.mean(axis=1)
+
+    cluster_normals = np.add.reduceat(normals, clusters)
+    cluster_areas = np.add.reduceat(areas, clusters)
+    cluster_centroids = np.add.reduceat(
+        centroids * areas[:, None], clusters)
+    cluster_centroids /= np.maximum(cluster_areas, 1e-12)[:, None]
+    cluster_normals /= np.maximum(
+        np.linalg.norm(cluster_normals, axis=-1), 1e-12)[:, None]
+
+    # clusters facing away from the mesh center go first
+    center = positions[triangles.reshape(-1)].mean(axis=0)
+    priorities = ((cluster_centroids - center) * cluster_normals).sum(axis=-1)
+
+    bounds = clusters + [len(triangles)]
+    order = []
+    for cluster_id in np.argsort(-priorities, kind='stable').tolist():
+        order.extend(range(bounds[cluster_id], bounds[cluster_id + 1]))
+    return order
+
+
+def optimize_overdraw(indices, positions, threshold=OVERDRAW_THRESHOLD,
+                      cache_size=CACHE_SIZE):
+    """
+    Returns triangle list indices reordered for the overdraw.
+    """
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    order = get_overdraw_order(triangles, positions, threshold, cache_size)
+    return triangles[order].reshape(-1)
+
+
+def optimize_vertex_fetch(indices, vertex_count):
+    """
+    Reorders vertices in order of the first use by the indices,
+    unused vertices are moved to the end.
+    Returns remapped indices and old vertex IDs in the new order.
+    """
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    used, first = np.unique(indices, return_index=True)
+    order = np.concatenate([
+        used[np.argsort(first)],
+        np.setdiff1d(np.arange(vertex_count), used)])
+
+    remap = np.empty(vertex_count, dtype=np.int64)
+    remap[order] = np.arange(vertex_count)
+    return remap[indices], order
+
+
+def get_cache_misses(indices, cache_size=CACHE_SIZE):
+    """
+    Returns the number of vertex transforms with the FIFO vertex cache.
+    """
+    cache = collections.deque()
+    cached = set()
+    misses = 0
+
+    for vertex_id in np.asarray(indices).reshape(-1).tolist():
+        if vertex_id in cached:
+            continue
+
+        misses += 1
+        if len(cache) == cache_size:
+            cached.discard(cache.popleft())
+        cache.append(vertex_id)
+        cached.add(vertex_id)
+
+    return misses
+
+
+def get_acmr(indices, cache_size=CACHE_SIZE):
+    """
+    Returns average cache miss ratio, vertex transforms per triangle.
+    """
+    triangles = len(indices) // 3
+    if not triangles:
+        return 0
+    return get_cache_misses(indices, cache_size) / triangles
+
+
+def get_atvr(indices, cache_size=CACHE_SIZE):
+    """
+    Returns average transform to vertex ratio,
+    vertex transforms per referenced vertex, 1 is optimal.
+    """
+    vertices = len(np.unique(indices))
+    if not vertices:
+        return 0
+    return get_cache_misses(indices, cache_size) / vertices
@@ -0,0 +1,266 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Mesh simplification by the quadric error metric edge collapses.
+"""
+
+import numpy as np
+
+
+# simplified level is dropped when it has less
+# than this fraction of triangles removed from the previous level
+MIN_REDUCTION = 0.1
+
+
+def _get_quadrics(positions, triangles):
+    """
+    Returns area weighted plane quadrics of every vertex
+    and the sum of their weights.
+    """
+    p0, p1, p2 = (positions[triangles[:, i]] for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    areas = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(areas, 1e-12)[:, None]
+
+    planes = np.hstack([normals, -(normals * p0).sum(axis=1)[:, None]])
+    quadrics = planes[:, :, None] * planes[:, None, :] * areas[:, None, None]
+
+    results = np.zeros((len(positions), 4, 4))
+    weights = np.zeros(len(positions))
+    for i in range(3):
+        np.add.at(results, triangles[:, i], quadrics)
+        np.add.at(weights, triangles[:, i], areas)
+
+    return results, weights
+
+
+def _get_welded(positions, attributes=None):
+    """
+    Returns IDs of the vertices welded by position,
+    and IDs of the vertices welded by position and seam attributes.
+    """
+    _, weld = np.unique(positions, axis=0, return_inverse=True)
+    weld = weld.reshape(-1)
+    if attributes is None:
+        return weld, weld
+
+    attributes = np.asarray(attributes).reshape(len(positions), -1)
+    _, seams = np.unique(
+        np.hstack([weld[:, None], attributes]), axis=0, return_inverse=True)
+    return weld, seams.reshape(-1)
+
+
+def _get_locked(triangles, vertex_count):
+    """
+    Returns the mask of border and non-manifold vertices.
+    """
+    u = triangles.reshape(-1)
+    v = np.roll(triangles, -1, axis=1).reshape(-1)
+    keys, counts = np.unique(
+        np.minimum(u, v) * vertex_count + np.maximum(u, v),
+        return_counts=True)
+    keys = keys[counts != 2]
+
+    locked = np.zeros(vertex_count, dtype=bool)
+    locked[keys // vertex_count] = True
+    locked[keys % vertex_count] = True
+    return locked
+
+
+def _get_candidates(positions, triangles, quadrics, weights, locked):
+    """
+    Returns the collapses as (from, to, cost) sorted by cost,
+    the collapsed vertex moves into its neighbour.
+    Cost is the mean squared distance to the planes of both vertices.
+    """
+    u = triangles.reshape(-1)
+    v = np.roll(triangles, -1, axis=1).reshape(-1)
+    keys = np.unique(np.concatenate([
+        u * len(positions) + v, v * len(positions) + u]))
+    edges = np.stack([keys // len(positions), keys % len(positions)], axis=1)
+    edges = edges[~locked[edges[:, 0]]]
+
+    points = np.hstack([positions[edges[:, 1]], np.ones((len(edges), 1))])
+    costs = np.einsum(
+        'ni,nij,nj->n', points,
+        quadrics[edges[:, 0]] + quadrics[edges[:, 1]], points)
+    costs = np.maximum(costs, 0) / np.maximum(
+        weights[edges[:, 0]] + weights[edges[:, 1]], 1e-12)
+
+    order = np.argsort(costs, kind='stable')
+    return edges[order, 0], edges[order, 1], costs[order]
+
+
+def _cross(a, b, c):
+    ab = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+    ac = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+    return (
+        ab[1] * ac[2] - ab[2] * ac[1],
+        ab[2] * ac[0] - ab[0] * ac[2],
+        ab[0] * ac[1] - ab[1] * ac[0])
+
+
+def _is_flipped(positions, triangles, u, v):
+    """
+    Checks if any triangle of the vertex u flips,
+    when the vertex u moves into the vertex v.
+    """
+    for triangle in triangles:
+        if v in triangle:
+            continue
+
+        points = [positions[i] for i in triangle]
+        before = _cross(*points)
+        points[triangle.index(u)] = positions[v]
+        after = _cross(*points)
+        if sum(a * b for a, b in zip(before, after)) <= 0:
+            return True
+
+    return False
+
+
+def _get_targets(triangles, weld, seams, u, v):
+    """
+    Returns the vertices, the copies of the welded vertex u move into,
+    when the vertex u collapses into the vertex v.
+    Copies keep the attributes of their side of the seam,
+    so seams are collapsed only along themselves.
+    Returns None if the collapse breaks the seam.
+    """
+    results = {}
+    sides = {}  # seam ID -> copy of v
+
+    for triangle in triangles:
+        welded = [weld[i] for i in triangle]
+        i = triangle[welded.index(u)]
+        results.setdefault(i, None)
+        if v in welded:
+            j = triangle[welded.index(v)]
+            if seams[sides.setdefault(seams[i], j)] != seams[j]:
+                return
+            if results[i] is None:
+                results[i] = j
+
+    for i, j in results.items():
+        if j is None:
+            if seams[i] not in sides:
+                return
+            results[i] = sides[seams[i]]
+
+    return results
+
+
+def simplify(positions, indices, ratio, max_error=None, attributes=None):
+    """
+    Simplifies indexed triangle list to the ratio of triangles,
+    or until the error relative to the mesh size exceeds max error.
+    Topology is built from the vertices welded by position,
+    so the copies of the vertex split by normals or materials
+    are collapsed together and keep their attributes.
+    Copies which differ by the seam attributes, such as UV,
+    are collapsed only along the seam, borders are locked.
+    Returns simplified indices and the resulting relative error.
+    """
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    target = int(len(triangles) * ratio)
+    if not len(triangles) or len(triangles) <= target:
+        return triangles.reshape(-1), 0
+
+    weld, seams = _get_welded(positions, attributes)
+    welded_positions = np.zeros((weld.max() + 1, 3))
+    welded_positions[weld] = positions
+
+    # relative to the mesh size
+    used = welded_positions[np.unique(weld[triangles])]
+    extent = float((used.max(axis=0) - used.min(axis=0)).max()) or 1
+    welded_positions = (welded_positions - used.min(axis=0)) / extent
+
+    welded = weld[triangles]
+    quadrics, weights = _get_quadrics(welded_positions, welded)
+    locked = _get_locked(welded, len(welded_positions))
+    max_cost = np.inf if max_error is None else max_error ** 2
+    error = 0
+
+    weld_list = weld.tolist()
+    seam_list = seams.tolist()
+    point_list = welded_positions.tolist()
+
+    while len(triangles) > target:
+        u, v, costs = _get_candidates(
+            welded_positions, welded, quadrics, weights, locked)
+        mask = costs <= max_cost
+        u, v, costs = u[mask].tolist(), v[mask].tolist(), costs[mask].tolist()
+        if not u:
+            break
+
+        # triangles of every welded vertex
+        corners = welded.reshape(-1)
+        order = (np.argsort(corners, kind='stable') // 3).tolist()
+        offsets = np.concatenate([
+            [0], np.cumsum(np.bincount(
+                corners, minlength=len(welded_positions)))])
+        offsets = offsets.tolist()
+        corner_list = triangles.tolist()
+        welded_list = welded.tolist()
+
+        # independent collapses of the cheapest quarter of edges
+        limit = costs[len(costs) // 4]
+        remap = np.arange(len(positions))
+        touched = bytearray(len(welded_positions))
+        removed = 0
+        for i, j, cost in zip(u, v, costs):
+            if cost > limit and removed:
+                break
+            if touched[i] or touched[j]:
+                continue
+
+            vertex_triangles = order[offsets[i]:offsets[i + 1]]
+            welded_triangles = [welded_list[t] for t in vertex_triangles]
+            if _is_flipped(point_list, welded_triangles, i, j):
+                continue
+
+            targets = _get_targets(
+                [corner_list[t] for t in vertex_triangles],
+                weld_list, seam_list, i, j)
+            if targets is None:
+                continue
+
+            for k, target_id in targets.items():
+                remap[k] = target_id
+            quadrics[j] += quadrics[i]
+            weights[j] += weights[i]
+            for triangle in welded_triangles:
+                for k in triangle:
+                    touched[k] = 1
+                removed += j in triangle
+            error = max(error, cost)
+
+            if len(triangles) - removed <= target:
+                break
+
+        if not removed:
+            break
+
+        triangles = remap[triangles]
+        welded = weld[triangles]
+        mask = (
+            (welded[:, 0] != welded[:, 1]) &
+            (welded[:, 1] != welded[:, 2]) &
+            (welded[:, 2] != welded[:, 0]))
+        triangles, welded = triangles[mask], welded[mask]
+
+    return triangles.reshape(-1), float(np.sqrt(error))
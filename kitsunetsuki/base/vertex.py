@@ -41,3 +41,7 @@ def normal_equals(n1, n2):
         return False
 
     return True
+
+
+def weld_key(values, tolerance=0.001):
+    return tuple(round(x / tolerance) for x in values)
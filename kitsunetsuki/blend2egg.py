@@ -16,6 +16,8 @@
 
 import argparse
 
+from kitsunetsuki.base.args import parse_lods
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -49,6 +51,23 @@ def parse_args():
     parser.add_argument(
         '-sc', '--scale', type=float, required=False,
         help='Geom scale.')
+    parser.add_argument(
+        '-ev', '--evaluated', action='store_true',
+        help='Export evaluated meshes '
+             'without applying modifiers to the scene.')
+    parser.add_argument(
+        '-lt', '--loop-triangles', action='store_true',
+        help='Read mesh loop triangles instead of triangulating the meshes.')
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help='Reuse exported geometry from the on-disk cache.')
+    parser.add_argument(
+        '-cd', '--cache-dir', type=str, required=False,
+        help='Geometry cache directory, implies --cache '
+             '(~/.cache/kitsunetsuki by default).')
+    parser.add_argument(
+        '-cs', '--cache-size', type=int, required=False,
+        help='Max geometry cache size in megabytes (1024 by default).')
     parser.add_argument(
         '-m', '--merge', action='store_true',
         help='Merge objects and meshes inside the collection.')
@@ -70,6 +89,23 @@ def parse_args():
     parser.add_argument(
         '-sorg', '--set-origin', action='store_true',
         help="Set origin to center of bounds for collisions.")
+    parser.add_argument(
+        '-wt', '--weld-tolerance', type=float, required=False,
+        help="Max UV and normal difference of the welded vertices.")
+    parser.add_argument(
+        '-opt', '--optimize', action='store_true',
+        help="Reorder triangles and vertices for the GPU vertex cache "
+             "and the overdraw.")
+    parser.add_argument(
+        '-lod', '--lods', type=parse_lods, required=False,
+        help="Generate simplified LODs with the ratios of triangles, "
+             "e.g. 0.5,0.25. Ratios are also used as the screen coverage.")
+    parser.add_argument(
+        '-le', '--lod-error', type=float, required=False,
+        help="Max LOD simplification error relative to the mesh size.")
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', required=False,
+        help="Print export reports to stderr.")
 
     return parser.parse_args()
 
@@ -20,6 +20,28 @@ import struct
 
 from . import bl_info
 
+from kitsunetsuki.base.args import parse_lods
+
+
+def parse_quantize(value):
+    """
+    Parses bits per attribute, e.g. "position=16,normal=8".
+    """
+    results = {}
+    for item in filter(None, value.split(',')):
+        name, _, bits = item.partition('=')
+        name = name.strip().lower()
+        if name not in (
+                'position', 'normal', 'tangent', 'texcoord', 'weights'):
+            raise argparse.ArgumentTypeError(
+                'unknown attribute: {}'.format(name))
+        if bits.strip() not in ('8', '16'):
+            raise argparse.ArgumentTypeError(
+                'bits should be 8 or 16: {}'.format(item))
+        results[name] = int(bits)
+
+    return results
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -53,6 +75,23 @@ def parse_args():
     parser.add_argument(
         '-sc', '--scale', type=float, required=False,
         help='Geom scale.')
+    parser.add_argument(
+        '-ev', '--evaluated', action='store_true',
+        help='Export evaluated meshes '
+             'without applying modifiers to the scene.')
+    parser.add_argument(
+        '-lt', '--loop-triangles', action='store_true',
+        help='Read mesh loop triangles instead of triangulating the meshes.')
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help='Reuse exported geometry from the on-disk cache.')
+    parser.add_argument(
+        '-cd', '--cache-dir', type=str, required=False,
+        help='Geometry cache directory, implies --cache '
+             '(~/.cache/kitsunetsuki by default).')
+    parser.add_argument(
+        '-cs', '--cache-size', type=int, required=False,
+        help='Max geometry cache size in megabytes (1024 by default).')
     parser.add_argument(
         '-m', '--merge', action='store_true',
         help='Merge objects and meshes inside the collection.')
@@ -80,12 +119,80 @@ def parse_args():
     parser.add_argument(
         '-sorg', '--set-origin', action='store_true',
         help="Set origin to center of bounds for collisions.")
+    parser.add_argument(
+        '-wt', '--weld-tolerance', type=float, required=False,
+        help="Max UV and normal difference of the welded vertices.")
+    parser.add_argument(
+        '-opt', '--optimize', action='store_true',
+        help="Reorder triangles and vertices for the GPU vertex cache "
+             "and the overdraw.")
+    parser.add_argument(
+        '-lod', '--lods', type=parse_lods, required=False,
+        help="Generate simplified LODs with the ratios of triangles, "
+             "e.g. 0.5,0.25. Ratios are also used as the screen coverage.")
+    parser.add_argument(
+        '-le', '--lod-error', type=float, required=False,
+        help="Max LOD simplification error relative to the mesh size.")
     parser.add_argument(
         '-prim', '--split-primitives', action='store_true',
         help="Split primitives into separate vertex buffers.")
     parser.add_argument(
         '-nw', '--normalize-weights', action='store_true',
         help="Normalize vertex weights.")
+    parser.add_argument(
+        '-inf', '--influences', type=int, choices=(1, 2, 4, 8),
+        help="Max joint influences per vertex (default: 4).")
+    parser.add_argument(
+        '-we', '--weight-error', type=float,
+        help="Prune the weakest joint influences "
+             "while their summary weight stays within the error.")
+    parser.add_argument(
+        '-st', '--sparse-targets', type=float, nargs='?', const=0.5,
+        help="Use sparse accessors for shape keys with a fraction of "
+             "moved vertices below the threshold (0.5 by default).")
+    parser.add_argument(
+        '-gi', '--gpu-instancing', type=int, nargs='?', const=16,
+        help="Collapse sibling nodes of the same mesh into a single node "
+             "with EXT_mesh_gpu_instancing, when there are at least "
+             "the number of them (16 by default).")
+    parser.add_argument(
+        '-lg', '--legacy-geom', action='store_true',
+        help="Read mesh data loop by loop instead of the bulk array reads.")
+    parser.add_argument(
+        '-mb', '--memory-budget', type=int, required=False,
+        help="Move buffer data into a temporary file "
+             "when it exceeds the budget in megabytes.")
+    parser.add_argument(
+        '-al', '--alignment', type=int, required=False,
+        choices=(4, 8, 16, 32, 64),
+        help="Align buffer views (and GLB binary chunk) to the number "
+             "of bytes, e.g. 16. Always aligned to the component size.")
+    parser.add_argument(
+        '-q', '--quantize', type=parse_quantize, nargs='?', const={},
+        help="Quantize vertex attributes with KHR_mesh_quantization, "
+             "optionally with bits per attribute, "
+             "e.g. position=16,normal=8,tangent=8,texcoord=16,weights=8.")
+    parser.add_argument(
+        '-mo', '--meshopt', type=str, nargs='?', const='required',
+        choices=('required', 'optional'),
+        help="Compress buffer views with EXT_meshopt_compression: "
+             "required (default) or optional, which keeps uncompressed data "
+             "for the loaders without the extension support.")
+    parser.add_argument(
+        '-sb', '--split-buffers', type=str, required=False,
+        choices=('mesh', 'collection', 'action'),
+        help="Write buffer data into separate .bin files per mesh or "
+             "per collection, animations are written per action.")
+    parser.add_argument(
+        '-il', '--interleave', action='store_true',
+        help="Interleave vertex attributes into a single buffer view.")
+    parser.add_argument(
+        '-si', '--short-indices', action='store_true',
+        help="Split primitives to fit 16-bit indices "
+             "(implies --split-primitives).")
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', required=False,
+        help="Print export reports to stderr.")
 
     return parser.parse_args()
 
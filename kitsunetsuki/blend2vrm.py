@@ -53,6 +53,23 @@ def parse_args():
     parser.add_argument(
         '-sc', '--scale', type=float, required=False,
         help='Geom scale.')
+    parser.add_argument(
+        '-ev', '--evaluated', action='store_true',
+        help='Export evaluated meshes '
+             'without applying modifiers to the scene.')
+    parser.add_argument(
+        '-lt', '--loop-triangles', action='store_true',
+        help='Read mesh loop triangles instead of triangulating the meshes.')
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help='Reuse exported geometry from the on-disk cache.')
+    parser.add_argument(
+        '-cd', '--cache-dir', type=str, required=False,
+        help='Geometry cache directory, implies --cache '
+             '(~/.cache/kitsunetsuki by default).')
+    parser.add_argument(
+        '-cs', '--cache-size', type=int, required=False,
+        help='Max geometry cache size in megabytes (1024 by default).')
     parser.add_argument(
         '-m', '--merge', action='store_true',
         help='Merge objects and meshes inside the collection.')
@@ -74,9 +91,35 @@ def parse_args():
     parser.add_argument(
         '-sorg', '--set-origin', action='store_true',
         help="Set origin to center of bounds for collisions.")
+    parser.add_argument(
+        '-wt', '--weld-tolerance', type=float, required=False,
+        help="Max UV and normal difference of the welded vertices.")
+    parser.add_argument(
+        '-opt', '--optimize', action='store_true',
+        help="Reorder triangles and vertices for the GPU vertex cache "
+             "and the overdraw.")
     parser.add_argument(
         '-nw', '--normalize-weights', action='store_true',
         help="Normalize vertex weights.")
+    parser.add_argument(
+        '-st', '--sparse-targets', type=float, nargs='?', const=0.5,
+        help="Use sparse accessors for shape keys with a fraction of "
+             "moved vertices below the threshold (0.5 by default).")
+    parser.add_argument(
+        '-lg', '--legacy-geom', action='store_true',
+        help="Read mesh data loop by loop instead of the bulk array reads.")
+    parser.add_argument(
+        '-mb', '--memory-budget', type=int, required=False,
+        help="Move buffer data into a temporary file "
+             "when it exceeds the budget in megabytes.")
+    parser.add_argument(
+        '-al', '--alignment', type=int, required=False,
+        choices=(4, 8, 16, 32, 64),
+        help="Align buffer views (and GLB binary chunk) to the number "
+             "of bytes, e.g. 16. Always aligned to the component size.")
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', required=False,
+        help="Print export reports to stderr.")
 
     return parser.parse_args()
 
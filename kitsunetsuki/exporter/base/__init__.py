@@ -15,7 +15,9 @@
 
 import bpy
 import os
+import sys
 
+from kitsunetsuki.base.cache import CACHE_SIZE, GeomCache, get_cache_dir
 from kitsunetsuki.base.collections import get_object_collection
 from kitsunetsuki.base.objects import (
     get_object_properties, is_collision, is_object_visible,
@@ -57,12 +59,29 @@ class Exporter(GeomMixin, MaterialMixin, TextureMixin, VertexMixin):
         # render type
         self._render_type = args.render or 'default'
 
+        # print export reports
+        self._verbose = getattr(args, 'verbose', False)
+
         # animations
         self._speed_scale = args.speed or 1
 
         # geom scale
         self._geom_scale = args.scale or 1
 
+        # read meshes from the evaluated depsgraph instead of applying modifiers
+        self._evaluated = getattr(args, 'evaluated', False)
+
+        # read triangles from the mesh loop triangles instead of triangulating
+        self._loop_triangles = getattr(args, 'loop_triangles', False)
+
+        # on-disk geometry cache, disabled unless requested
+        self._cache = None
+        cache_dir = getattr(args, 'cache_dir', None)
+        if getattr(args, 'cache', False) or cache_dir:
+            self._cache = GeomCache(
+                cache_dir or get_cache_dir(),
+                (getattr(args, 'cache_size', None) or CACHE_SIZE) * 1024 * 1024)
+
         # scripting
         self._script_names = (args.exec or '').split(',')
         self._script_locals = {}
@@ -71,6 +90,16 @@ class Exporter(GeomMixin, MaterialMixin, TextureMixin, VertexMixin):
         self._merge = args.merge
         self._keep = args.keep
 
+        # max UV and normal difference of the welded vertices
+        self._weld_tolerance = getattr(args, 'weld_tolerance', None) or 0.001
+
+        # vertex cache optimization
+        self._optimize = getattr(args, 'optimize', False)
+
+        # simplified levels of detail
+        self._lods = getattr(args, 'lods', None) or []
+        self._lod_error = getattr(args, 'lod_error', None)
+
         # materials, textures, UVs
         self._no_materials = args.no_materials is True
         self._no_extra_uv = args.no_extra_uv is True
@@ -78,6 +107,13 @@ class Exporter(GeomMixin, MaterialMixin, TextureMixin, VertexMixin):
         self._empty_textures = args.empty_textures
         self._set_origin = args.set_origin is True
 
+    def report(self, message):
+        """
+        Prints the export report message in the verbose mode.
+        """
+        if self._verbose:
+            print(message, file=sys.stderr)
+
     def get_cwd(self):
         if self._inputs:
             return os.path.dirname(self._inputs[0])
@@ -14,9 +14,9 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import bpy
-import mathutils  # make sure to "import bpy" before
 
-from kitsunetsuki.base.vertex import uv_equals, normal_equals
+from kitsunetsuki.base.mesh import get_array
+from kitsunetsuki.base.vertex import weld_key
 
 
 class VertexMixin(object):
@@ -30,32 +30,40 @@ class VertexMixin(object):
 
         return results
 
-    def get_tangent_bitangent(self, mesh):
+    def get_tangent_bitangent(self, mesh, uv_names=None):
+        """
+        Returns (tangents, bitangents, bitangent signs) arrays
+        of every loop by UV layer name.
+        Only the listed UV layers are calculated, all by default.
+        """
         results = {}
 
-        for uv_name, uv_layer in mesh.uv_layers.items():
+        if uv_names is None:
+            uv_names = mesh.uv_layers.keys()
+
+        for uv_name in uv_names:
             mesh.calc_tangents(uvmap=uv_name)
-            results[uv_name] = []
-            for i, loop in mesh.loops.items():
-                results[uv_name].append((
-                    mathutils.Vector(loop.tangent),
-                    mathutils.Vector(loop.bitangent),
-                    loop.bitangent_sign,
-                ))
+            results[uv_name] = (
+                get_array(mesh.loops, 'tangent', size=3),
+                get_array(mesh.loops, 'bitangent', size=3),
+                get_array(mesh.loops, 'bitangent_sign'),
+            )
             mesh.free_tangents()
 
         return results
 
-    def can_share_vertex(self, mesh, vertex, loop_id, uv, normal):
-        if not mesh.uv_layers:
-            return True
-
-        if not mesh.uv_layers.active:
-            return True
+    def get_weld_key(self, mesh, vertex_id, loop_id, normal=None):
+        """
+        Returns the key of the polygon corner, corners with the same key
+        are welded into the same vertex.
+        The loop normal is used unless the exported normal is given.
+        """
+        if normal is None:
+            normal = mesh.loops[loop_id].normal
 
-        uv_loop = mesh.uv_layers.active.data[loop_id]
-        # if uv_equals(uv_loop.uv.to_2d(), uv) and normal_equals(vertex.normal, normal):
-        if uv_equals(uv_loop.uv.to_2d(), uv) and normal_equals(mesh.loops[loop_id].normal, normal):
-            return True
+        key = (vertex_id,) + weld_key(normal, self._weld_tolerance)
+        if mesh.uv_layers.active:
+            key += weld_key(
+                mesh.uv_layers.active.data[loop_id].uv, self._weld_tolerance)
 
-        return False
+        return key
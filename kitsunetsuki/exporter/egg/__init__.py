@@ -30,8 +30,12 @@ from kitsunetsuki.base.objects import (
 from kitsunetsuki.exporter.base import Exporter
 
 from .animation import AnimationMixin
+from .cache import CacheMixin
 from .geom import GeomMixin
+from .lod import LODMixin
 from .material import MaterialMixin
+from .optimize import OptimizeMixin
+from .registry import EggRegistry
 from .texture import TextureMixin
 from .vertex import VertexMixin
 
@@ -41,8 +45,8 @@ def matrix_to_panda(matrix):
 
 
 class EggExporter(
-        AnimationMixin, GeomMixin, MaterialMixin, TextureMixin,
-        VertexMixin, Exporter):
+        AnimationMixin, CacheMixin, GeomMixin, LODMixin, MaterialMixin,
+        OptimizeMixin, TextureMixin, VertexMixin, Exporter):
     """
     BLEND to EGG converter.
     """
@@ -50,6 +54,14 @@ class EggExporter(
         super().__init__(args)
         self._output = args.output or args.inputs[0].replace('.blend', '.egg')
 
+    def convert(self):
+        root = super().convert()
+        if self._optimize:
+            self.optimize()
+        if self._lods:
+            self.make_lods()
+        return root
+
     def make_root_node(self):
         egg_root = EggData()
         egg_root.set_coordinate_system(CS_zup_right)  # Z-up
@@ -59,6 +71,8 @@ class EggExporter(
             'https://github.com/kitsune-ONE-team/KITSUNETSUKI-Asset-Tools')
         egg_root.add_child(egg_comment)
 
+        self._registry = EggRegistry()
+
         return egg_root
 
     def _setup_node(self, node, obj=None, can_merge=False):
@@ -167,6 +181,7 @@ class EggExporter(
 
         self._setup_node(egg_group, armature)
         parent_node.add_child(egg_group)
+        self._registry.add('armatures', armature.name, egg_group)
 
         return egg_group
 
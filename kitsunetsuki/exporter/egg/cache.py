@@ -0,0 +1,187 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from panda3d.egg import EggPolygon, EggVertex, EggVertexPool, EggVertexUV
+
+from kitsunetsuki.base.matrices import get_object_matrix, matrix_to_list
+from kitsunetsuki.base.mesh import get_mesh_data
+from kitsunetsuki.base.objects import is_collision
+
+
+class CacheMixin(object):
+    def _get_cached_uv_names(self, obj, mesh):
+        if is_collision(obj):
+            return []
+
+        return [
+            self._get_uv_name(uv_layer) for uv_layer in mesh.uv_layers.values()
+            if uv_layer.active or not self._no_extra_uv]
+
+    def get_geom_key(self, obj, mesh):
+        """
+        Returns the cache key of the vertex pool and polygons.
+        """
+        # normals and tangents are transformed by the object matrix
+        obj_data = {
+            'collision': is_collision(obj),
+            'matrix': matrix_to_list(get_object_matrix(obj)),
+        }
+
+        # everything the geometry and vertex writers read
+        flags = {
+            'exporter': type(self).__name__,
+            'evaluated': self._evaluated,
+            'geom_scale': self._geom_scale,
+            'loop_triangles': self._loop_triangles,
+            'weld_tolerance': self._weld_tolerance,
+            'no_extra_uv': self._no_extra_uv,
+            'no_materials': self._no_materials,
+            'no_textures': self._no_textures,
+        }
+
+        return self._cache.get_key(
+            'egg', flags, obj_data,
+            *get_mesh_data(mesh, loop_triangles=self._loop_triangles))
+
+    def load_geom(self, key, node, obj, mesh):
+        """
+        Adds the cached vertex pool and polygons to the node.
+        Returns False if there is no cached geometry.
+        """
+        entry = self._cache.load(key)
+        if entry is None:
+            return False
+
+        header, arrays = entry
+        egg_vertex_pool = EggVertexPool(node.get_name())
+        node.add_child(egg_vertex_pool)
+
+        uv_names = self._get_cached_uv_names(obj, mesh)
+        uvs = [arrays['uv{}'.format(i)].tolist() for i in range(len(uv_names))]
+        tangents = [
+            arrays['tangent{}'.format(i)].tolist() if has_tangents else None
+            for i, has_tangents in enumerate(header['tangents'])]
+        binormals = [
+            arrays['binormal{}'.format(i)].tolist() if has_tangents else None
+            for i, has_tangents in enumerate(header['tangents'])]
+
+        for i, (vertex_id, pos, normal) in enumerate(zip(
+                arrays['indices'].tolist(), arrays['positions'].tolist(),
+                arrays['normals'].tolist())):
+            egg_vertex = EggVertex()
+            egg_vertex.set_color((1, 1, 1, 1))
+            egg_vertex.set_pos(tuple(pos))
+            egg_vertex.set_normal(tuple(normal))
+            for j, uv_name in enumerate(uv_names):
+                egg_vertex_uv = EggVertexUV(uv_name, tuple(uvs[j][i]))
+                if tangents[j] is not None:
+                    egg_vertex_uv.set_tangent(tuple(tangents[j][i]))
+                    egg_vertex_uv.set_binormal(tuple(binormals[j][i]))
+                egg_vertex.set_uv_obj(egg_vertex_uv)
+            egg_vertex_pool.add_vertex(egg_vertex, vertex_id)
+        if len(arrays['indices']):
+            egg_vertex_pool.set_highest_index(int(arrays['indices'].max()))
+
+        vertex_ids = np.split(
+            arrays['polygon_vertices'],
+            np.cumsum(arrays['polygon_sizes'])[:-1])
+        for kind, polygon_vertex_ids in zip(
+                arrays['polygon_kinds'].tolist(), vertex_ids):
+            name, mname, tnames = header['kinds'][kind]
+            egg_polygon = EggPolygon(node.get_name() if name is None else name)
+            if mname is not None:
+                egg_polygon.set_material(self._registry.get('materials', mname))
+            for tname in tnames:
+                egg_polygon.add_texture(self._registry.get('textures', tname))
+            for vertex_id in polygon_vertex_ids.tolist():
+                egg_polygon.add_vertex(egg_vertex_pool.get_vertex(vertex_id))
+            node.add_child(egg_polygon)
+
+        return True
+
+    def save_geom(self, key, node, obj, mesh, egg_vertex_pool):
+        """
+        Writes the vertex pool and polygons of the node into the cache.
+        """
+        uv_names = self._get_cached_uv_names(obj, mesh)
+        egg_vertices = list(egg_vertex_pool)
+
+        arrays = {
+            'indices': np.array(
+                [egg_vertex.get_index() for egg_vertex in egg_vertices],
+                dtype=np.int64),
+            'positions': np.array(
+                [tuple(egg_vertex.get_pos3()) for egg_vertex in egg_vertices],
+                dtype=np.float64).reshape(-1, 3),
+            'normals': np.array(
+                [tuple(egg_vertex.get_normal()) for egg_vertex in egg_vertices],
+                dtype=np.float64).reshape(-1, 3),
+        }
+
+        has_tangents = []
+        for i, uv_name in enumerate(uv_names):
+            egg_vertex_uvs = [
+                egg_vertex.get_uv_obj(uv_name) for egg_vertex in egg_vertices]
+            arrays['uv{}'.format(i)] = np.array([
+                tuple(egg_vertex_uv.get_uv()) for egg_vertex_uv in egg_vertex_uvs
+            ], dtype=np.float64).reshape(-1, 2)
+
+            has_tangents.append(bool(egg_vertex_uvs) and all(
+                egg_vertex_uv.has_tangent() for egg_vertex_uv in egg_vertex_uvs))
+            if has_tangents[-1]:
+                arrays['tangent{}'.format(i)] = np.array([
+                    tuple(egg_vertex_uv.get_tangent())
+                    for egg_vertex_uv in egg_vertex_uvs], dtype=np.float64)
+                arrays['binormal{}'.format(i)] = np.array([
+                    tuple(egg_vertex_uv.get_binormal())
+                    for egg_vertex_uv in egg_vertex_uvs], dtype=np.float64)
+
+        # polygons by name, material and textures
+        kinds = {}
+        polygon_kinds = []
+        polygon_sizes = []
+        polygon_vertices = []
+        for child in node.get_children():
+            if not isinstance(child, EggPolygon):
+                continue
+
+            # polygons without material are named after the node
+            name = child.get_name()
+            if name == node.get_name():
+                name = None
+
+            kind = (
+                name,
+                child.get_material().get_name() if child.has_material() else None,
+                tuple(
+                    child.get_texture(i).get_name()
+                    for i in range(child.get_num_textures())),
+            )
+            polygon_kinds.append(kinds.setdefault(kind, len(kinds)))
+            polygon_sizes.append(child.get_num_vertices())
+            polygon_vertices.extend(
+                child.get_vertex(i).get_index()
+                for i in range(child.get_num_vertices()))
+
+        arrays['polygon_kinds'] = np.array(polygon_kinds, dtype=np.int64)
+        arrays['polygon_sizes'] = np.array(polygon_sizes, dtype=np.int64)
+        arrays['polygon_vertices'] = np.array(polygon_vertices, dtype=np.int64)
+
+        self._cache.save(key, {
+            'kinds': list(kinds),
+            'tangents': has_tangents,
+        }, arrays)
@@ -13,12 +13,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from panda3d.egg import (
-    EggGroup, EggPolygon, EggVertexPool, EggMaterial, EggTexture)
+import bpy
+import numpy as np
+
+from panda3d.egg import EggGroup, EggPolygon, EggVertexPool
 
 from kitsunetsuki.base.matrices import get_object_matrix
 from kitsunetsuki.base.armature import get_armature
-from kitsunetsuki.base.mesh import obj2mesh
+from kitsunetsuki.base.mesh import eval2mesh, get_triangles, obj2mesh
 from kitsunetsuki.base.objects import apply_modifiers, is_collision
 
 
@@ -36,14 +38,21 @@ class GeomMixin(object):
 
     def make_geom(self, node, obj, can_merge=False):
         triangulate = not is_collision(obj)
-        if self._geom_scale != 1:
-            obj.scale.x = self._geom_scale
-            obj.scale.y = self._geom_scale
-            obj.scale.z = self._geom_scale
-            apply_modifiers(obj, triangulate=triangulate, apply_scale=True)
+        loop_triangles = self._loop_triangles and triangulate
+        if self._evaluated:
+            mesh = eval2mesh(
+                obj, triangulate=triangulate, scale=self._geom_scale,
+                loop_triangles=loop_triangles)
         else:
-            apply_modifiers(obj, triangulate=triangulate)
-        mesh = obj2mesh(obj, triangulate=triangulate)
+            if self._geom_scale != 1:
+                obj.scale.x = self._geom_scale
+                obj.scale.y = self._geom_scale
+                obj.scale.z = self._geom_scale
+                apply_modifiers(obj, triangulate=triangulate, apply_scale=True)
+            else:
+                apply_modifiers(obj, triangulate=triangulate)
+            mesh = obj2mesh(
+                obj, triangulate=triangulate, loop_triangles=loop_triangles)
 
         # get or create materials and textures
         egg_materials = {}
@@ -52,15 +61,12 @@ class GeomMixin(object):
         if not self._no_materials and not is_collision(obj):
             for material in mesh.materials.values():
                 # material
-                for child in self._root.get_children():  # existing material
-                    if (isinstance(child, EggMaterial) and
-                            child.get_name() == material.name):
-                        egg_materials[material.name] = child
-                        break
-                else:  # new material
+                egg_material = self._registry.get('materials', material.name)
+                if egg_material is None:  # new material
                     egg_material = self.make_material(material)
                     self._root.add_child(egg_material)
-                    egg_materials[material.name] = egg_material
+                    self._registry.add('materials', material.name, egg_material)
+                egg_materials[material.name] = egg_material
 
                 # material -> textures
                 if material.name not in egg_material_textures:
@@ -70,16 +76,21 @@ class GeomMixin(object):
                 if not self._no_textures:
                     for type_, _, egg_texture in self.make_textures(material):
                         tname = egg_texture.get_name()
-                        for child in self._root.get_children():  # existing texture
-                            if (isinstance(child, EggTexture) and
-                                    child.get_name() == tname):
-                                egg_textures[tname] = child
-                                egg_material_textures[material.name][tname] = child
-                                break
-                        else:  # new texture
+                        if self._registry.get('textures', tname) is None:  # new texture
                             self._root.add_child(egg_texture)
-                            egg_textures[tname] = egg_texture
-                            egg_material_textures[material.name][tname] = egg_texture
+                            self._registry.add('textures', tname, egg_texture)
+                        egg_texture = self._registry.get('textures', tname)
+                        egg_textures[tname] = egg_texture
+                        egg_material_textures[material.name][tname] = egg_texture
+
+        # merged and skinned geometry is not cached
+        cache_key = None
+        if self._cache is not None and not can_merge and not get_armature(obj):
+            cache_key = self.get_geom_key(obj, mesh)
+            if self.load_geom(cache_key, node, obj, mesh):
+                if self._evaluated:
+                    bpy.data.meshes.remove(mesh)
+                return
 
         # get or create vertex pool
         egg_vertex_pool = None
@@ -100,25 +111,40 @@ class GeomMixin(object):
         armature = get_armature(obj)
         egg_joints = {}
         if armature:
-            for child in self._root.get_children():
-                if (isinstance(child, EggGroup) and
-                        child.get_dart_type() == EggGroup.DT_structured and
-                        child.get_name() == armature.name):
-                    egg_joints = self._get_joints(child)
-
-        sharp_vertices = {}
-        uv_tb = {}
-        if not is_collision(obj):
-            sharp_vertices = self.get_sharp_vertices(mesh)
-            uv_tb = self.get_tangent_bitangent(mesh)
-        egg_vertices = {}
+            egg_armature = self._registry.get('armatures', armature.name)
+            if egg_armature is not None:
+                egg_joints = self._registry.get('joints', armature.name)
+                if egg_joints is None:
+                    egg_joints = self._registry.add(
+                        'joints', armature.name, self._get_joints(egg_armature))
 
         obj_matrix = get_object_matrix(obj, armature)
         parent_obj_matrix = obj_matrix
         if armature:
             parent_obj_matrix = get_object_matrix(armature)
 
-        for polygon in mesh.polygons:
+        sharp_vertices = {}
+        uv_tb = {}  # uv name -> (tangents, binormals)
+        if not is_collision(obj):
+            sharp_vertices = self.get_sharp_vertices(mesh)
+
+            # tangents of the exported uv layers only
+            uv_names = [
+                uv_name for uv_name, uv_layer in mesh.uv_layers.items()
+                if uv_layer.active or not self._no_extra_uv]
+            matrix = np.array(parent_obj_matrix, dtype=np.float64)
+            for uv_name, (tangents, bitangents, _) in self.get_tangent_bitangent(
+                    mesh, uv_names).items():
+                uv_tb[uv_name] = tuple(
+                    (vectors @ matrix[:3, :3].T + matrix[:3, 3]).tolist()
+                    for vectors in (tangents, bitangents))
+        egg_vertices = {}  # weld key -> vertex
+
+        polygons = mesh.polygons
+        if loop_triangles:
+            polygons = get_triangles(mesh)
+
+        for polygon in polygons:
             # <-- polygon
             material = None
             mname = None
@@ -157,26 +183,13 @@ class GeomMixin(object):
                     not is_collision(obj))
 
                 # try to reuse shared vertices
+                loop_id = polygon.loop_indices[i]
+                key = self.get_weld_key(mesh, vertex_id, loop_id)
                 if (polygon.use_smooth and
-                        vertex_id in egg_vertices and
+                        key in egg_vertices and
                         not is_collision(obj)):
-                    shared = False
-                    for egg_vertex in egg_vertices[vertex_id]:
-                        loop_id = polygon.loop_indices[i]
-                        egg_vertex_uv = egg_vertex.get_uv_obj(
-                            self._get_uv_name(mesh.uv_layers.active))
-
-                        if not egg_vertex_uv:
-                            egg_polygon.add_vertex(egg_vertex)
-                            shared = True
-                            break
-
-                        if self.can_share_vertex(mesh, vertex, loop_id, egg_vertex_uv.get_uv(), egg_vertex.get_normal()):
-                            egg_polygon.add_vertex(egg_vertex)
-                            shared = True
-                            break
-                    if shared:
-                        continue
+                    egg_polygon.add_vertex(egg_vertices[key])
+                    continue
 
                 # make new vertex data
                 can_merge_vertices = can_merge
@@ -192,7 +205,6 @@ class GeomMixin(object):
                 if not is_collision(obj):
                     for uv_name, uv_layer in mesh.uv_layers.items():
                         # <-- vertex uv
-                        loop_id = polygon.loop_indices[i]
                         uv_loop = uv_layer.data[loop_id]
 
                         # not active layer and extra UV disabled
@@ -201,11 +213,9 @@ class GeomMixin(object):
 
                         egg_vertex_uv = self.make_vertex_uv(uv_layer, uv_loop.uv)
                         if uv_name in uv_tb:
-                            t, b, s = uv_tb[uv_name][loop_id]
-                            tangent = parent_obj_matrix @ t
-                            binormal = parent_obj_matrix @ b
-                            egg_vertex_uv.set_tangent(tuple(tangent))
-                            egg_vertex_uv.set_binormal(tuple(binormal))
+                            tangents, binormals = uv_tb[uv_name]
+                            egg_vertex_uv.set_tangent(tuple(tangents[loop_id]))
+                            egg_vertex_uv.set_binormal(tuple(binormals[loop_id]))
                         egg_vertex.set_uv_obj(egg_vertex_uv)
                         # vertex uv -->
 
@@ -216,9 +226,8 @@ class GeomMixin(object):
                 egg_polygon.add_vertex(egg_vertex)
 
                 # save vertex data for sharing
-                if vertex_id not in egg_vertices:
-                    egg_vertices[vertex_id] = []
-                egg_vertices[vertex_id].append(egg_vertex)
+                if key not in egg_vertices:
+                    egg_vertices[key] = egg_vertex
 
                 # attach joints to vertex
                 if armature:
@@ -233,3 +242,10 @@ class GeomMixin(object):
 
             node.add_child(egg_polygon)
             # polygon -->
+
+        if cache_key:
+            self.save_geom(cache_key, node, obj, mesh, egg_vertex_pool)
+
+        # evaluated meshes are the copies
+        if self._evaluated:
+            bpy.data.meshes.remove(mesh)
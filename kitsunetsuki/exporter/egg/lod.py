@@ -0,0 +1,142 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from panda3d.core import LPoint3d
+from panda3d.egg import EggGroup, EggPolygon, EggSwitchConditionDistance
+
+from kitsunetsuki.base.optimize import (
+    get_overdraw_order, get_triangle_order)
+from kitsunetsuki.base.simplify import MIN_REDUCTION, simplify
+
+
+# switch out distance of the last level
+MAX_DISTANCE = 100000
+
+
+class LODMixin(object):
+    def _make_lod_polygons(self, egg_polygons, ratio):
+        """
+        Returns simplified polygons, sharing the vertices
+        with the source polygons.
+        """
+        egg_vertices = {}
+        indices = []
+        for egg_polygon in egg_polygons:
+            for i in range(3):
+                egg_vertex = egg_polygon.get_vertex(i)
+                egg_vertices[egg_vertex.get_index()] = egg_vertex
+                indices.append(egg_vertex.get_index())
+
+        # seams of the default UV are kept
+        positions = np.zeros((max(egg_vertices) + 1, 3))
+        uvs = np.zeros((len(positions), 2))
+        for vertex_id, egg_vertex in egg_vertices.items():
+            positions[vertex_id] = tuple(egg_vertex.get_pos3())
+            if egg_vertex.has_uv():
+                uvs[vertex_id] = tuple(egg_vertex.get_uv())
+
+        indices, _ = simplify(
+            positions, indices, ratio, max_error=self._lod_error,
+            attributes=uvs)
+        triangles = indices.reshape(-1, 3)
+        if self._optimize:
+            triangles = triangles[
+                get_triangle_order(triangles, len(positions))]
+            triangles = triangles[get_overdraw_order(triangles, positions)]
+
+        results = []
+        for triangle in triangles.tolist():
+            egg_polygon = EggPolygon(egg_polygons[0])  # same attributes
+            egg_polygon.clear()
+            for vertex_id in triangle:
+                egg_polygon.add_vertex(egg_vertices[vertex_id])
+            results.append(egg_polygon)
+
+        return results
+
+    def _make_lod_groups(self, egg_group):
+        egg_polygons = [
+            child for child in egg_group.get_children()
+            if isinstance(child, EggPolygon)]
+        if not egg_polygons:
+            return
+
+        # keep collision shapes as they are
+        if egg_group.get_cs_type() != EggGroup.CST_none:
+            return
+
+        # triangles of the single vertex pool only
+        egg_vertex_pool = egg_polygons[0].get_pool()
+        for egg_polygon in egg_polygons:
+            if (egg_polygon.get_num_vertices() != 3 or
+                    egg_polygon.get_pool() != egg_vertex_pool):
+                return
+
+        # polygons are simplified by material
+        materials = {}
+        for egg_polygon in egg_polygons:
+            materials.setdefault(
+                egg_polygon.get_name(), []).append(egg_polygon)
+
+        # levels which don't reduce the triangles
+        # of the previous level are skipped
+        levels = []  # (ratio, polygons)
+        count = len(egg_polygons)
+        for ratio in self._lods:
+            lod_polygons = []
+            for material_polygons in materials.values():
+                lod_polygons.extend(self._make_lod_polygons(
+                    material_polygons, ratio))
+            if len(lod_polygons) > count * (1 - MIN_REDUCTION):
+                continue
+            count = len(lod_polygons)
+            levels.append((ratio, lod_polygons))
+
+        if not levels:
+            return
+
+        # LOD ratios are used as the screen coverage of the levels
+        positions = np.array([
+            tuple(egg_polygon.get_vertex(i).get_pos3())
+            for egg_polygon in egg_polygons for i in range(3)])
+        lower, upper = positions.min(axis=0), positions.max(axis=0)
+        center = LPoint3d(*((lower + upper) / 2).tolist())
+        radius = float(np.linalg.norm(upper - lower)) / 2 or 1
+        distances = [0] + [radius / ratio for ratio, _ in levels]
+        distances.append(MAX_DISTANCE)
+
+        levels.insert(0, (1, egg_polygons))
+        for egg_polygon in egg_polygons:
+            egg_group.remove_child(egg_polygon)
+
+        for i, (_, lod_polygons) in enumerate(levels):
+            egg_lod_group = EggGroup(
+                '{}.LOD{}'.format(egg_group.get_name(), i))
+            egg_lod_group.set_lod(EggSwitchConditionDistance(
+                distances[i + 1], distances[i], center))
+            for egg_polygon in lod_polygons:
+                egg_lod_group.add_child(egg_polygon)
+
+            egg_group.add_child(egg_lod_group)
+
+    def make_lods(self):
+        """
+        Generates simplified polygons for every geom group
+        as the distance switched LOD groups.
+        """
+        for egg_group in list(self._get_geom_groups(self._root)):
+            self._make_lod_groups(egg_group)
@@ -0,0 +1,95 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from panda3d.egg import EggGroup, EggPolygon
+
+from kitsunetsuki.base.optimize import (
+    get_acmr, get_atvr, get_overdraw_order, get_triangle_order,
+    optimize_vertex_fetch)
+
+
+class OptimizeMixin(object):
+    def _get_geom_groups(self, egg_node):
+        for child in egg_node.get_children():
+            if isinstance(child, EggGroup):
+                yield child
+                yield from self._get_geom_groups(child)
+
+    def _optimize_group(self, egg_group):
+        """
+        Reorders triangles of the group and renumbers their vertex pool.
+        """
+        egg_polygons = [
+            child for child in egg_group.get_children()
+            if isinstance(child, EggPolygon)]
+        if not egg_polygons:
+            return
+
+        # triangles of the single vertex pool only
+        egg_vertex_pool = egg_polygons[0].get_pool()
+        for egg_polygon in egg_polygons:
+            if (egg_polygon.get_num_vertices() != 3 or
+                    egg_polygon.get_pool() != egg_vertex_pool):
+                return
+
+        egg_vertex_pool.remove_unused_vertices()
+        vertex_count = egg_vertex_pool.get_highest_index() + 1
+        egg_vertices = {}
+        indices = []
+        for egg_polygon in egg_polygons:
+            for i in range(3):
+                egg_vertex = egg_polygon.get_vertex(i)
+                egg_vertices[egg_vertex.get_index()] = egg_vertex
+                indices.append(egg_vertex.get_index())
+        before = np.array(indices)
+
+        positions = np.zeros((vertex_count, 3))
+        for vertex_id, egg_vertex in egg_vertices.items():
+            positions[vertex_id] = tuple(egg_vertex.get_pos3())
+
+        order = get_triangle_order(before, vertex_count)
+        triangles = before.reshape(-1, 3)[order]
+        order = [order[i] for i in get_overdraw_order(triangles, positions)]
+        for egg_polygon in egg_polygons:
+            egg_group.remove_child(egg_polygon)
+        for i in order:
+            egg_group.add_child(egg_polygons[i])
+
+        triangles = before.reshape(-1, 3)[order].reshape(-1)
+        after, vertex_order = optimize_vertex_fetch(triangles, vertex_count)
+        for i, vertex_id in enumerate(vertex_order.tolist()):
+            if vertex_id in egg_vertices:
+                egg_vertices[vertex_id].set_external_index(i)
+        egg_vertex_pool.sort_by_external_index()
+
+        self.report(
+            'OPTIMIZED MESH {name}: ACMR {acmr1:.3f} -> {acmr2:.3f}, '
+            'ATVR {atvr1:.3f} -> {atvr2:.3f}'.format(**{
+                'name': egg_group.get_name(),
+                'acmr1': get_acmr(before),
+                'acmr2': get_acmr(after),
+                'atvr1': get_atvr(before),
+                'atvr2': get_atvr(after),
+            }))
+
+    def optimize(self):
+        """
+        Optimizes polygons for the post-transform vertex cache,
+        the overdraw and the vertex fetch.
+        """
+        for egg_group in list(self._get_geom_groups(self._root)):
+            self._optimize_group(egg_group)
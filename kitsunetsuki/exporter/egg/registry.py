@@ -0,0 +1,35 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+class EggRegistry(object):
+    """
+    Name to node maps of the EGG nodes made by the exporter,
+    the first node with the same name wins.
+    """
+    def __init__(self):
+        self._nodes = {}
+
+    def get(self, collection, name):
+        """
+        Returns the node with the name or None.
+        """
+        return self._nodes.get(collection, {}).get(name)
+
+    def add(self, collection, name, node):
+        """
+        Registers the node and returns the registered one.
+        """
+        return self._nodes.setdefault(collection, {}).setdefault(name, node)
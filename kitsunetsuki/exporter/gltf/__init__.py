@@ -36,13 +36,20 @@ from kitsunetsuki.exporter.base import Exporter
 from . import spec
 from .buffer import GLTFBuffer
 from .animation import AnimationMixin
+from .cache import CacheMixin
 from .geom import GeomMixin
+from .instancing import InstancingMixin
+from .lod import LODMixin
 from .material import MaterialMixin
+from .optimize import OptimizeMixin
+from .quantize import QuantizeMixin
+from .registry import GLTFRegistry
 from .vertex import VertexMixin
 from .texture import TextureMixin
 
 
-class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
+class GLTFExporter(AnimationMixin, CacheMixin, GeomMixin, InstancingMixin,
+                   LODMixin, MaterialMixin, OptimizeMixin, QuantizeMixin,
                    VertexMixin, TextureMixin, Exporter):
     """
     BLEND to GLTF converter.
@@ -54,6 +61,22 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
         self._pose_freeze = getattr(args, 'pose_freeze', False)
         self._split_primitives = getattr(args, 'split_primitives', False)
         self._norm_weights = getattr(args, 'normalize_weights', False)
+        self._max_influences = getattr(args, 'influences', None) or 4
+        self._weight_error = getattr(args, 'weight_error', None) or 0
+        self._interleave = getattr(args, 'interleave', False)
+        self._sparse_threshold = getattr(args, 'sparse_targets', None)
+        self._quantize = getattr(args, 'quantize', None)
+        self._meshopt = getattr(args, 'meshopt', None)
+        self._memory_budget = getattr(args, 'memory_budget', None)
+        self._split_buffers = getattr(args, 'split_buffers', None)
+        self._alignment = getattr(args, 'alignment', None)
+        self._gpu_instancing = getattr(args, 'gpu_instancing', None)
+        self._legacy_geom = getattr(args, 'legacy_geom', False)
+
+        # split primitives to keep indices 16-bit
+        self._short_indices = getattr(args, 'short_indices', False)
+        if self._short_indices:
+            self._split_primitives = True
 
         if self._z_up:
             self._matrix = mathutils.Matrix((
@@ -137,6 +160,9 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
         if self._z_up:
             gltf_node['extensionsUsed'].append('BP_zup')
 
+        self._registry = GLTFRegistry(gltf_node)
+        self._instances = {}  # instance key -> mesh ID
+
         return gltf_node
 
     def _add_child(self, parent_node, child_node):
@@ -352,9 +378,11 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
 
         return gltf_armature
 
-    def _make_node_mesh(self, parent_node, name, obj=None, can_merge=False):
+    def _make_node_mesh(self, parent_node, name, obj=None, can_merge=False,
+                        mesh_id=None):
         """
         Make glTF-node - glTF-mesh pair for chosen Blender object.
+        The node refers to the existing mesh if its ID is given.
         """
         gltf_node = {
             'name': name,
@@ -371,7 +399,9 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
             elif obj.rigid_body.collision_shape == 'MESH':
                 need_mesh = True
 
-        if need_mesh:
+        if need_mesh and mesh_id is not None:
+            gltf_node['mesh'] = mesh_id
+        elif need_mesh:
             gltf_mesh = {
                 'name': name,
                 'primitives': [],
@@ -384,10 +414,9 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
 
         armature = obj and get_armature(obj)
         if armature:
-            for i, gltf_skin in enumerate(self._root['skins']):
-                if gltf_skin['name'] == armature.name:
-                    gltf_node['skin'] = i
-                    break
+            skin_id = self._registry.get('skins', armature.name)
+            if skin_id is not None:
+                gltf_node['skin'] = skin_id
 
         self._setup_node(gltf_node, obj, can_merge=can_merge)
         self._add_child(parent_node, gltf_node)
@@ -401,6 +430,18 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
 
         return gltf_node, gltf_mesh
 
+    def _get_partition(self, gltf_mesh, obj):
+        """
+        Returns the name of the buffer file partition for the mesh data.
+        """
+        if self._split_buffers == 'mesh':
+            return 'mesh.{}'.format(gltf_mesh['name'])
+
+        if self._split_buffers == 'collection':
+            collection = get_object_collection(obj)
+            if collection:
+                return 'collection.{}'.format(collection.name)
+
     def make_mesh(self, parent_node, obj):
         """
         Make mesh-type object.
@@ -412,22 +453,23 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
         if False:
             collection = get_object_collection(obj)
 
-            for child in self._root['nodes']:
-                if child['name'] == collection.name:
-                    # got existing glTF node
-                    gltf_node = child
+            node_id = self._registry.get('nodes', collection.name)
+            if node_id is not None:
+                # got existing glTF node
+                gltf_node = self._root['nodes'][node_id]
 
-                    mesh_id = gltf_node['mesh']
-                    # got existing glTF mesh
-                    gltf_mesh = self._root['meshes'][mesh_id]
-                    break
+                mesh_id = gltf_node['mesh']
+                # got existing glTF mesh
+                gltf_mesh = self._root['meshes'][mesh_id]
             else:  # glTF-node - glTF-mesh pair not found
                 # create new pair
                 gltf_node, gltf_mesh = self._make_node_mesh(
                     parent_node, collection.name, obj, can_merge=True)
 
             if gltf_mesh:
+                self._buffer.partition = self._get_partition(gltf_mesh, obj)
                 self.make_geom(gltf_node, gltf_mesh, obj, can_merge=True)
+                self._buffer.partition = None
 
         # separate nodes
         # if not self.can_merge(obj) or self._keep:
@@ -443,11 +485,18 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
                 self._add_child(parent_node, gltf_node)
                 return gltf_node
 
+            # linked duplicates share the same mesh
+            instance_key = self.get_instance_key(obj)
             gltf_node, gltf_mesh = self._make_node_mesh(
-                parent_node, obj.name, obj, can_merge=False)
+                parent_node, obj.name, obj, can_merge=False,
+                mesh_id=self._instances.get(instance_key))
 
             if gltf_mesh:
+                self._buffer.partition = self._get_partition(gltf_mesh, obj)
                 self.make_geom(gltf_node, gltf_mesh, obj, can_merge=False)
+                self._buffer.partition = None
+                if instance_key is not None:
+                    self._instances[instance_key] = gltf_node['mesh']
 
         return gltf_node
 
@@ -482,28 +531,44 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
         return gltf_light
 
     def convert(self):
-        self._buffer = GLTFBuffer(self._output)
+        self._buffer = GLTFBuffer(
+            self._output, sparse_threshold=self._sparse_threshold,
+            meshopt=self._meshopt, alignment=self._alignment,
+            memory_budget=(
+                self._memory_budget * 1024 * 1024
+                if self._memory_budget is not None else None))
         root = super().convert()
+        if self._gpu_instancing:
+            self.make_gpu_instances()
+        if self._optimize:
+            self.optimize()
+        if self._quantize is not None:
+            self.quantize()
+        if self._lods:
+            self.make_lods()
         return root, self._buffer
 
     def write(self, root, output, is_binary=False):
         if is_binary:
             with open(output, 'wb') as f:  # binary mode
-                chunk1 = self._buffer.export(root)  # export buffer first because it updates gltf data
+                # export buffer layout first because it updates gltf data
+                size = self._buffer.layout(root)
                 chunk0 = json.dumps(root, indent=4).encode()  # export gltf data
-                while len(chunk0) % 4:
-                    chunk0 += b' '
-                while len(chunk1) % 4:
-                    chunk1 += b'\x00'
+                # align chunk1 data after 12 bytes of global headers
+                # and 8 bytes of headers of each chunk
+                align = max(self._alignment or 4, 4)
+                chunk0 += b' ' * (-(12 + 8 + len(chunk0) + 8) % align)
+                padding = b'\0' * (-size % 4)
 
                 # write global headers
                 f.write(b'glTF')  # header
                 f.write(struct.pack('<I', 2))  # version
-                size = (
+                full_size = (
                     4 + 4 + 4 +  # global headers
-                    4 + 4 + len(chunk0) +  # chunk0 + headers
-                    4 + 4 + len(chunk1))  # chunk1 + headers
-                f.write(struct.pack('<I', size))  # full size
+                    4 + 4 + len(chunk0))  # chunk0 + headers
+                if size:
+                    full_size += 4 + 4 + size + len(padding)  # chunk1 + headers
+                f.write(struct.pack('<I', full_size))  # full size
 
                 # write chunk0 with headers
                 f.write(struct.pack('<I', len(chunk0)))
@@ -511,9 +576,14 @@ class GLTFExporter(AnimationMixin, GeomMixin, MaterialMixin,
                 f.write(chunk0)
 
                 # write chunk1 with headers
-                f.write(struct.pack('<I', len(chunk1)))
-                f.write(b'BIN\0')
-                f.write(chunk1)
+                if size:
+                    f.write(struct.pack('<I', size + len(padding)))
+                    f.write(b'BIN\0')
+                    self._buffer.stream(f)  # write buffer data directly
+                    f.write(padding)
+
+            # only the main buffer is embedded
+            self._buffer.write_partitions()
 
         else:
             with open(output, 'w') as f:  # text mode
@@ -550,6 +620,7 @@ class GLTFExporterOperator(bpy.types.Operator, ExportHelper):
             empty_textures = None
             set_origin = None
             normalize_weights = None
+            evaluated = True  # the scene is not changed
 
 
         args = Args()
@@ -566,9 +637,6 @@ class GLTFExporterOperator(bpy.types.Operator, ExportHelper):
             # write glTF data with embedded buffer
             e.write(out, args.output, is_binary=True)
 
-        # re-open current file
-        bpy.ops.wm.open_mainfile(filepath=bpy.data.filepath)
-
         return {"FINISHED"}
 
     def invoke(self, context, event):
@@ -50,13 +50,11 @@ class AnimationMixin(object):
         return gltf_sampler
 
     def make_action(self, node, armature, action):
-        gltf_armature = None
-        for i, gltf_node in enumerate(self._root['nodes']):
-            if gltf_node['name'] == armature.name:
-                gltf_armature = gltf_node
-                break
-        if not gltf_armature:
+        gltf_armature_id = self._registry.get('nodes', armature.name)
+        if gltf_armature_id is None:
             gltf_armature = self.make_armature(node, armature)
+        else:
+            gltf_armature = self._root['nodes'][gltf_armature_id]
 
         gltf_skin = None
         for i in gltf_armature['children']:
@@ -76,6 +74,9 @@ class AnimationMixin(object):
             'samplers': [],
         }
 
+        if self._split_buffers:
+            self._buffer.partition = 'action.{}'.format(gltf_animation['name'])
+
         # setup bones
         gltf_channels = {}
         gltf_samplers = []
@@ -172,4 +173,5 @@ class AnimationMixin(object):
 
         # animation -->
 
+        self._buffer.partition = None
         self._root['animations'].append(gltf_animation)
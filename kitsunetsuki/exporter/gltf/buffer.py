@@ -13,139 +13,838 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import io
+import array
+import hashlib
+import mmap
 import os
-import struct
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+from . import meshopt, spec
+
+
+# array module type codes for the glTF component types
+TYPECODES = {
+    spec.TYPE_BYTE: 'b',
+    spec.TYPE_UNSIGNED_BYTE: 'B',
+    spec.TYPE_SHORT: 'h',
+    spec.TYPE_UNSIGNED_SHORT: 'H',
+    spec.TYPE_UNSIGNED_INT: 'I',
+    spec.TYPE_FLOAT: 'f',
+}
+
+# file copy chunk size if neither sendfile nor mmap are available
+CHUNK_SIZE = 1024 * 1024
+
+# max number of buffers in a single writev call
+IOV_MAX = 1024
+if hasattr(os, 'sysconf'):
+    try:
+        IOV_MAX = os.sysconf('SC_IOV_MAX')
+    except (ValueError, OSError):
+        pass
+
+# the highest allowed index for the index component types,
+# the max values are reserved for the primitive restart
+INDEX_TYPES = (
+    (0xff - 1, spec.TYPE_UNSIGNED_BYTE),
+    (0xffff - 1, spec.TYPE_UNSIGNED_SHORT),
+    (0xffffffff - 1, spec.TYPE_UNSIGNED_INT),
+)
+
+# accessors which are required to have min/max by the spec:
+# vertex and morph target positions, animation sampler inputs
+BOUNDED_REFERENCES = ('POSITION', 'input')
+
+
+def _writev(fd, views):
+    """
+    Writes memory views into the file descriptor,
+    gathering as many of them as possible into a single system call.
+    """
+    views = [view for view in views if len(view)]
+    while views:
+        if hasattr(os, 'writev'):
+            batch = views[:IOV_MAX]
+            written = os.writev(fd, batch)
+        else:
+            batch = views[:1]
+            written = os.write(fd, batch[0])
+
+        # drop written views, keep the rest of partially written one
+        for i, view in enumerate(batch):
+            if written < len(view):
+                views = [view[written:]] + views[i + 1:]
+                break
+            written -= len(view)
+        else:
+            views = views[len(batch):]
+
+
+def _copy_file(fd, filepath):
+    """
+    Copies file contents into the file descriptor,
+    using sendfile or mmap where available,
+    so the file is never read into memory as a whole.
+    """
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
 
-from . import spec
+        if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            try:
+                while offset < size:
+                    sent = os.sendfile(fd, f.fileno(), offset, size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+            except OSError:
+                pass
+
+        if offset < size:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                mm = None
+
+            if mm is not None:
+                with mm, memoryview(mm) as view:
+                    _writev(fd, [view[offset:size]])
+                return
+
+        f.seek(offset)
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            _writev(fd, [memoryview(chunk)])
+
+
+def _hash_part(part):
+    """
+    Returns content hash of the part of data.
+    """
+    h = hashlib.blake2b(digest_size=16)
+
+    if isinstance(part, str):  # file path
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+    elif isinstance(part, (bytes, bytearray, memoryview)):
+        h.update(part)
+    else:  # Blender's packed file
+        h.update(part.data)
+
+    return h.digest()
 
 
 class GLTFBuffer(object):
-    def __init__(self, filepath):
+    """
+    Binary data storage for glTF accessors.
+    Every channel is a growable typed array of the channel's component type.
+    If the memory budget (in bytes) is exceeded when channels are written,
+    the data written so far is moved into
+    a temporary file and read back with a memory map.
+    Channels added while the partition is set are exported
+    into a separate buffer file named after the partition.
+    """
+    def __init__(self, filepath, sparse_threshold=None, meshopt=None,
+                 memory_budget=None, alignment=None):
         self._filepath = filepath
+        self._alignment = alignment or 1  # minimal buffer view alignment
+        self._sparse_threshold = sparse_threshold
+        self._meshopt = meshopt  # None, "required" or "optional"
+        self._memory_budget = memory_budget
+        self._spill_file = None
+        self._spill_map = None
+        self._spill_size = 0
+        self._memory = 0  # size of the in-memory channel data
+        self._extents = []  # channel ID -> spilled (offset, size) list
         self._channels = []
         self._metadata = []
+        self._sizes = []
+        self._targets = []
+        self._sparse = []
+        self._groups = []  # interleaved channel groups, channel ID -> first channel ID
+        self._members = {}  # first channel ID -> channel IDs
+        self._partitions = []  # channel ID -> partition name
+        self._layouts = None  # partition -> buffer URI, parts
+        self._triangles = set()  # index channel IDs of the triangle lists
+        self.partition = None
+
+    def add_channel(self, metadata, target=None, interleave_with=None,
+                    sparse=False):
+        """
+        Adds a new channel, which is exported as an accessor.
+        Channels interleaved with another channel (and all of its group)
+        share a single buffer view with a byte stride.
+        Sparse channels are exported as sparse accessors if the fraction
+        of non-zero elements is below the buffer's sparse threshold.
+        """
+        self._channels.append(array.array(TYPECODES[metadata['componentType']]))
+        self._extents.append([])
+        self._sizes.append(spec.NUM_COMPONENTS[metadata['type']])
+        self._targets.append(target)
+        self._sparse.append(sparse)
+
+        channel_id = len(self._channels) - 1
+        if interleave_with is None:
+            self._groups.append(channel_id)
+            self._members[channel_id] = [channel_id]
+            self._partitions.append(
+                self.partition and re.sub(r'[^\w.-]+', '_', self.partition))
+        else:
+            self._groups.append(self._groups[interleave_with])
+            self._members[self._groups[interleave_with]].append(channel_id)
+            self._partitions.append(self._partitions[interleave_with])
 
-    def add_channel(self, metadata):
-        self._channels.append(io.BytesIO())
         self._metadata.append(metadata)
         self._metadata[-1]['bufferView'] = len(self._metadata) - 1
         self._metadata[-1]['count'] = 0
         return self._metadata[-1]
 
+    def dump_channels(self, channel_ids):
+        """
+        Returns the settings and the data arrays of the channels,
+        which are added back by "load_channels".
+        """
+        settings = []
+        arrays = []
+        for channel_id in sorted(channel_ids):
+            metadata = dict(self._metadata[channel_id])
+            metadata.pop('bufferView')
+            metadata.pop('count')
+
+            interleave_with = None
+            if self._groups[channel_id] != channel_id:
+                interleave_with = self._groups[channel_id]
+
+            settings.append({
+                'id': channel_id,
+                'metadata': metadata,
+                'target': self._targets[channel_id],
+                'sparse': self._sparse[channel_id],
+                'interleave_with': interleave_with,
+            })
+            arrays.append(np.frombuffer(
+                self._get_data(channel_id),
+                dtype=self._channels[channel_id].typecode))
+
+        return settings, arrays
+
+    def load_channels(self, settings, arrays):
+        """
+        Adds the channels dumped by "dump_channels".
+        Returns the new channel IDs by the dumped ones.
+        """
+        results = {}
+        for channel, values in zip(settings, arrays):
+            metadata = channel['metadata']
+            channel_id = self.add_channel(
+                dict(metadata, extras=dict(metadata.get('extras') or {})),
+                target=channel['target'],
+                interleave_with=results.get(channel['interleave_with']),
+                sparse=channel['sparse'])['bufferView']
+            self.write_raw(channel_id, np.ascontiguousarray(
+                values, dtype=self._channels[channel_id].typecode).tobytes())
+            results[channel['id']] = channel_id
+
+        return results
+
+    def get_partition(self, channel_id):
+        """
+        Returns the partition name of the channel.
+        """
+        return self._partitions[channel_id]
+
     def write(self, channel_id, *values):
-        size = {
-            'SCALAR': 1,
-            'VEC2': 2,
-            'VEC3': 3,
-            'VEC4': 4,
-            'MAT4': 4 * 4,
-        }[self._metadata[channel_id]['type']]
-        assert size == len(values)
-
-        if 'min' not in self._metadata[channel_id]:
-            self._metadata[channel_id]['min'] = [None] * size
-
-        if 'max' not in self._metadata[channel_id]:
-            self._metadata[channel_id]['max'] = [None] * size
-
-        for i, value in enumerate(values):
-            if self._metadata[channel_id]['min'][i] is None:
-                self._metadata[channel_id]['min'][i] = value
-            else:
-                self._metadata[channel_id]['min'][i] = min(self._metadata[channel_id]['min'][i], value)
-
-            if self._metadata[channel_id]['max'][i] is None:
-                self._metadata[channel_id]['max'][i] = value
-            else:
-                self._metadata[channel_id]['max'][i] = max(self._metadata[channel_id]['max'][i], value)
-
-        type_ = {
-            spec.TYPE_UNSIGNED_BYTE: 'B',
-            spec.TYPE_UNSIGNED_SHORT: 'H',
-            spec.TYPE_UNSIGNED_INT: 'I',
-            spec.TYPE_FLOAT: 'f',
-        }[self._metadata[channel_id]['componentType']]
-
-        format_ = '<{}'.format(type_ * size)
-
-        self._channels[channel_id].write(struct.pack(format_, *values))
-        self._metadata[channel_id]['count'] += 1
+        assert self._sizes[channel_id] == len(values)
+        channel = self._channels[channel_id]
+        channel.extend(values)
+        self._check_memory(len(values) * channel.itemsize)
+
+    def write_many(self, channel_id, values):
+        """
+        Appends multiple elements at once.
+        Values is an array-like of shape (count, components) or a flat one.
+        """
+        channel = self._channels[channel_id]
+        size = self._sizes[channel_id]
+
+        values = np.ascontiguousarray(values, dtype=channel.typecode).reshape(-1)
+        assert len(values) % size == 0
+        channel.frombytes(memoryview(values).cast('B'))
+        self._check_memory(values.nbytes)
 
     def write_raw(self, channel_id, data):
-        self._channels[channel_id].write(data)
-        self._metadata[channel_id]['count'] += len(data)
+        self._channels[channel_id].frombytes(data)
+        self._check_memory(memoryview(data).nbytes)
 
     def count(self, channel_id):
-        return self._metadata[channel_id]['count']
+        channel = self._channels[channel_id]
+        spilled = sum(size for _, size in self._extents[channel_id])
+        return (spilled // channel.itemsize + len(channel)) // self._sizes[channel_id]
+
+    def _check_memory(self, size):
+        """
+        Accounts for the bytes added to the in-memory channels.
+        """
+        self._memory += size
+        if self._memory_budget is not None and self._memory > self._memory_budget:
+            self._spill()
+
+    def _spill(self):
+        """
+        Appends the in-memory data of all channels to the temporary file.
+        """
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(
+                prefix='kitsunetsuki-', suffix='.bin')
+
+        for channel_id, channel in enumerate(self._channels):
+            if not channel:
+                continue
 
-    def export(self, parent_node, filepath=None):
+            data = memoryview(channel).cast('B')
+            self._spill_file.write(data)
+            self._extents[channel_id].append((self._spill_size, len(data)))
+            self._spill_size += len(data)
+            self._channels[channel_id] = array.array(channel.typecode)
+
+        self._spill_file.flush()
+        self._spill_map = None  # remap the grown file on read
+        self._memory = 0
+
+    def _get_data(self, channel_id):
+        """
+        Returns channel data as native-endian bytes.
+        Data which is entirely spilled is not copied.
+        """
+        channel = self._channels[channel_id]
+        extents = self._extents[channel_id]
+        if not extents:
+            return memoryview(channel).cast('B')
+
+        if self._spill_map is None:
+            self._spill_map = mmap.mmap(
+                self._spill_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._spill_map)
+
+        if len(extents) == 1 and not channel:
+            offset, size = extents[0]
+            return view[offset:offset + size]
+
+        parts = [view[offset:offset + size] for offset, size in extents]
+        parts.append(memoryview(channel).cast('B'))
+        return memoryview(b''.join(parts))
+
+    def get_array(self, channel_id):
+        """
+        Returns channel data as (count, components) NumPy array view.
+        """
+        values = np.frombuffer(
+            self._get_data(channel_id),
+            dtype=self._channels[channel_id].typecode)
+        return values.reshape(-1, self._sizes[channel_id])
+
+    def _set_bounds(self, channel_id):
+        metadata = self._metadata[channel_id]
+        extras = metadata.get('extras') or {}
+        if extras.get('reference') not in BOUNDED_REFERENCES:
+            return
+
+        values = self.get_array(channel_id)
+        if len(values):
+            metadata['min'] = values.min(axis=0).tolist()
+            metadata['max'] = values.max(axis=0).tolist()
+
+    def _narrow_indices(self, channel_id):
+        """
+        Converts index channel into the smallest component type
+        which fits the highest written index.
+        """
+        values = self.get_array(channel_id)
+        highest = int(values.max()) if len(values) else 0
+
+        for max_index, ctype in INDEX_TYPES:
+            if highest <= max_index:
+                break
+
+        if ctype != self._metadata[channel_id]['componentType']:
+            self.set_array(channel_id, values, ctype)
+
+    def set_array(self, channel_id, values, ctype, normalized=False):
+        """
+        Replaces channel data, converting it into another component type.
+        """
+        typecode = TYPECODES[ctype]
+        values = np.ascontiguousarray(values, dtype=typecode).reshape(-1)
+        channel = self._channels[channel_id]
+        self._memory -= len(channel) * channel.itemsize
+        self._channels[channel_id] = array.array(typecode)
+        self._channels[channel_id].frombytes(memoryview(values).cast('B'))
+        self._extents[channel_id] = []
+        self._metadata[channel_id]['componentType'] = ctype
+        if normalized:
+            self._metadata[channel_id]['normalized'] = True
+        else:
+            self._metadata[channel_id].pop('normalized', None)
+        self._check_memory(values.nbytes)
+
+    def remap(self, channel_id, order):
+        """
+        Reorders channel elements, element i is taken from order[i].
+        """
+        metadata = self._metadata[channel_id]
+        self.set_array(
+            channel_id, self.get_array(channel_id)[order],
+            metadata['componentType'], normalized=metadata.get('normalized'))
+
+    def quantize(self, channel_id, ctype, offset=0, scale=1):
+        """
+        Converts float channel into a normalized integer component type.
+        Values are mapped with (value - offset) / scale,
+        the result is expected to be in [-1, 1] or [0, 1] range
+        for signed and unsigned types respectively.
+        """
+        info = np.iinfo(TYPECODES[ctype])
+        values = (self.get_array(channel_id) - offset) / scale
+        values = np.clip(
+            np.round(values * info.max),
+            -info.max if info.min else 0, info.max)
+
+        self.set_array(channel_id, values, ctype, normalized=True)
+
+    def _get_bytes(self, channel_id):
+        """
+        Returns channel data as little-endian bytes.
+        """
+        data = self._get_data(channel_id)
+        if sys.byteorder == 'big':
+            channel = array.array(self._channels[channel_id].typecode)
+            channel.frombytes(data)
+            channel.byteswap()
+            data = memoryview(channel).cast('B')
+        return data
+
+    def _get_array_bytes(self, values):
+        """
+        Returns NumPy array data as little-endian bytes.
+        """
+        values = np.ascontiguousarray(
+            values, dtype=values.dtype.newbyteorder('<'))
+        return memoryview(values).cast('B')
+
+    def _get_element_size(self, channel_id):
+        return self._channels[channel_id].itemsize * self._sizes[channel_id]
+
+    def _get_interleaved_bytes(self, channel_ids):
+        """
+        Returns data of the channels interleaved element by element,
+        every element is aligned to 4 bytes, and the byte stride.
+        """
+        sizes = [self._get_element_size(i) for i in channel_ids]
+        strides = [size + (-size % 4) for size in sizes]
+
+        data = np.zeros((self.count(channel_ids[0]), sum(strides)), dtype=np.uint8)
         offset = 0
-        data = bytearray()
-        uri = 'nothing.bin'
+        for channel_id, size, stride in zip(channel_ids, sizes, strides):
+            part = np.frombuffer(self._get_bytes(channel_id), dtype=np.uint8)
+            data[:, offset:offset + size] = part.reshape(-1, size)
+            offset += stride
+
+        return memoryview(data).cast('B'), strides
+
+    def _add_part(self, part, size, align=1):
+        """
+        Appends the part of data to the current buffer
+        after the padding required for the alignment.
+        Returns the part offset.
+        """
+        padding = -self._offset % max(align, self._alignment)
+        if padding:
+            self._parts.append(b'\0' * padding)
+            self._offset += padding
+
+        offset = self._offset
+        self._parts.append(part)
+        self._offset += size
+        return offset
+
+    def _add_view(self, parent_node, part, extras=None, size=None, align=1,
+                  mode=None, stride=None, **kwargs):
+        """
+        Adds a buffer view for the part of data, which is
+        memory view, bytes, file path or Blender's packed file.
+        The view offset is aligned to the specified number of bytes.
+        Returns existing buffer view if the same data was already added.
+        Views with the compression mode and element stride
+        are compressed with EXT_meshopt_compression if enabled.
+        """
+        if size is None:
+            size = len(part)
+
+        key = (size, _hash_part(part), tuple(sorted(kwargs.items())))
+        if key in self._views:
+            return self._views[key]
+
+        view = {
+            'buffer': self._buffer_id,
+            'byteLength': size,
+            'byteOffset': 0,
+            'extras': extras or {},
+        }
+        view.update(kwargs)
+
+        compressed = None
+        if (self._meshopt and size and
+                meshopt.can_encode(mode, stride)):
+            compressed = meshopt.encode(part, mode, stride)
+            if len(compressed) >= size:  # not worth it
+                compressed = None
+
+        if compressed is None or self._meshopt == 'optional':
+            # uncompressed data, also for the decoders without extension
+            view['byteOffset'] = self._add_part(part, size, align)
+
+        if compressed is not None:
+            if self._meshopt == 'required':  # no uncompressed data
+                self._fallback_offset += (
+                    -self._fallback_offset % max(align, self._alignment))
+                view['buffer'] = self._buffer_id + 1
+                view['byteOffset'] = self._fallback_offset
+                self._fallback_offset += size
+
+            view.setdefault('extensions', {})['EXT_meshopt_compression'] = {
+                'buffer': self._buffer_id,
+                'byteOffset': self._add_part(
+                    compressed, len(compressed), align=4),
+                'byteLength': len(compressed),
+                'byteStride': stride,
+                'count': size // stride,
+                'mode': mode,
+            }
+
+        parent_node['bufferViews'].append(view)
+        self._views[key] = len(parent_node['bufferViews']) - 1
+
+        return self._views[key]
+
+    def _layout_channel(self, parent_node, channel_id):
+        # vertex attributes should be aligned to 4 bytes
+        if (self._targets[channel_id] == spec.ARRAY_BUFFER and
+                self._get_element_size(channel_id) % 4):
+            self._layout_interleaved(parent_node, [channel_id])
+            return
+
+        metadata = self._metadata[channel_id]
+        kwargs = {}
+        if self._targets[channel_id]:
+            kwargs['target'] = self._targets[channel_id]
+
+        mode = meshopt.MODE_ATTRIBUTES
+        if self._targets[channel_id] == spec.ELEMENT_ARRAY_BUFFER:
+            mode = meshopt.MODE_INDICES
+            if (channel_id in self._triangles and
+                    self.count(channel_id) % 3 == 0):
+                mode = meshopt.MODE_TRIANGLES
+
+        align = self._channels[channel_id].itemsize
+        if self._targets[channel_id] == spec.ARRAY_BUFFER:
+            align = 4
+
+        metadata['bufferView'] = self._add_view(
+            parent_node, self._get_bytes(channel_id),
+            metadata.get('extras'), align=align, mode=mode,
+            stride=self._get_element_size(channel_id), **kwargs)
+
+    def _layout_sparse(self, parent_node, channel_id):
+        """
+        Lays out the channel as a sparse accessor storing non-zero
+        elements only. Returns False if it's not sparse enough.
+        """
+        metadata = self._metadata[channel_id]
+        values = self.get_array(channel_id)
+
+        indices = np.flatnonzero(np.any(values != 0, axis=1))
+        if len(indices) >= self._sparse_threshold * len(values):
+            return False
+
+        # no buffer view - accessor is initialized with zeros
+        del metadata['bufferView']
+
+        if len(indices):
+            for max_index, ctype in INDEX_TYPES:
+                if indices[-1] <= max_index:
+                    break
+
+            indices = indices.astype(TYPECODES[ctype])
+            indices_view = self._add_view(
+                parent_node, self._get_array_bytes(indices),
+                {'reference': 'sparse indices'}, align=indices.itemsize,
+                mode=meshopt.MODE_INDICES, stride=indices.itemsize)
+            values_view = self._add_view(
+                parent_node, self._get_array_bytes(values[indices]),
+                {'reference': 'sparse values'},
+                align=self._channels[channel_id].itemsize,
+                mode=meshopt.MODE_ATTRIBUTES,
+                stride=self._get_element_size(channel_id))
+
+            metadata['sparse'] = {
+                'count': len(indices),
+                'indices': {
+                    'bufferView': indices_view,
+                    'componentType': ctype,
+                },
+                'values': {
+                    'bufferView': values_view,
+                },
+            }
+
+        return True
+
+    def _layout_group(self, parent_node, channel_ids):
+        counts = set(map(self.count, channel_ids))
+        if len(channel_ids) == 1 or len(counts) != 1:
+            for channel_id in channel_ids:
+                self._layout_channel(parent_node, channel_id)
+        else:
+            self._layout_interleaved(parent_node, channel_ids)
+
+    def _layout_interleaved(self, parent_node, channel_ids):
+        part, strides = self._get_interleaved_bytes(channel_ids)
+        extras = {'reference': 'interleaved'}
+        if len(channel_ids) == 1:
+            extras = self._metadata[channel_ids[0]].get('extras')
 
-        # accessors + buffer views
+        view_id = self._add_view(
+            parent_node, part, extras, align=4,
+            mode=meshopt.MODE_ATTRIBUTES, stride=sum(strides),
+            byteStride=sum(strides), target=spec.ARRAY_BUFFER)
+
+        offset = 0
+        for channel_id, stride in zip(channel_ids, strides):
+            self._metadata[channel_id]['bufferView'] = view_id
+            self._metadata[channel_id]['byteOffset'] = offset
+            offset += stride
+
+    def _get_partition_uri(self, partition):
+        name = 'buffer'
+        if self._filepath:
+            name = os.path.splitext(os.path.basename(self._filepath))[0]
+        return '{}.{}.bin'.format(name, partition)
+
+    def layout(self, parent_node, uri=None):
+        """
+        Fills accessors, buffer views and buffers of the glTF data
+        and returns the main buffer length. The data itself is not copied,
+        it's written later by "stream" and "write_partitions".
+        The buffer can be laid out only once.
+        """
+        if self._layouts is not None:
+            raise RuntimeError('The buffer is already laid out.')
+        self._layouts = {}
+
+        # triangle lists are compressed better by the triangle codec
+        for gltf_mesh in parent_node.get('meshes', []):
+            for gltf_primitive in gltf_mesh['primitives']:
+                mode = gltf_primitive.get('mode', spec.MODE_TRIANGLES)
+                if mode == spec.MODE_TRIANGLES and 'indices' in gltf_primitive:
+                    self._triangles.add(gltf_primitive['indices'])
+
+        # accessors
         for i in range(len(self._channels)):
-            channel = self._channels[i]
+            if self._targets[i] == spec.ELEMENT_ARRAY_BUFFER:
+                self._narrow_indices(i)
+
             metadata = self._metadata[i]
-            extras = metadata.get('extras') or {}
+            metadata['count'] = self.count(i)
+            self._set_bounds(i)
             parent_node['accessors'].append(metadata)
 
-            part = channel.getbuffer()
-            view = {
-                'buffer': len(parent_node['buffers']),
-                'byteLength': len(part),
-                'byteOffset': offset,
-                'extras': extras,
-            }
-            parent_node['bufferViews'].append(view)
-
-            offset += len(part)
-            data += part
-
-        # embedded images + buffer views
+        # main buffer first, then partitions in order of appearance
+        size = self._layout_partition(parent_node, None, uri)
+        for partition in dict.fromkeys(filter(None, self._partitions)):
+            self._layout_partition(
+                parent_node, partition, self._get_partition_uri(partition))
+
+        compressed = any(
+            'EXT_meshopt_compression' in view.get('extensions', {})
+            for view in parent_node['bufferViews'])
+        if compressed:
+            extensions = ['extensionsUsed']
+            if any('extensions' in b for b in parent_node['buffers']):
+                extensions.append('extensionsRequired')
+
+            for name in extensions:
+                if name not in parent_node:
+                    parent_node[name] = []
+                if 'EXT_meshopt_compression' not in parent_node[name]:
+                    parent_node[name].append('EXT_meshopt_compression')
+
+        self._check_alignment(parent_node)
+        return size
+
+    def _check_alignment(self, parent_node):
+        """
+        Makes sure that every accessor can be mapped
+        from the buffer as a typed array without a copy.
+        """
+        for accessor_id, accessor in enumerate(parent_node['accessors']):
+            item_size = array.array(TYPECODES[accessor['componentType']]).itemsize
+
+            references = []
+            if 'bufferView' in accessor:
+                references.append((
+                    accessor['bufferView'], accessor.get('byteOffset', 0),
+                    item_size))
+            if 'sparse' in accessor:
+                sparse = accessor['sparse']
+                references.append((
+                    sparse['indices']['bufferView'], 0,
+                    array.array(
+                        TYPECODES[sparse['indices']['componentType']]).itemsize))
+                references.append((
+                    sparse['values']['bufferView'], 0, item_size))
+
+            for view_id, offset, size in references:
+                view = parent_node['bufferViews'][view_id]
+                if (view['byteOffset'] + offset) % size:
+                    raise ValueError(
+                        'misaligned accessor {}'.format(accessor_id))
+                if view.get('byteStride', size) % size:
+                    raise ValueError(
+                        'misaligned stride of accessor {}'.format(accessor_id))
+
+    def _layout_images(self, parent_node):
         for gltf_image in parent_node.get('images', []):
             extras = gltf_image.get('extras') or {}
 
             part = None
+            size = 0
 
             if 'uri' in extras:
-                tfilepath = os.path.join(os.path.dirname(self._filepath), extras['uri'])
-                with open(tfilepath, 'rb') as f:
-                    part = f.read()
+                part = os.path.join(os.path.dirname(self._filepath), extras['uri'])
+                size = os.path.getsize(part)
+
+            elif 'packed_file' in extras:  # written from Blender at stream time
+                part = extras.pop('packed_file')
+                size = part.size
 
             elif 'data' in extras:
                 part = extras.pop('data')
+                size = len(part)
 
-            if not part:
+            if not size:
                 continue
 
-            view = {
-                'buffer': len(parent_node['buffers']),
-                'byteLength': len(part),
-                'byteOffset': offset,
-                'extras': extras,
-            }
-            parent_node['bufferViews'].append(view)
-            gltf_image['bufferView'] = len(parent_node['bufferViews']) - 1
+            gltf_image['bufferView'] = self._add_view(
+                parent_node, part, extras, size=size)
 
-            offset += len(part)
-            data += part
+    def _layout_partition(self, parent_node, partition, uri=None):
+        """
+        Lays out the channels of the partition into a new buffer.
+        """
+        self._offset = 0
+        self._fallback_offset = 0  # size of the uncompressed data
+        self._parts = []
+        self._views = {}  # content key -> buffer view ID
+        self._buffer_id = len(parent_node['buffers'])
 
-        if filepath:
-            buffer_fp = filepath.replace('.gltf', '.bin')
-            with open(buffer_fp, 'wb') as f:
-                f.write(data)
+        # buffer views
+        for i in range(len(self._channels)):
+            if self._groups[i] != i:  # laid out with the group
+                continue
 
-            uri = os.path.relpath(
-                buffer_fp, os.path.dirname(self._filepath))
+            if self._partitions[i] != partition:
+                continue
+
+            if (self._sparse[i] and self._sparse_threshold and
+                    self._layout_sparse(parent_node, i)):
+                continue
 
-        if len(data):
+            self._layout_group(parent_node, self._members[i])
+
+        # embedded images go into the main buffer
+        if partition is None:
+            self._layout_images(parent_node)
+
+        if self._offset:
             gltf_buffer = {
-                'byteLength': len(data),
+                'byteLength': self._offset,
             }
-            if filepath:
+            if uri:
                 gltf_buffer['uri'] = uri
             parent_node['buffers'].append(gltf_buffer)
 
-        return data
+        if self._fallback_offset:
+            # placeholder for the data restored by the meshopt decoder
+            parent_node['buffers'].append({
+                'byteLength': self._fallback_offset,
+                'extensions': {
+                    'EXT_meshopt_compression': {
+                        'fallback': True,
+                    },
+                },
+            })
+
+        self._layouts[partition] = uri, self._parts
+        return self._offset
+
+    def stream(self, f, partition=None):
+        """
+        Writes the buffer data laid out by "layout" into the binary file.
+        """
+        f.flush()
+        fd = f.fileno()
+
+        views = []
+        for part in self._layouts[partition][1]:
+            if isinstance(part, (bytes, bytearray, memoryview)):
+                views.append(part)
+                continue
+
+            _writev(fd, views)
+            views = []
+
+            if isinstance(part, str):  # file path
+                _copy_file(fd, part)
+            else:  # Blender's packed file
+                _writev(fd, [memoryview(part.data)])
+        _writev(fd, views)
+
+    def export(self, parent_node, filepath=None):
+        """
+        Updates the glTF data and writes the buffer into
+        a separate binary file if the file path is specified.
+        """
+        uri = None
+        if filepath:
+            buffer_fp = filepath.replace('.gltf', '.bin')
+            uri = os.path.relpath(
+                buffer_fp, os.path.dirname(self._filepath))
+
+        size = self.layout(parent_node, uri)
+
+        if filepath:
+            with open(buffer_fp, 'wb') as f:
+                self.stream(f)
+            self.write_partitions()
+
+        return size
+
+    def write_partitions(self):
+        """
+        Writes the partition buffers laid out by "layout"
+        into the binary files next to the glTF file.
+        """
+        for partition, (uri, parts) in self._layouts.items():
+            if partition is None or not parts:
+                continue
+
+            path = os.path.join(os.path.dirname(self._filepath), uri)
+            with open(path, 'wb') as f:
+                self.stream(f, partition)
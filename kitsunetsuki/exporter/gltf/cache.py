@@ -0,0 +1,133 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from kitsunetsuki.base.armature import get_armature
+from kitsunetsuki.base.matrices import get_object_matrix, matrix_to_list
+from kitsunetsuki.base.mesh import get_mesh_data
+from kitsunetsuki.base.objects import is_collision
+
+
+class CacheMixin(object):
+    def get_geom_key(self, gltf_node, gltf_mesh, obj, mesh):
+        """
+        Returns the cache key of the mesh primitives.
+        """
+        armature = get_armature(obj)
+        obj_data = {
+            'collision': is_collision(obj),
+            'vertex_groups': [vg.name for vg in obj.vertex_groups],
+            'parent_bone': obj.parent_bone if obj.parent_type == 'BONE' else None,
+            'joints': None,
+            'matrix': None,
+        }
+        if armature:
+            # skinned vertices are transformed by the object matrix
+            obj_data['matrix'] = matrix_to_list(
+                self._transform(get_object_matrix(obj, armature=armature)))
+            if 'skin' in gltf_node:
+                obj_data['joints'] = self._get_joints(gltf_node['skin'])
+
+        # everything the geometry and vertex writers read
+        flags = {
+            'exporter': type(self).__name__,
+            # VRM joints are always 16-bit
+            'vrm': (self._output or '').endswith('.vrm'),
+            'evaluated': self._evaluated,
+            'geom_scale': self._geom_scale,
+            'matrix': matrix_to_list(self._matrix),
+            'z_up': self._z_up,
+            'pose_freeze': self._pose_freeze,
+            'split_primitives': self._split_primitives,
+            'short_indices': self._short_indices,
+            'interleave': self._interleave,
+            'legacy_geom': self._legacy_geom,
+            'loop_triangles': self._loop_triangles,
+            'weld_tolerance': self._weld_tolerance,
+            'no_extra_uv': self._no_extra_uv,
+            'no_materials': self._no_materials,
+            'norm_weights': self._norm_weights,
+            'max_influences': self._max_influences,
+            'weight_error': self._weight_error,
+        }
+
+        return self._cache.get_key(
+            'gltf', flags, obj_data, gltf_mesh['extras']['targetNames'],
+            *get_mesh_data(mesh, loop_triangles=self._loop_triangles))
+
+    def load_primitives(self, key, gltf_mesh, gltf_materials):
+        """
+        Adds the cached primitives to the mesh.
+        Returns False if there are no cached primitives.
+        """
+        entry = self._cache.load(key)
+        if entry is None:
+            return False
+
+        header, arrays = entry
+        channel_ids = self._buffer.load_channels(header['channels'], [
+            arrays['channel{}'.format(i)]
+            for i in range(len(header['channels']))])
+
+        def remap(ids):
+            return {name: channel_ids[i] for name, i in ids.items()}
+
+        for cached in header['primitives']:
+            gltf_primitive = {
+                'attributes': remap(cached['attributes']),
+                'material': gltf_materials.get(cached['material'], 0),
+                'extras': {
+                    'highest_index': cached['highest_index'],
+                    'targetNames': gltf_mesh['extras']['targetNames'],
+                },
+                'indices': channel_ids[cached['indices']],
+            }
+            if 'targets' in cached:
+                gltf_primitive['targets'] = [
+                    remap(gltf_target) for gltf_target in cached['targets']]
+            gltf_mesh['primitives'].append(gltf_primitive)
+
+        return True
+
+    def save_primitives(self, key, gltf_mesh, gltf_materials):
+        """
+        Writes the primitives of the mesh into the cache.
+        """
+        material_names = {
+            material_id: mname for mname, material_id in gltf_materials.items()}
+
+        channel_ids = set()
+        primitives = []
+        for gltf_primitive in gltf_mesh['primitives']:
+            cached = {
+                'attributes': gltf_primitive['attributes'],
+                'material': material_names.get(gltf_primitive.get('material')),
+                'highest_index': gltf_primitive['extras']['highest_index'],
+                'indices': gltf_primitive['indices'],
+            }
+            channel_ids.add(gltf_primitive['indices'])
+            channel_ids.update(gltf_primitive['attributes'].values())
+            if 'targets' in gltf_primitive:
+                cached['targets'] = gltf_primitive['targets']
+                for gltf_target in gltf_primitive['targets']:
+                    channel_ids.update(gltf_target.values())
+            primitives.append(cached)
+
+        channels, arrays = self._buffer.dump_channels(channel_ids)
+        self._cache.save(key, {
+            'channels': channels,
+            'primitives': primitives,
+        }, {
+            'channel{}'.format(i): values for i, values in enumerate(arrays)
+        })
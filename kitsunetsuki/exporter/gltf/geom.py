@@ -13,23 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import bpy
+import numpy as np
+
 from kitsunetsuki.base.armature import get_armature
 from kitsunetsuki.base.matrices import get_object_matrix
-from kitsunetsuki.base.mesh import obj2mesh
+from kitsunetsuki.base.mesh import (
+    eval2mesh, get_array, get_loop_triangles, get_triangles,
+    get_vertex_groups, obj2mesh)
 from kitsunetsuki.base.objects import apply_modifiers, is_collision
 
 from . import spec
 
 
-class GeomMixin(object):
-    def _get_joints(self, gltf_node):
-        results = {}
+# the highest index of 16-bit indices, used to split large primitives
+MAX_SHORT_INDEX = 0xffff - 1
 
-        for i, child_id in enumerate(gltf_node['joints']):
-            child = self._root['nodes'][child_id]
-            results[child['name']] = i
 
-        return results
+class GeomMixin(object):
+    def _get_joints(self, skin_id):
+        return self._registry.get_joints(skin_id)
 
     def _make_primitive(self, gltf_mesh, mesh):
         gltf_primitive = {
@@ -42,14 +45,14 @@ class GeomMixin(object):
             },
         }
 
+        # narrowed to the smallest type by the buffer on export
         channel = self._buffer.add_channel({
-            # 'componentType': spec.TYPE_UNSIGNED_SHORT,
             'componentType': spec.TYPE_UNSIGNED_INT,
             'type': 'SCALAR',
             'extras': {
                 'reference': 'indices',
             },
-        })
+        }, target=spec.ELEMENT_ARRAY_BUFFER)
         gltf_primitive['indices'] = channel['bufferView']
 
         if gltf_mesh['primitives'] and not self._split_primitives:
@@ -58,7 +61,7 @@ class GeomMixin(object):
                 gltf_primitive['targets'] = gltf_mesh['primitives'][0]['targets']
 
         else:
-            channel = self._buffer.add_channel({
+            channel = self._add_attribute_channel(gltf_primitive, {
                 'componentType': spec.TYPE_FLOAT,
                 'type': 'VEC3',
                 'extras': {
@@ -67,7 +70,7 @@ class GeomMixin(object):
             })
             gltf_primitive['attributes']['NORMAL'] = channel['bufferView']
 
-            channel = self._buffer.add_channel({
+            channel = self._add_attribute_channel(gltf_primitive, {
                 'componentType': spec.TYPE_FLOAT,
                 'type': 'VEC3',
                 'extras': {
@@ -90,7 +93,7 @@ class GeomMixin(object):
                         'reference': 'POSITION',
                         'target': sk_name,
                     },
-                })
+                }, target=spec.ARRAY_BUFFER, sparse=True)
                 gltf_target['POSITION'] = channel['bufferView']
 
                 if 'targets' not in gltf_primitive:
@@ -101,14 +104,21 @@ class GeomMixin(object):
 
     def make_geom(self, gltf_node, gltf_mesh, obj, can_merge=False):
         triangulate = True
-        if self._geom_scale != 1:
-            scale = obj.scale
-            obj.scale.x, obj.scale.y, obj.scale.z = [self._geom_scale] * 3
-            apply_modifiers(obj, triangulate=triangulate, apply_scale=True)
-            obj.scale = scale
+        if self._evaluated:
+            mesh = eval2mesh(
+                obj, triangulate=triangulate, scale=self._geom_scale,
+                loop_triangles=self._loop_triangles)
         else:
-            apply_modifiers(obj, triangulate=triangulate)
-        mesh = obj2mesh(obj, triangulate=triangulate)
+            if self._geom_scale != 1:
+                scale = obj.scale
+                obj.scale.x, obj.scale.y, obj.scale.z = [self._geom_scale] * 3
+                apply_modifiers(obj, triangulate=triangulate, apply_scale=True)
+                obj.scale = scale
+            else:
+                apply_modifiers(obj, triangulate=triangulate)
+            mesh = obj2mesh(
+                obj, triangulate=triangulate,
+                loop_triangles=self._loop_triangles)
 
         # setup shape key names for the primitives
         if mesh.shape_keys:
@@ -127,34 +137,22 @@ class GeomMixin(object):
                     continue
 
                 # material
-                for i, child in enumerate(self._root['materials']):  # existing material
-                    if child['name'] == material.name:
-                        gltf_materials[material.name] = i
-                        break
-                else:  # new material
+                matid = self._registry.get('materials', material.name)
+                if matid is None:  # new material
                     gltf_material = self.make_material(material)
-                    self._root['materials'].append(gltf_material)
-
-                    gltf_materials[material.name] = len(self._root['materials']) - 1
+                    matid = self._registry.add('materials', gltf_material)
+                gltf_materials[material.name] = matid
 
                 # textures
                 if not self._no_textures:
                     for type_, gltf_sampler, gltf_image in self.make_textures(material):
-                        tname = gltf_image['name']
-                        for i, child in enumerate(self._root['images']):  # existing texture
-                            if child['name'] == tname:
-                                texid = i
-                                break
-                        else:  # new texture
-                            self._root['samplers'].append(gltf_sampler)
-                            self._root['images'].append(gltf_image)
-
+                        texid = self._registry.get('images', gltf_image['name'])
+                        if texid is None:  # new texture
                             gltf_texture = {
-                                'sampler': len(self._root['samplers']) - 1,
-                                'source': len(self._root['images']) - 1,
+                                'sampler': self._registry.add('samplers', gltf_sampler),
+                                'source': self._registry.add('images', gltf_image),
                             }
-                            self._root['textures'].append(gltf_texture)
-                            texid = len(self._root['textures']) - 1
+                            texid = self._registry.add('textures', gltf_texture)
 
                         matid = gltf_materials[material.name]
                         if type(type_) == tuple and len(type_) == 2:
@@ -169,6 +167,34 @@ class GeomMixin(object):
                                 'texCoord': 0,
                             }
 
+        # merged meshes are made from multiple objects
+        cache_key = None
+        if self._cache is not None and not can_merge:
+            cache_key = self.get_geom_key(gltf_node, gltf_mesh, obj, mesh)
+
+        if cache_key and self.load_primitives(cache_key, gltf_mesh, gltf_materials):
+            pass
+        else:
+            if can_merge or self._legacy_geom:
+                self._make_primitives_legacy(
+                    gltf_node, gltf_mesh, obj, mesh, gltf_materials,
+                    can_merge=can_merge)
+            else:
+                self._make_primitives(
+                    gltf_node, gltf_mesh, obj, mesh, gltf_materials)
+
+            if cache_key:
+                self.save_primitives(cache_key, gltf_mesh, gltf_materials)
+
+        # evaluated meshes are the copies
+        if self._evaluated:
+            bpy.data.meshes.remove(mesh)
+
+    def _make_primitives_legacy(self, gltf_node, gltf_mesh, obj, mesh,
+                                gltf_materials, can_merge=False):
+        """
+        Makes primitives reading the mesh data loop by loop.
+        """
         # get primitives
         gltf_primitives = {}
         gltf_primitive_indices = {}  # splitted vertex buffers
@@ -201,25 +227,30 @@ class GeomMixin(object):
             #         max_joints = max(max_joints, joints)
 
             if 'skin' in gltf_node:
-                gltf_skin = self._root['skins'][gltf_node['skin']]
-
-                # for i, child in enumerate(self._root['skins']):
-                #     if child['name'] == armature.name:
-                #         gltf_joints = self._get_joints(child)
-                #         break
-                gltf_joints = self._get_joints(gltf_skin)
+                gltf_joints = self._get_joints(gltf_node['skin'])
 
         # get max joint layers (4 bones per layer)
         # max_joint_layers = math.ceil(max_joints / 4)
 
-        # panda3d-gltf is limited to 1 single layer only (up to 4 bones)
-        max_joint_layers = 1
+        # joints and weights of every vertex,
+        # limited and pruned the same way as in the vectorized path
+        if gltf_joints:
+            joints, weights = self._get_joints_weights(obj, mesh, gltf_joints)
 
         sharp_vertices = self.get_sharp_vertices(mesh)
-        uv_tb = self.get_tangent_bitangent(mesh)
         obj_matrix = self._transform(get_object_matrix(obj, armature=armature))
 
-        for polygon in mesh.polygons:
+        # tangents of the active uv layer only
+        uv_tb = {}
+        if mesh.uv_layers.active and not is_collision(obj):
+            uv_tb = self.get_tangent_bitangent(
+                mesh, [mesh.uv_layers.active.name])
+
+        polygons = mesh.polygons
+        if self._loop_triangles:
+            polygons = get_triangles(mesh)
+
+        for polygon in polygons:
             # <-- polygon
             material = None
             mname = None
@@ -231,6 +262,12 @@ class GeomMixin(object):
                 except IndexError:
                     pass
 
+            # start a new primitive if the indices don't fit into 16 bits
+            if (self._short_indices and mname in gltf_primitives and
+                    gltf_primitive_indices[mname] + len(polygon.vertices) > MAX_SHORT_INDEX):
+                del gltf_primitives[mname]
+                gltf_vertices.pop(mname, None)
+
             # get or create primitive
             if mname in gltf_primitives:
                 gltf_primitive = gltf_primitives[mname]
@@ -264,18 +301,15 @@ class GeomMixin(object):
                 # try to reuse shared vertices
                 if mname not in gltf_vertices:
                     gltf_vertices[mname] = {}
-                if (polygon.use_smooth and vertex_id in
+                key = self.get_weld_key(
+                    mesh, vertex_id, loop_id,
+                    normal=mesh.loops[loop_id].normal if use_smooth else polygon.normal)
+                if (polygon.use_smooth and key in
                         gltf_vertices[mname] and
                         not is_collision(obj)):
-                    shared = False
-                    for gltf_vertex_index, gltf_vertex_uv, gltf_vertex_normal in gltf_vertices[mname][vertex_id]:
-                        if self.can_share_vertex(mesh, vertex, loop_id, gltf_vertex_uv, gltf_vertex_normal):
-                            self._buffer.write(
-                                gltf_primitive['indices'], gltf_vertex_index)
-                            shared = True
-                            break
-                    if shared:
-                        continue
+                    self._buffer.write(
+                        gltf_primitive['indices'], gltf_vertices[mname][key])
+                    continue
 
                 # make new vertex data
                 can_merge_vertices = can_merge
@@ -289,7 +323,6 @@ class GeomMixin(object):
                     use_smooth=use_smooth, can_merge=can_merge_vertices)
 
                 # uv layers, active first
-                active_uv = 0, 0
                 if not is_collision(obj):
                     uv_layers = sorted(
                         mesh.uv_layers.items(), key=lambda x: not x[1].active)
@@ -302,13 +335,13 @@ class GeomMixin(object):
                             continue
 
                         u, v = uv_loop.uv.to_2d()
-                        if uv_layer.active:
-                            active_uv = u, v
                         self._write_uv(gltf_primitive, uv_id, u, v)
-                        if uv_name in uv_tb and uv_layer.active:
+                        if uv_name in uv_tb:
+                            tangents, bitangents, signs = uv_tb[uv_name]
                             self._write_tbs(
-                                obj_matrix, gltf_primitive,
-                                *uv_tb[uv_name][loop_id], can_merge=can_merge_vertices)
+                                obj_matrix, gltf_primitive, tangents[loop_id],
+                                bitangents[loop_id], signs[loop_id],
+                                can_merge=can_merge_vertices)
                         # vertex uv -->
 
                 # generate new ID, add vertex and save last ID
@@ -323,58 +356,14 @@ class GeomMixin(object):
                 gltf_primitive['extras']['highest_index'] = gltf_primitive_indices[mname]
 
                 # save vertex data for sharing
-                if vertex_id not in gltf_vertices[mname]:
-                    gltf_vertices[mname][vertex_id] = []
-                gltf_vertices[mname][vertex_id].append((
-                    idx, active_uv,
-                    mesh.loops[loop_id].normal if use_smooth else polygon.normal,
-                ))
+                gltf_vertices[mname].setdefault(key, idx)
 
                 # attach joints to vertex
                 if gltf_joints:
-                    joints_weights = []
-                    vertex_groups = reversed(sorted(
-                        vertex.groups, key=lambda vg: vg.weight))
-                    for vertex_group in vertex_groups:
-                        obj_vertex_group = obj.vertex_groups[vertex_group.group]
-
-                        # no bones with vertex group's name
-                        if obj_vertex_group.name not in gltf_joints:
-                            continue
-
-                        # weight is zero
-                        if vertex_group.weight <= 0:
-                            continue
-
-                        joint_id = gltf_joints[obj_vertex_group.name]
-                        joints_weights.append([joint_id, vertex_group.weight])
-
-                    # objects reparented to bone instead of entire armature
-                    if obj.parent_type == 'BONE' and obj.parent_bone in gltf_joints:
-                        joint_id = gltf_joints[obj.parent_bone]
-                        joints_weights.append([joint_id, 1])
-
-                    # padding
-                    while ((len(joints_weights) % 4 != 0) or
-                            (len(joints_weights) < max_joint_layers * 4)):
-                        joints_weights.append([0, 0])
-
-                    # limit by max joints
-                    joints_weights = joints_weights[:max_joint_layers * 4]
-
-                    imax = -1
-                    wmax = 0
-                    for j, (joint, weight) in enumerate(joints_weights):
-                        if weight > wmax:
-                            imax = j
-                            wmax = weight
-                    # if self._norm_weights and imax >= 0:
-                    #     joints_weights[imax][1] += 1 - sum(list(zip(*joints_weights))[1])
-                    if self._norm_weights:
-                        weights = list(zip(*joints_weights))[1]
-                        weights_sum = sum(weights)
-                        for j in range(len(joints_weights)):
-                            joints_weights[j][1] *= 1 / weights_sum
+                    joints_weights = [
+                        list(joint_weight) for joint_weight in zip(
+                            joints[vertex_id].tolist(),
+                            weights[vertex_id].tolist())]
 
                     # group by 4 joint-weight pairs
                     joints_weights_groups = []
@@ -389,3 +378,339 @@ class GeomMixin(object):
 
                 # vertex -->
             # polygon -->
+
+    def _get_joints_weights(self, obj, mesh, gltf_joints):
+        """
+        Returns (vertices, 4 * layers) arrays of joints and weights,
+        the strongest influences first.
+        """
+        num_vertices = len(mesh.vertices)
+        influences = self._max_influences
+
+        # vertex group index -> joint index
+        group_joints = np.full(len(obj.vertex_groups), -1, dtype=np.int64)
+        for obj_vertex_group in obj.vertex_groups:
+            group_joints[obj_vertex_group.index] = gltf_joints.get(
+                obj_vertex_group.name, -1)
+
+        # sparse (vertex, vertex group) weights
+        counts, groups, values = get_vertex_groups(mesh)
+        rows = np.repeat(np.arange(num_vertices), counts)
+        values = values.astype(np.float64)
+
+        joints = np.full(len(groups), -1, dtype=np.int64)
+        known = groups < len(group_joints)
+        joints[known] = group_joints[groups[known]]
+        mask = (joints >= 0) & (values > 0)
+        rows, joints, values = rows[mask], joints[mask], values[mask]
+
+        # dense (vertex, influence) matrices,
+        # ranks are the weights and -1 for the padding
+        counts = np.bincount(rows, minlength=num_vertices)
+        columns = np.arange(len(rows)) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        width = max(int(counts.max()) if num_vertices else 0, influences)
+        matrix_joints = np.zeros((num_vertices, width + 1), dtype=np.int64)
+        matrix_weights = np.zeros((num_vertices, width + 1), dtype=np.float64)
+        matrix_ranks = np.full((num_vertices, width + 1), -1, dtype=np.float64)
+        matrix_joints[rows, columns] = joints
+        matrix_weights[rows, columns] = values
+        matrix_ranks[rows, columns] = values
+
+        # objects reparented to bone instead of entire armature,
+        # the bone goes after the vertex groups
+        if obj.parent_type == 'BONE' and obj.parent_bone in gltf_joints:
+            rows = np.arange(num_vertices)
+            matrix_joints[rows, counts] = gltf_joints[obj.parent_bone]
+            matrix_weights[rows, counts] = 1
+            matrix_ranks[rows, counts] = 0
+            counts = counts + 1
+
+        # top influences, strongest first
+        top = np.argpartition(
+            -matrix_ranks, influences - 1, axis=1)[:, :influences]
+        top = np.take_along_axis(top, np.argsort(
+            -np.take_along_axis(matrix_ranks, top, axis=1),
+            axis=1, kind='stable'), axis=1)
+        joints = np.take_along_axis(matrix_joints, top, axis=1)
+        weights = np.take_along_axis(matrix_weights, top, axis=1)
+
+        # drop the weakest influences while the dropped weight,
+        # including the influences over budget, stays within the error
+        total = matrix_weights.sum(axis=1)
+        dropped = total - weights.sum(axis=1)
+        tail = np.cumsum(weights[:, ::-1], axis=1)[:, ::-1]
+        pruned = (
+            (tail + dropped[:, None] <= self._weight_error * total[:, None]) &
+            (weights > 0))
+        pruned[:, 0] = False
+        joints[pruned] = 0
+        weights[pruned] = 0
+
+        # renormalize vertices which lost influences
+        weights_sum = weights.sum(axis=1, keepdims=True)
+        if not self._norm_weights:
+            lost = (counts > influences) | pruned.any(axis=1)
+            weights_sum[~lost] = 1
+        np.divide(weights, weights_sum, out=weights, where=weights_sum > 0)
+
+        exceeded = int((counts > influences).sum())
+        if exceeded or pruned.any():
+            self.report(
+                '{exceeded} OF {total} VERTICES OF {name} EXCEED '
+                '{influences} JOINT INFLUENCES, '
+                '{pruned} INFLUENCES PRUNED'.format(**{
+                    'exceeded': exceeded,
+                    'total': num_vertices,
+                    'name': obj.name,
+                    'influences': influences,
+                    'pruned': int(pruned.sum()),
+                }))
+
+        # 4 influences per layer
+        padding = -influences % 4
+        joints = np.pad(joints, ((0, 0), (0, padding)))
+        weights = np.pad(weights, ((0, 0), (0, padding)))
+
+        return joints, weights
+
+    def _add_vertex_channels(self, gltf_primitive, uv_layers, arrays, joints_num):
+        """
+        Adds optional vertex attribute channels in the legacy path order.
+        """
+        for uv_id, uv_layer in uv_layers:
+            self._get_uv_channel(gltf_primitive, uv_id)
+            if uv_layer.active and 'tangents' in arrays:
+                self._get_tangent_channel(gltf_primitive)
+
+        if 'joints' in arrays:
+            for layer in range(arrays['joints'].shape[1] // 4):
+                self._get_joints_channel(gltf_primitive, layer, joints_num)
+                self._get_weights_channel(gltf_primitive, layer)
+
+    def _write_vertices(self, gltf_primitive, arrays, corners,
+                        obj_matrix, can_merge=False):
+        """
+        Writes vertex attributes of the polygon corners.
+        """
+        corners = np.array(corners, dtype=np.int64)
+        vertex_ids = arrays['vertex_ids'][corners]
+
+        matrix = np.array(self._matrix, dtype=np.float64)
+        rotation = None
+        if can_merge and not self._pose_freeze:
+            rotation = np.array(obj_matrix.to_euler().to_matrix(), dtype=np.float64)
+
+        def transform(vectors):
+            vectors = vectors.astype(np.float64)
+            if not self._z_up:
+                vectors = vectors @ matrix.T
+            if rotation is not None:
+                vectors = vectors @ rotation.T
+            return vectors
+
+        co = arrays['positions'][vertex_ids].astype(np.float64)
+        if not self._z_up:
+            co = co @ matrix.T
+        if rotation is not None:
+            obj_matrix = np.array(obj_matrix, dtype=np.float64)
+            co = co @ obj_matrix[:3, :3].T + obj_matrix[:3, 3]
+
+        attributes = gltf_primitive['attributes']
+        self._buffer.write_many(attributes['POSITION'], co)
+        self._buffer.write_many(
+            attributes['NORMAL'], transform(arrays['normals'][corners]))
+
+        for i, sk_co in enumerate(arrays['shape_keys']):
+            sk_co = sk_co[vertex_ids].astype(np.float64)
+            if not self._z_up:
+                sk_co = sk_co @ matrix.T
+            self._buffer.write_many(
+                gltf_primitive['targets'][i]['POSITION'], sk_co - co)
+
+        for uv_id, uvs in arrays['uvs'].items():
+            uv = uvs[corners].astype(np.float64)
+            uv[:, 1] = 1 - uv[:, 1]
+            self._buffer.write_many(attributes['TEXCOORD_{}'.format(uv_id)], uv)
+
+        if 'TANGENT' in attributes:
+            tangents = arrays['tangents'][corners]
+            self._buffer.write_many(attributes['TANGENT'], np.hstack([
+                transform(tangents[:, :3]), tangents[:, 3:]]))
+
+        if 'joints' in arrays:
+            joints = arrays['joints'][vertex_ids]
+            weights = arrays['weights'][vertex_ids]
+            for layer in range(joints.shape[1] // 4):
+                self._buffer.write_many(
+                    attributes['JOINTS_{}'.format(layer)],
+                    joints[:, layer * 4:layer * 4 + 4])
+                self._buffer.write_many(
+                    attributes['WEIGHTS_{}'.format(layer)],
+                    weights[:, layer * 4:layer * 4 + 4])
+
+    def _make_primitives(self, gltf_node, gltf_mesh, obj, mesh, gltf_materials):
+        """
+        Makes primitives from the mesh data read into arrays.
+        The output is the same as of the legacy path.
+        """
+        collision = is_collision(obj)
+        armature = get_armature(obj)
+        obj_matrix = self._transform(get_object_matrix(obj, armature=armature))
+
+        arrays = {
+            'positions': get_array(mesh.vertices, 'co', size=3),
+            'shape_keys': [],
+            'uvs': {},
+        }
+
+        for sk_name in gltf_mesh['extras']['targetNames']:
+            arrays['shape_keys'].append(get_array(
+                mesh.shape_keys.key_blocks[sk_name].data, 'co', size=3))
+
+        gltf_joints = {}
+        if armature and 'skin' in gltf_node:
+            gltf_joints = self._get_joints(gltf_node['skin'])
+            arrays['joints'], arrays['weights'] = self._get_joints_weights(
+                obj, mesh, gltf_joints)
+
+        # tangents of the active uv layer
+        active_layer = mesh.uv_layers.active
+        if active_layer and not collision:
+            tangents, _, signs = self.get_tangent_bitangent(
+                mesh, [active_layer.name])[active_layer.name]
+            arrays['tangents'] = np.hstack([tangents, signs[:, None]])
+
+        use_smooth = get_array(mesh.polygons, 'use_smooth', bool) & (not collision)
+        material_ids = get_array(mesh.polygons, 'material_index', np.int32)
+        polygon_normals = get_array(mesh.polygons, 'normal', size=3)
+        if self._loop_triangles:
+            # corners of the loop triangles in order of triangles,
+            # the triangles are used as polygons below
+            triangles = get_loop_triangles(mesh)
+            use_smooth = use_smooth[triangles['polygons']]
+            material_ids = material_ids[triangles['polygons']]
+            polygon_normals = triangles['normals']
+            polygon_ids = np.repeat(np.arange(len(triangles['polygons'])), 3)
+            loop_ids = triangles['loops'].reshape(-1)
+        else:
+            # polygon corners in order of polygons
+            loop_start = get_array(mesh.polygons, 'loop_start', np.int32)
+            loop_total = get_array(mesh.polygons, 'loop_total', np.int32)
+            corner_start = np.cumsum(loop_total) - loop_total
+            polygon_ids = np.repeat(np.arange(len(loop_total)), loop_total)
+            loop_ids = (
+                np.arange(len(polygon_ids)) +
+                np.repeat(loop_start - corner_start, loop_total))
+
+        arrays['vertex_ids'] = get_array(mesh.loops, 'vertex_index', np.int32)[loop_ids]
+        arrays['normals'] = np.where(
+            use_smooth[polygon_ids, None],
+            get_array(mesh.loops, 'normal', size=3)[loop_ids],
+            polygon_normals[polygon_ids])
+        if 'tangents' in arrays:
+            arrays['tangents'] = arrays['tangents'][loop_ids]
+
+        # uv layers, active first
+        uv_layers = []
+        active_uv = np.zeros((len(loop_ids), 2), dtype=np.float32)
+        if not collision:
+            for uv_id, (uv_name, uv_layer) in enumerate(sorted(
+                    mesh.uv_layers.items(), key=lambda x: not x[1].active)):
+                # not active layer and extra UV disabled
+                if not uv_layer.active and self._no_extra_uv:
+                    continue
+
+                uv_layers.append((uv_id, uv_layer))
+                arrays['uvs'][uv_id] = get_array(uv_layer.data, 'uv', size=2)[loop_ids]
+                if uv_layer.active:
+                    active_uv = arrays['uvs'][uv_id]
+
+        # material names of the polygons
+        materials = []
+        if not self._no_materials:
+            materials = [m.name if m else None for m in mesh.materials]
+        mnames = [
+            materials[i] if i < len(materials) else None
+            for i in material_ids.tolist()]
+        mcodes = {mname: i for i, mname in enumerate(dict.fromkeys(mnames))}
+        corner_codes = np.array(
+            [mcodes[mname] for mname in mnames], dtype=np.int32)[polygon_ids]
+
+        # weld keys of the corners: vertex, active UV and normal
+        # rounded to the weld tolerance in double precision like the legacy path
+        keys = [arrays['vertex_ids'][:, None].astype(np.int64)]
+        if active_layer:
+            keys.append(np.round(active_uv.astype(np.float64) / self._weld_tolerance))
+        keys.append(np.round(
+            arrays['normals'].astype(np.float64) / self._weld_tolerance))
+        keys = np.hstack(keys).astype(np.int64)
+
+        # vertices can be shared by the smooth polygons only
+        corner_smooth = use_smooth[polygon_ids]
+        is_new = np.ones(len(loop_ids), dtype=bool)
+        sources = np.arange(len(loop_ids))
+
+        chunks = []  # (first polygon, material name, corners)
+        for mname, code in mcodes.items():
+            corners = np.flatnonzero(corner_codes == code)
+            while len(corners):
+                _, first, inverse = np.unique(
+                    keys[corners], axis=0,
+                    return_index=True, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                chunk_new = (first[inverse] == np.arange(len(corners)))
+                chunk_new |= ~corner_smooth[corners]
+
+                # start a new primitive if the indices don't fit into 16 bits
+                size = len(corners)
+                if self._short_indices:
+                    overflow = np.flatnonzero(
+                        np.cumsum(chunk_new) > MAX_SHORT_INDEX + 1)
+                    if len(overflow):
+                        polygons = polygon_ids[corners]
+                        size = np.searchsorted(
+                            polygons, polygons[overflow[0]])
+
+                chunk = corners[:size]
+                chunk_first = first[inverse[:size]]
+                is_new[chunk] = chunk_new[:size]
+                sources[chunk] = np.where(
+                    chunk_new[:size], chunk, corners[chunk_first])
+                chunks.append((polygon_ids[chunk[0]], mname, chunk))
+                corners = corners[size:]
+
+        # shared vertex buffer is numbered in order of polygons
+        numbers = np.cumsum(is_new) - 1
+
+        can_merge_vertices = bool(armature)
+        gltf_primitives = []
+        for _, mname, chunk in sorted(chunks, key=lambda x: x[0]):
+            gltf_primitive = self._make_primitive(gltf_mesh, mesh)
+            gltf_mesh['primitives'].append(gltf_primitive)
+            gltf_primitives.append(gltf_primitive)
+            if mname in gltf_materials:
+                gltf_primitive['material'] = gltf_materials[mname]
+            self._add_vertex_channels(
+                gltf_primitive, uv_layers, arrays, len(gltf_joints))
+
+            chunk_new = is_new[chunk]
+            gltf_primitive['extras']['highest_index'] = int(chunk_new.sum()) - 1
+            if self._split_primitives:
+                local = np.zeros(len(loop_ids), dtype=np.int64)
+                local[chunk] = np.cumsum(chunk_new) - 1
+                indices = local[sources[chunk]]
+            else:
+                indices = numbers[sources[chunk]]
+            self._buffer.write_many(gltf_primitive['indices'], indices.tolist())
+
+            if self._split_primitives:
+                self._write_vertices(
+                    gltf_primitive, arrays, chunk[chunk_new].tolist(),
+                    obj_matrix, can_merge=can_merge_vertices)
+
+        if gltf_primitives and not self._split_primitives:
+            # vertex buffer is shared by all the primitives
+            self._write_vertices(
+                gltf_primitives[0], arrays, np.flatnonzero(is_new).tolist(),
+                obj_matrix, can_merge=can_merge_vertices)
@@ -0,0 +1,160 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+
+from kitsunetsuki.base.armature import get_armature
+from kitsunetsuki.base.objects import get_modifiers_key, is_collision
+
+from . import spec
+
+
+# node properties written into the instancing accessors
+INSTANCE_ATTRIBUTES = (
+    ('translation', 'TRANSLATION', 'VEC3', [0, 0, 0]),
+    ('rotation', 'ROTATION', 'VEC4', [0, 0, 0, 1]),
+    ('scale', 'SCALE', 'VEC3', [1, 1, 1]),
+)
+
+
+class InstancingMixin(object):
+    def get_instance_key(self, obj):
+        """
+        Returns the key of the objects sharing the same glTF mesh
+        or None if the mesh can't be shared.
+        """
+        # skinned and collision meshes depend on the object
+        if get_armature(obj) or is_collision(obj):
+            return None
+
+        if obj.type != 'MESH' or obj.data.users < 2:
+            return None
+
+        materials = tuple(
+            slot.material.name if slot.material else None
+            for slot in obj.material_slots)
+        return obj.data.name, get_modifiers_key(obj), materials
+
+    def _get_animated_nodes(self):
+        results = set()
+        for gltf_animation in self._root['animations']:
+            for gltf_channel in gltf_animation['channels']:
+                results.add(gltf_channel['target'].get('node'))
+
+        return results
+
+    def _make_gpu_instances(self, node_ids):
+        """
+        Turns the first node into the instances of all the nodes.
+        """
+        gltf_node = self._root['nodes'][node_ids[0]]
+
+        attributes = {}
+        for key, name, type_, default in INSTANCE_ATTRIBUTES:
+            channel = self._buffer.add_channel({
+                'componentType': spec.TYPE_FLOAT,
+                'type': type_,
+                'extras': {
+                    'reference': name,
+                },
+            })
+            self._buffer.write_many(channel['bufferView'], [
+                self._root['nodes'][node_id].get(key, default)
+                for node_id in node_ids])
+            attributes[name] = channel['bufferView']
+            gltf_node.pop(key, None)
+
+        gltf_node['extensions'] = {
+            'EXT_mesh_gpu_instancing': {
+                'attributes': attributes,
+            },
+        }
+
+    def remap_nodes(self, node_ids):
+        """
+        Updates the node references by the new node IDs (old ID -> new ID).
+        """
+        for gltf_scene in self._root['scenes']:
+            gltf_scene['nodes'] = [node_ids[i] for i in gltf_scene['nodes']]
+
+        for gltf_node in self._root['nodes']:
+            if 'children' in gltf_node:
+                gltf_node['children'] = [
+                    node_ids[i] for i in gltf_node['children']]
+
+        for gltf_skin in self._root['skins']:
+            gltf_skin['joints'] = [node_ids[i] for i in gltf_skin['joints']]
+            if 'skeleton' in gltf_skin:
+                gltf_skin['skeleton'] = node_ids[gltf_skin['skeleton']]
+
+        for gltf_animation in self._root['animations']:
+            for gltf_channel in gltf_animation['channels']:
+                gltf_target = gltf_channel['target']
+                if 'node' in gltf_target:
+                    gltf_target['node'] = node_ids[gltf_target['node']]
+
+    def _remove_nodes(self, removed):
+        """
+        Removes the nodes, which are not referenced anymore.
+        """
+        kept = [
+            node_id for node_id in range(len(self._root['nodes']))
+            if node_id not in removed]
+        node_ids = {node_id: i for i, node_id in enumerate(kept)}
+
+        # new list is indexed by the registry from scratch
+        self._root['nodes'] = [self._root['nodes'][i] for i in kept]
+        self.remap_nodes(node_ids)
+
+    def make_gpu_instances(self):
+        """
+        Collapses sibling nodes of the same mesh
+        into the single EXT_mesh_gpu_instancing node.
+        The collapsed nodes are removed.
+        """
+        animated = self._get_animated_nodes()
+        parents = [self._root['scenes'][0]['nodes']]
+        for gltf_node in self._root['nodes']:
+            if 'children' in gltf_node:
+                parents.append(gltf_node['children'])
+
+        removed = set()
+        for children in parents:
+            siblings = {}  # mesh ID and extras -> node IDs
+            for node_id in children:
+                gltf_node = self._root['nodes'][node_id]
+                if ('mesh' not in gltf_node or node_id in animated or
+                        set(gltf_node) & {'children', 'skin', 'extensions'}):
+                    continue
+
+                key = gltf_node['mesh'], json.dumps(
+                    gltf_node.get('extras') or {}, sort_keys=True)
+                siblings.setdefault(key, []).append(node_id)
+
+            for node_ids in siblings.values():
+                if len(node_ids) < self._gpu_instancing:
+                    continue
+
+                self._make_gpu_instances(node_ids)
+                collapsed = set(node_ids[1:])
+                children[:] = [i for i in children if i not in collapsed]
+                removed.update(collapsed)
+
+        if removed:
+            self._remove_nodes(removed)
+            if 'extensionsUsed' not in self._root:
+                self._root['extensionsUsed'] = []
+            if 'EXT_mesh_gpu_instancing' not in self._root['extensionsUsed']:
+                self._root['extensionsUsed'].append('EXT_mesh_gpu_instancing')
@@ -0,0 +1,191 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from kitsunetsuki.base.optimize import optimize_overdraw, tipsify
+from kitsunetsuki.base.simplify import MIN_REDUCTION, simplify
+
+from . import spec
+
+
+class LODMixin(object):
+    def _simplify_primitive(self, gltf_primitive, ratio):
+        """
+        Returns simplified indices of the primitive.
+        UV seams are kept.
+        """
+        positions = self._buffer.get_array(
+            gltf_primitive['attributes']['POSITION'])
+        uvs = [
+            self._buffer.get_array(channel_id).reshape(len(positions), -1)
+            for name, channel_id in sorted(
+                gltf_primitive['attributes'].items())
+            if name.startswith('TEXCOORD_')]
+        indices, _ = simplify(
+            positions, self._buffer.get_array(gltf_primitive['indices']),
+            ratio, max_error=self._lod_error,
+            attributes=np.hstack(uvs) if uvs else None)
+        if self._optimize:
+            indices = optimize_overdraw(
+                tipsify(indices, len(positions)), positions)
+        return indices
+
+    def _make_lod_primitive(self, gltf_primitive, indices):
+        """
+        Returns primitive with simplified indices,
+        sharing the vertex channels with the source primitive.
+        """
+        # indices go into the buffer file of the vertex channels
+        self._buffer.partition = self._buffer.get_partition(
+            gltf_primitive['attributes']['POSITION'])
+        channel = self._buffer.add_channel({
+            'componentType': spec.TYPE_UNSIGNED_INT,
+            'type': 'SCALAR',
+            'extras': {
+                'reference': 'indices',
+            },
+        }, target=spec.ELEMENT_ARRAY_BUFFER)
+        self._buffer.partition = None
+        self._buffer.write_many(channel['bufferView'], indices.tolist())
+
+        gltf_lod_primitive = dict(gltf_primitive)
+        gltf_lod_primitive['indices'] = channel['bufferView']
+        return gltf_lod_primitive
+
+    def _make_lod_meshes(self, gltf_mesh):
+        """
+        Returns IDs and ratios of the simplified meshes.
+        Levels which don't reduce the triangles of the previous level
+        are skipped.
+        """
+        results = []
+
+        primitive_ids = []
+        count = 0  # triangles of the previous level
+        for i, gltf_primitive in enumerate(gltf_mesh['primitives']):
+            mode = gltf_primitive.get('mode', spec.MODE_TRIANGLES)
+            if mode == spec.MODE_TRIANGLES:
+                primitive_ids.append(i)
+                count += len(self._buffer.get_array(
+                    gltf_primitive['indices'])) // 3
+
+        for ratio in self._lods:
+            lod_indices = {
+                i: self._simplify_primitive(gltf_mesh['primitives'][i], ratio)
+                for i in primitive_ids}
+            lod_count = sum(
+                len(indices) for indices in lod_indices.values()) // 3
+            if lod_count > count * (1 - MIN_REDUCTION):
+                continue
+            count = lod_count
+
+            gltf_lod_mesh = dict(gltf_mesh)
+            gltf_lod_mesh['name'] = '{}.LOD{}'.format(
+                gltf_mesh['name'], len(results) + 1)
+            gltf_lod_mesh['primitives'] = []
+            for i, gltf_primitive in enumerate(gltf_mesh['primitives']):
+                if i in lod_indices:
+                    gltf_primitive = self._make_lod_primitive(
+                        gltf_primitive, lod_indices[i])
+                gltf_lod_mesh['primitives'].append(gltf_primitive)
+
+            self._root['meshes'].append(gltf_lod_mesh)
+            results.append((len(self._root['meshes']) - 1, ratio))
+
+        return results
+
+    def _get_scene_nodes(self):
+        """
+        Returns IDs of the nodes reachable from the scenes.
+        """
+        results = set()
+
+        node_ids = []
+        for gltf_scene in self._root['scenes']:
+            node_ids.extend(gltf_scene.get('nodes', []))
+        while node_ids:
+            node_id = node_ids.pop()
+            if node_id not in results:
+                results.add(node_id)
+                node_ids.extend(
+                    self._root['nodes'][node_id].get('children', []))
+
+        return results
+
+    def make_lods(self):
+        """
+        Generates simplified meshes for every mesh node
+        as MSFT_lod alternate nodes.
+        """
+        lod_meshes = {}  # mesh ID -> LOD mesh IDs
+
+        scene_nodes = self._get_scene_nodes()
+        for node_id, gltf_node in enumerate(list(self._root['nodes'])):
+            if 'mesh' not in gltf_node:
+                continue
+
+            # nodes left out of the scenes
+            if node_id not in scene_nodes:
+                continue
+
+            # keep collision shapes as they are
+            if 'BLENDER_physics' in gltf_node.get('extensions', {}):
+                continue
+
+            mesh_id = gltf_node['mesh']
+            if mesh_id not in lod_meshes:
+                lod_meshes[mesh_id] = self._make_lod_meshes(
+                    self._root['meshes'][mesh_id])
+            if not lod_meshes[mesh_id]:
+                continue
+
+            node_ids = []
+            ratios = []
+            for i, (lod_mesh_id, ratio) in enumerate(lod_meshes[mesh_id], 1):
+                gltf_lod_node = {
+                    'name': '{}.LOD{}'.format(gltf_node['name'], i),
+                    'mesh': lod_mesh_id,
+                }
+                for key in ('translation', 'rotation', 'scale', 'skin'):
+                    if key in gltf_node:
+                        gltf_lod_node[key] = gltf_node[key]
+
+                # GPU instanced levels
+                extensions = gltf_node.get('extensions', {})
+                if 'EXT_mesh_gpu_instancing' in extensions:
+                    gltf_lod_node['extensions'] = {
+                        'EXT_mesh_gpu_instancing': (
+                            extensions['EXT_mesh_gpu_instancing']),
+                    }
+
+                self._root['nodes'].append(gltf_lod_node)
+                node_ids.append(len(self._root['nodes']) - 1)
+                ratios.append(ratio)
+
+            if 'extensions' not in gltf_node:
+                gltf_node['extensions'] = {}
+            gltf_node['extensions']['MSFT_lod'] = {'ids': node_ids}
+
+            # LOD ratios are used as the screen coverage of the levels
+            if 'extras' not in gltf_node:
+                gltf_node['extras'] = {}
+            gltf_node['extras']['MSFT_screencoverage'] = ratios + [0]
+
+        if any(lod_meshes.values()):
+            if 'extensionsUsed' not in self._root:
+                self._root['extensionsUsed'] = []
+            if 'MSFT_lod' not in self._root['extensionsUsed']:
+                self._root['extensionsUsed'].append('MSFT_lod')
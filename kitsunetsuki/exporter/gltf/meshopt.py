@@ -0,0 +1,379 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+EXT_meshopt_compression encoders, compatible with
+the meshoptimizer vertex codec v0, index buffer codec v1
+and index sequence codec v1.
+"""
+
+import numpy as np
+
+
+MODE_ATTRIBUTES = 'ATTRIBUTES'
+MODE_TRIANGLES = 'TRIANGLES'
+MODE_INDICES = 'INDICES'
+
+VERTEX_HEADER = 0xa0
+VERTEX_BLOCK_SIZE_BYTES = 8192
+VERTEX_BLOCK_MAX_SIZE = 256
+BYTE_GROUP_SIZE = 16
+TAIL_MAX_SIZE = 32
+
+INDEX_HEADER = 0xe1
+INDEX_SEQUENCE_HEADER = 0xd1
+FIFO_SIZE = 16
+
+# triangle vertex orders rotating the matched edge first
+TRIANGLE_ORDERS = ((0, 1, 2), (1, 2, 0), (2, 0, 1))
+
+# static table of the most frequent FIFO codes of the two vertices,
+# it's written at the end of the data
+CODE_AUX_TABLE = bytes((
+    0x00, 0x76, 0x87, 0x56, 0x67, 0x78, 0xa9, 0x86,
+    0x65, 0x89, 0x68, 0x98, 0x01, 0x69, 0x00, 0x00))
+
+
+def can_encode(mode, stride):
+    if mode == MODE_ATTRIBUTES:
+        return stride % 4 == 0 and 0 < stride <= 256
+    if mode in (MODE_TRIANGLES, MODE_INDICES):
+        return stride in (2, 4)
+    return False
+
+
+def _get_block_size(stride):
+    size = (VERTEX_BLOCK_SIZE_BYTES // stride) & ~(BYTE_GROUP_SIZE - 1)
+    return min(size, VERTEX_BLOCK_MAX_SIZE)
+
+
+def _encode_blocks(deltas):
+    """
+    Encodes zigzag deltas of the vertex blocks of the same size.
+    Deltas shape is (blocks, vertex size, vertices),
+    where the number of vertices is aligned to the byte group size.
+    """
+    num_blocks, stride, num_vertices = deltas.shape
+    num_groups = num_vertices // BYTE_GROUP_SIZE
+    groups = deltas.reshape(num_blocks, stride, num_groups, BYTE_GROUP_SIZE)
+
+    # group size for every bit count: 1 (zeros), 2, 4, 8 (raw bytes)
+    escapes2 = groups >= 0x3
+    escapes4 = groups >= 0xf
+    sizes = np.stack([
+        np.where(groups.any(axis=-1), np.iinfo(np.int32).max, 0),
+        4 + escapes2.sum(axis=-1),
+        8 + escapes4.sum(axis=-1),
+        np.full(groups.shape[:-1], 16),
+    ], axis=-1)
+
+    # first minimum in order of 8, 1, 2, 4 bits
+    order = np.array([3, 0, 1, 2])
+    bitslog2 = order[np.argmin(sizes[..., order], axis=-1)]
+
+    # packed values are followed by the escaped values
+    data = np.zeros(groups.shape[:-1] + (2 * BYTE_GROUP_SIZE,), dtype=np.uint8)
+    lengths = np.zeros(groups.shape[:-1] + (2,), dtype=np.int64)
+
+    for log2, bits, escapes in ((1, 2, escapes2), (2, 4, escapes4)):
+        mask = bitslog2 == log2
+        if not mask.any():
+            continue
+
+        values = groups[mask]
+        sentinel = (1 << bits) - 1
+        per_byte = 8 // bits
+        packed = np.minimum(values, sentinel).astype(np.uint8)
+        packed = packed.reshape(len(values), -1, per_byte)
+        shifts = np.arange(per_byte - 1, -1, -1, dtype=np.uint8) * bits
+        packed = np.bitwise_or.reduce(packed << shifts, axis=-1)
+
+        escaped = escapes[mask]
+        rows = np.take_along_axis(
+            values, np.argsort(~escaped, axis=-1, kind='stable'), axis=-1)
+
+        data[mask, :packed.shape[1]] = packed
+        data[mask, BYTE_GROUP_SIZE:] = rows
+        lengths[mask, 0] = packed.shape[1]
+        lengths[mask, 1] = escaped.sum(axis=-1)
+
+    mask = bitslog2 == 3
+    data[mask, :BYTE_GROUP_SIZE] = groups[mask]
+    lengths[mask, 0] = BYTE_GROUP_SIZE
+
+    columns = np.arange(BYTE_GROUP_SIZE)
+    valid = np.concatenate([
+        columns < lengths[..., :1],
+        columns < lengths[..., 1:],
+    ], axis=-1)
+
+    # 2-bit headers, 4 groups per byte, starting from the low bits
+    num_headers = (num_groups + 3) // 4
+    headers = np.zeros((num_blocks, stride, num_headers * 4), dtype=np.uint8)
+    headers[..., :num_groups] = bitslog2
+    headers = headers.reshape(num_blocks, stride, num_headers, 4)
+    headers = np.bitwise_or.reduce(
+        headers << np.array([0, 2, 4, 6], dtype=np.uint8), axis=-1)
+
+    # every byte lane is a header followed by the groups
+    data = np.concatenate([
+        headers, data.reshape(num_blocks, stride, -1)], axis=-1)
+    valid = np.concatenate([
+        np.ones(headers.shape, dtype=bool),
+        valid.reshape(num_blocks, stride, -1)], axis=-1)
+
+    return data[valid]
+
+
+def encode_vertex_buffer(data, stride):
+    """
+    Encodes vertex data with a byte stride divisible by 4
+    using the meshoptimizer vertex codec.
+    """
+    vertices = np.frombuffer(data, dtype=np.uint8).reshape(-1, stride)
+
+    # byte deltas with the previous vertex, the first vertex is
+    # encoded against itself
+    deltas = np.empty_like(vertices)
+    deltas[0] = 0
+    np.subtract(vertices[1:], vertices[:-1], out=deltas[1:])
+    deltas = (deltas << 1) ^ np.where(deltas & 0x80, 0xff, 0).astype(np.uint8)
+
+    block_size = _get_block_size(stride)
+    num_full = len(vertices) // block_size
+
+    parts = [np.array([VERTEX_HEADER], dtype=np.uint8)]
+    if num_full:
+        blocks = deltas[:num_full * block_size]
+        blocks = blocks.reshape(num_full, block_size, stride)
+        parts.append(_encode_blocks(blocks.transpose(0, 2, 1)))
+
+    tail = deltas[num_full * block_size:]
+    if len(tail):
+        aligned = -(-len(tail) // BYTE_GROUP_SIZE) * BYTE_GROUP_SIZE
+        blocks = np.zeros((1, stride, aligned), dtype=np.uint8)
+        blocks[0, :, :len(tail)] = tail.T
+        parts.append(_encode_blocks(blocks))
+
+    # the first vertex is stored at the end, padded to the tail size
+    parts.append(np.zeros(max(TAIL_MAX_SIZE - stride, 0), dtype=np.uint8))
+    parts.append(vertices[0])
+
+    return np.concatenate(parts).tobytes()
+
+
+def _encode_varints(values):
+    """
+    Encodes 32-bit values as 7 bits per byte variable length integers.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    shifts = np.arange(5, dtype=np.uint64) * 7
+    sizes = 1 + (values[:, None] >> shifts[1:] != 0).sum(axis=-1)
+    varints = ((values[:, None] >> shifts) & 0x7f).astype(np.uint8)
+    columns = np.arange(5)
+    varints[columns < sizes[:, None] - 1] |= 0x80
+    return varints[columns < sizes[:, None]].tobytes()
+
+
+def _zigzag(deltas):
+    """
+    Returns zigzag encoded 32-bit deltas.
+    """
+    deltas = np.asarray(deltas, dtype=np.int64) & 0xffffffff
+    return ((deltas << 1) & 0xffffffff) ^ np.where(
+        deltas & 0x80000000, 0xffffffff, 0)
+
+
+class _Fifo(object):
+    """
+    Ring buffer of the last pushed items,
+    the items are looked up by the latest push.
+    """
+    def __init__(self):
+        self._pushes = {}  # item -> latest push number
+        self._count = 0
+
+    def get(self, item):
+        """
+        Returns the age of the item, 0 for the last pushed one,
+        or -1 if it's out of the ring buffer.
+        """
+        age = self._count - 1 - self._pushes.get(item, -FIFO_SIZE - 1)
+        return age if age < FIFO_SIZE else -1
+
+    def push(self, item):
+        self._pushes[item] = self._count
+        self._count += 1
+
+    def clear(self):
+        self._pushes.clear()
+
+
+def encode_index_buffer(data, stride):
+    """
+    Encodes 16-bit or 32-bit triangle list indices
+    using the meshoptimizer index buffer codec.
+    """
+    indices = np.frombuffer(data, dtype='<u2' if stride == 2 else '<u4')
+    triangles = indices.astype(np.int64).reshape(-1, 3).tolist()
+
+    edge_fifo = _Fifo()
+    vertex_fifo = _Fifo()
+    codes = bytearray()
+    parts = []  # aux codes and free indices in order of triangles
+    free = []  # zigzag deltas of the free indices since the last part
+    next_index = 0
+    last = 0
+
+    def add_free(index):
+        nonlocal last
+        free.append(index - last)
+        last = index
+
+    def add_aux(code):
+        if free:
+            parts.append(_encode_varints(_zigzag(free)))
+            del free[:]
+        parts.append(bytes((code,)))
+
+    for triangle in triangles:
+        # the most recent edge of the triangle, which is in the FIFO
+        matches = [
+            (edge_fifo.get((triangle[i], triangle[(i + 1) % 3])), i)
+            for i in range(3)]
+        matches = [match for match in matches if match[0] >= 0]
+        age, rotation = min(matches) if matches else (-1, 0)
+
+        if 0 <= age < FIFO_SIZE - 1:
+            a, b, c = (triangle[i] for i in TRIANGLE_ORDERS[rotation])
+
+            fc = vertex_fifo.get(c)
+            if 1 <= fc < 13:
+                fec = fc
+            elif c == next_index:
+                fec = 0
+                next_index += 1
+            elif c + 1 == last:  # strip-like sequences
+                fec = 13
+                last = c
+            elif c == last + 1:
+                fec = 14
+                last = c
+            else:
+                fec = 15
+
+            codes.append((age << 4) | fec)
+            if fec == 15:
+                add_free(c)
+            if fec == 0 or fec >= 13:
+                vertex_fifo.push(c)
+
+            edge_fifo.push((c, b))
+            edge_fifo.push((a, c))
+        else:
+            rotation = (
+                1 if triangle[1] == next_index else
+                2 if triangle[2] == next_index else 0)
+            a, b, c = (triangle[i] for i in TRIANGLE_ORDERS[rotation])
+
+            reset = (a, b, c) == (0, 1, 2) and next_index > 0
+            if reset:
+                next_index = 0
+                vertex_fifo.clear()
+
+            fb = vertex_fifo.get(b)
+            fc = vertex_fifo.get(c)
+
+            fea = 15
+            if a == next_index:
+                fea = 0
+                next_index += 1
+
+            feb = 15
+            if 0 <= fb < 14:
+                feb = fb + 1
+            elif b == next_index:
+                feb = 0
+                next_index += 1
+
+            fec = 15
+            if 0 <= fc < 14:
+                fec = fc + 1
+            elif c == next_index:
+                fec = 0
+                next_index += 1
+
+            aux = (feb << 4) | fec
+            aux_index = CODE_AUX_TABLE.find(bytes((aux,)))
+            if fea == 0 and 0 <= aux_index < 14 and not reset:
+                codes.append(0xf0 | aux_index)
+            else:
+                codes.append(0xf0 | 14 | fea)
+                add_aux(aux)
+
+            for index, fe in ((a, fea), (b, feb), (c, fec)):
+                if fe == 15:
+                    add_free(index)
+
+            for index, fe in ((a, fea), (b, feb), (c, fec)):
+                if fe == 0 or fe == 15:
+                    vertex_fifo.push(index)
+
+            edge_fifo.push((b, a))
+            edge_fifo.push((c, b))
+            edge_fifo.push((a, c))
+
+    if free:
+        parts.append(_encode_varints(_zigzag(free)))
+
+    return b''.join([bytes([INDEX_HEADER]), codes] + parts + [CODE_AUX_TABLE])
+
+
+def encode_index_sequence(data, stride):
+    """
+    Encodes 16-bit or 32-bit index data
+    using the meshoptimizer index sequence codec.
+    """
+    indices = np.frombuffer(data, dtype='<u2' if stride == 2 else '<u4')
+    indices = indices.astype(np.int64)
+
+    # deltas from one of two baselines, the baseline is switched
+    # when the delta from the previous index is big,
+    # because the previous index is the last index of the current baseline
+    previous = np.concatenate([[0], indices[:-1]])
+    deltas = (indices - previous + 0x80000000) % 0x100000000 - 0x80000000
+    baselines = np.cumsum(np.abs(deltas) >= 30) % 2
+
+    # last index of the same baseline
+    lasts = np.zeros(len(indices), dtype=np.int64)
+    for baseline in (0, 1):
+        positions = np.flatnonzero(baselines == baseline)
+        lasts[positions[1:]] = indices[positions[:-1]]
+
+    values = ((_zigzag(indices - lasts) << 1) & 0xffffffff) | baselines
+
+    return b''.join([
+        bytes([INDEX_SEQUENCE_HEADER]),
+        _encode_varints(values),
+        b'\0' * 4,
+    ])
+
+
+def encode(data, mode, stride):
+    if mode == MODE_TRIANGLES:
+        return encode_index_buffer(data, stride)
+    if mode == MODE_INDICES:
+        return encode_index_sequence(data, stride)
+    return encode_vertex_buffer(data, stride)
@@ -0,0 +1,86 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from kitsunetsuki.base.optimize import (
+    get_acmr, get_atvr, optimize_overdraw, optimize_vertex_fetch, tipsify)
+
+from . import spec
+
+
+class OptimizeMixin(object):
+    def _optimize_primitives(self, gltf_primitives):
+        """
+        Reorders triangles and vertices of the primitives,
+        which share the same vertex channels.
+        """
+        attributes = gltf_primitives[0]['attributes']
+        positions = self._buffer.get_array(attributes['POSITION'])
+        vertex_count = len(positions)
+
+        indices = [
+            self._buffer.get_array(gltf_primitive['indices']).reshape(-1)
+            for gltf_primitive in gltf_primitives]
+        before = np.concatenate(indices)
+
+        indices = [
+            optimize_overdraw(tipsify(i, vertex_count), positions)
+            for i in indices]
+        after, order = optimize_vertex_fetch(
+            np.concatenate(indices), vertex_count)
+
+        start = 0
+        for gltf_primitive, primitive_indices in zip(gltf_primitives, indices):
+            end = start + len(primitive_indices)
+            self._buffer.set_array(
+                gltf_primitive['indices'], after[start:end],
+                spec.TYPE_UNSIGNED_INT)
+            start = end
+
+        channel_ids = set(attributes.values())
+        for gltf_target in gltf_primitives[0].get('targets', []):
+            channel_ids.update(gltf_target.values())
+        for channel_id in sorted(channel_ids):
+            self._buffer.remap(channel_id, order)
+
+        return before, after
+
+    def optimize(self):
+        """
+        Optimizes meshes for the post-transform vertex cache,
+        the overdraw and the vertex fetch.
+        """
+        for gltf_mesh in self._root['meshes']:
+            groups = {}  # primitives by the shared vertex channels
+            for gltf_primitive in gltf_mesh['primitives']:
+                mode = gltf_primitive.get('mode', spec.MODE_TRIANGLES)
+                if mode != spec.MODE_TRIANGLES:
+                    continue
+
+                position = gltf_primitive['attributes']['POSITION']
+                groups.setdefault(position, []).append(gltf_primitive)
+
+            for gltf_primitives in groups.values():
+                before, after = self._optimize_primitives(gltf_primitives)
+                self.report(
+                    'OPTIMIZED MESH {name}: ACMR {acmr1:.3f} -> {acmr2:.3f}, '
+                    'ATVR {atvr1:.3f} -> {atvr2:.3f}'.format(**{
+                        'name': gltf_mesh['name'],
+                        'acmr1': get_acmr(before),
+                        'acmr2': get_acmr(after),
+                        'atvr1': get_atvr(before),
+                        'atvr2': get_atvr(after),
+                    }))
@@ -0,0 +1,230 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import mathutils  # make sure to "import bpy" before
+import numpy as np
+
+from . import spec
+
+
+# default bit budgets for KHR_mesh_quantization
+QUANTIZE_BITS = {
+    'position': 16,
+    'normal': 8,
+    'tangent': 8,
+    'texcoord': 16,
+    'weights': 8,
+}
+
+SIGNED_TYPES = {
+    8: spec.TYPE_BYTE,
+    16: spec.TYPE_SHORT,
+}
+
+UNSIGNED_TYPES = {
+    8: spec.TYPE_UNSIGNED_BYTE,
+    16: spec.TYPE_UNSIGNED_SHORT,
+}
+
+
+class QuantizeMixin(object):
+    def _get_mesh_nodes(self):
+        """
+        Returns node IDs for every mesh ID,
+        which positions can be dequantized by the node transform.
+        """
+        results = {}
+        excluded = set()
+
+        animated = set()
+        for gltf_animation in self._root.get('animations', []):
+            for gltf_channel in gltf_animation['channels']:
+                animated.add(gltf_channel['target']['node'])
+
+        for node_id, gltf_node in enumerate(self._root['nodes']):
+            physics = gltf_node.get('extensions', {}).get('BLENDER_physics')
+            if physics:
+                for shape in physics['collisionShapes']:
+                    if 'mesh' in shape:
+                        excluded.add(shape['mesh'])
+
+            if 'mesh' not in gltf_node:
+                continue
+
+            # skinned meshes ignore node transform,
+            # collision shapes and animations depend on node transform,
+            # GPU instances are transformed before the node transform
+            instanced = 'EXT_mesh_gpu_instancing' in gltf_node.get('extensions', {})
+            if 'skin' in gltf_node or physics or instanced or node_id in animated:
+                excluded.add(gltf_node['mesh'])
+
+            results.setdefault(gltf_node['mesh'], []).append(node_id)
+
+        for mesh_id in excluded:
+            results.pop(mesh_id, None)
+
+        return results
+
+    def _dequantize_node(self, gltf_node, offset, scale):
+        """
+        Appends dequantization transform to the node transform
+        and compensates it for the children nodes.
+        """
+        translation = mathutils.Vector(gltf_node.get('translation', (0, 0, 0)))
+        x, y, z, w = gltf_node.get('rotation', (0, 0, 0, 1))
+        rotation = mathutils.Quaternion((w, x, y, z))
+        node_scale = mathutils.Vector(gltf_node.get('scale', (1, 1, 1)))
+
+        offset = mathutils.Vector(offset)
+        translation += rotation @ (node_scale * offset)
+
+        gltf_node.update({
+            'rotation': [x, y, z, w],
+            'scale': list(node_scale * scale),
+            'translation': list(translation),
+        })
+
+        for child_id in gltf_node.get('children', []):
+            gltf_child = self._root['nodes'][child_id]
+            child_translation = mathutils.Vector(
+                gltf_child.get('translation', (0, 0, 0)))
+            child_scale = mathutils.Vector(gltf_child.get('scale', (1, 1, 1)))
+            gltf_child['translation'] = list((child_translation - offset) / scale)
+            gltf_child['scale'] = list(child_scale / scale)
+
+    def _quantize_positions(self, gltf_mesh, gltf_nodes, bits):
+        position_ids = set()
+        target_ids = set()
+        for gltf_primitive in gltf_mesh['primitives']:
+            position_ids.add(gltf_primitive['attributes']['POSITION'])
+            for gltf_target in gltf_primitive.get('targets', []):
+                target_ids.add(gltf_target['POSITION'])
+
+        positions = [self._buffer.get_array(i) for i in sorted(position_ids)]
+        positions = [values for values in positions if len(values)]
+        if not positions:
+            return False
+
+        lower = np.min([values.min(axis=0) for values in positions], axis=0)
+        upper = np.max([values.max(axis=0) for values in positions], axis=0)
+        offset = (lower + upper) / 2
+        scale = float(np.max(upper - lower)) / 2 or 1
+        del positions
+
+        for channel_id in position_ids:
+            self._buffer.quantize(
+                channel_id, SIGNED_TYPES[bits], offset=offset, scale=scale)
+
+        # morph target deltas stay float, but in the quantized space
+        for channel_id in target_ids:
+            values = self._buffer.get_array(channel_id)
+            self._buffer.set_array(channel_id, values / scale, spec.TYPE_FLOAT)
+
+        for gltf_node in gltf_nodes:
+            self._dequantize_node(gltf_node, offset.tolist(), scale)
+
+        return True
+
+    def _quantize_texcoord(self, channel_id, bits):
+        """
+        Returns True if the texture coordinates
+        are quantized to the signed types of KHR_mesh_quantization,
+        unsigned normalized types are the core ones.
+        """
+        values = self._buffer.get_array(channel_id)
+        if not len(values):
+            return False
+
+        if values.min() >= 0 and values.max() <= 1:
+            self._buffer.quantize(channel_id, UNSIGNED_TYPES[bits])
+        elif values.min() >= -1 and values.max() <= 1:
+            self._buffer.quantize(channel_id, SIGNED_TYPES[bits])
+            return True
+        # otherwise keep float, tiled UVs need KHR_texture_transform
+        return False
+
+    def _quantize_weights(self, channel_ids, bits):
+        """
+        Quantizes weights of all the layers of the primitive together,
+        keeping the sum of quantized weights of each vertex.
+        """
+        ctype = UNSIGNED_TYPES[bits]
+        max_value = np.iinfo(np.uint8 if bits == 8 else np.uint16).max
+
+        weights = np.hstack([self._buffer.get_array(i) for i in channel_ids])
+        quantized = np.round(weights * max_value)
+
+        # put rounding error into the biggest weight
+        error = np.round(weights.sum(axis=1) * max_value) - quantized.sum(axis=1)
+        biggest = np.argmax(weights, axis=1)
+        rows = np.arange(len(quantized))
+        quantized[rows, biggest] = np.clip(
+            quantized[rows, biggest] + error, 0, max_value)
+
+        for i, channel_id in enumerate(channel_ids):
+            self._buffer.set_array(
+                channel_id, quantized[:, i * 4:i * 4 + 4], ctype,
+                normalized=True)
+
+    def quantize(self):
+        """
+        Quantizes vertex attributes using KHR_mesh_quantization.
+        The extension is declared only if any attribute
+        is quantized to the types beyond the core ones.
+        """
+        bits = dict(QUANTIZE_BITS)
+        bits.update(self._quantize)
+
+        mesh_nodes = self._get_mesh_nodes()
+        done = set()
+        is_quantized = False
+
+        for mesh_id, gltf_mesh in enumerate(self._root['meshes']):
+            if mesh_id in mesh_nodes:
+                gltf_nodes = [self._root['nodes'][i] for i in mesh_nodes[mesh_id]]
+                if self._quantize_positions(
+                        gltf_mesh, gltf_nodes, bits['position']):
+                    is_quantized = True
+
+            for gltf_primitive in gltf_mesh['primitives']:
+                attributes = gltf_primitive['attributes']
+                if attributes['POSITION'] in done:  # shared attributes
+                    continue
+                done.add(attributes['POSITION'])
+
+                for name, channel_id in attributes.items():
+                    if name in ('NORMAL', 'TANGENT'):
+                        self._buffer.quantize(
+                            channel_id, SIGNED_TYPES[bits[name.lower()]])
+                        is_quantized = True
+                    elif name.startswith('TEXCOORD_'):
+                        if self._quantize_texcoord(
+                                channel_id, bits['texcoord']):
+                            is_quantized = True
+
+                weights = sorted(
+                    name for name in attributes if name.startswith('WEIGHTS_'))
+                if weights:
+                    self._quantize_weights(
+                        [attributes[name] for name in weights], bits['weights'])
+
+        if not is_quantized:
+            return
+
+        for extensions in ('extensionsUsed', 'extensionsRequired'):
+            if extensions not in self._root:
+                self._root[extensions] = []
+            if 'KHR_mesh_quantization' not in self._root[extensions]:
+                self._root[extensions].append('KHR_mesh_quantization')
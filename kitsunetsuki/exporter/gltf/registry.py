@@ -0,0 +1,84 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# root lists with the name lookups
+COLLECTIONS = (
+    'nodes',
+    'meshes',
+    'materials',
+    'images',
+    'textures',
+    'samplers',
+    'skins',
+)
+
+
+class GLTFRegistry(object):
+    """
+    Name to index maps of the glTF root lists.
+    Items appended to the lists are indexed on the next lookup,
+    the first item with the same name wins.
+    """
+    def __init__(self, root):
+        self._root = root
+        self._lists = {}
+        self._names = {}
+        self._joints = {}  # skin ID -> (joints number, joint name -> index)
+
+    def _update(self, collection):
+        items = self._root[collection]
+        if self._lists.get(collection) is not items:  # replaced list
+            self._lists[collection] = items
+            self._names[collection] = ({}, 0)
+
+        names, size = self._names[collection]
+        if size > len(items):  # truncated list
+            names, size = {}, 0
+
+        for i in range(size, len(items)):
+            name = items[i].get('name')
+            if name is not None and name not in names:
+                names[name] = i
+
+        self._names[collection] = (names, len(items))
+        return names
+
+    def get(self, collection, name):
+        """
+        Returns index of the first item with the name or None.
+        """
+        return self._update(collection).get(name)
+
+    def add(self, collection, item):
+        """
+        Appends item to the root list and returns its index.
+        """
+        self._root[collection].append(item)
+        return len(self._root[collection]) - 1
+
+    def get_joints(self, skin_id):
+        """
+        Returns joint indices of the skin by joint names.
+        """
+        gltf_skin = self._root['skins'][skin_id]
+        size, results = self._joints.get(skin_id, (None, None))
+        if size != len(gltf_skin['joints']):
+            results = {}
+            for i, node_id in enumerate(gltf_skin['joints']):
+                results[self._root['nodes'][node_id]['name']] = i
+            self._joints[skin_id] = (len(gltf_skin['joints']), results)
+
+        return results
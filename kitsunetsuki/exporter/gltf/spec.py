@@ -13,11 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+TYPE_BYTE = 5120
 TYPE_UNSIGNED_BYTE = 5121
+TYPE_SHORT = 5122
 TYPE_UNSIGNED_SHORT = 5123
 TYPE_UNSIGNED_INT = 5125
 TYPE_FLOAT = 5126
 
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+MODE_TRIANGLES = 4
+
 CLAMP_TO_EDGE = 33071
 MIRRORED_REPEAT = 33648
 REPEAT = 10497
+
+NUM_COMPONENTS = {
+    'SCALAR': 1,
+    'VEC2': 2,
+    'VEC3': 3,
+    'VEC4': 4,
+    'MAT4': 4 * 4,
+}
@@ -78,7 +78,8 @@ class TextureMixin(object):
         else:  # embedded texture
             gltf_image['extras'] = {}
             if image_texture.image.packed_file:
-                gltf_image['extras']['data'] = image_texture.image.packed_file.data
+                # don't copy the data, buffer will write it directly
+                gltf_image['extras']['packed_file'] = image_texture.image.packed_file
             else:
                 gltf_image['extras']['uri'] = os.path.join(self.get_cwd(), filepath)
 
@@ -0,0 +1,234 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+
+HAS_BPY = importlib.util.find_spec('bpy') is not None
+
+
+@unittest.skipUnless(HAS_BPY, 'requires Blender as a Python module')
+class GLTFBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki.exporter.gltf import buffer, spec
+
+        self.spec = spec
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.filepath = os.path.join(self.path, 'test.gltf')
+        self.make_buffer = lambda **kwargs: buffer.GLTFBuffer(
+            self.filepath, **kwargs)
+
+    def _add_channel(self, buf, values, ctype=None, vtype='VEC3',
+                     reference=None, **kwargs):
+        channel_id = buf.add_channel({
+            'componentType': ctype or self.spec.TYPE_FLOAT,
+            'type': vtype,
+            'extras': {
+                'reference': reference,
+            },
+        }, **kwargs)['bufferView']
+        buf.write_many(channel_id, values)
+        return channel_id
+
+    def _export(self, buf, root=None):
+        root = root or {}
+        root.update({'accessors': [], 'bufferViews': [], 'buffers': []})
+        buf.export(root, os.path.join(self.path, 'test.bin'))
+        with open(os.path.join(self.path, 'test.bin'), 'rb') as f:
+            return root, f.read()
+
+    def _get_view_data(self, root, data, accessor_id):
+        view = root['bufferViews'][root['accessors'][accessor_id]['bufferView']]
+        offset = view['byteOffset']
+        return data[offset:offset + view['byteLength']]
+
+    def test_layout(self):
+        buf = self.make_buffer()
+        positions = np.arange(12, dtype=np.float32).reshape(-1, 3)
+        position = self._add_channel(
+            buf, positions, reference='POSITION',
+            target=self.spec.ARRAY_BUFFER)
+        indices = self._add_channel(
+            buf, [0, 1, 2, 0, 2, 3], self.spec.TYPE_UNSIGNED_INT, 'SCALAR',
+            target=self.spec.ELEMENT_ARRAY_BUFFER)
+
+        root, data = self._export(buf)
+        self.assertEqual(root['buffers'], [{
+            'byteLength': len(data), 'uri': 'test.bin'}])
+        self.assertEqual(root['accessors'][position]['count'], 4)
+        self.assertEqual(root['accessors'][position]['min'], [0, 1, 2])
+        self.assertEqual(root['accessors'][position]['max'], [9, 10, 11])
+        self.assertEqual(
+            self._get_view_data(root, data, position), positions.tobytes())
+
+        # indices are narrowed to the smallest type
+        self.assertEqual(root['accessors'][indices]['count'], 6)
+        self.assertEqual(
+            root['accessors'][indices]['componentType'],
+            self.spec.TYPE_UNSIGNED_BYTE)
+        self.assertEqual(
+            self._get_view_data(root, data, indices), bytes([0, 1, 2, 0, 2, 3]))
+
+    def test_layout_twice(self):
+        buf = self.make_buffer()
+        self._add_channel(buf, np.zeros((4, 3)))
+        self._export(buf)
+
+        with self.assertRaises(RuntimeError):
+            buf.layout({'accessors': [], 'bufferViews': [], 'buffers': []})
+
+    def test_dedup(self):
+        buf = self.make_buffer()
+        values = np.arange(12).reshape(-1, 3)
+        first = self._add_channel(buf, values)
+        second = self._add_channel(buf, values)
+        third = self._add_channel(buf, values + 1)
+
+        root, data = self._export(buf)
+        accessors = root['accessors']
+        self.assertEqual(
+            accessors[first]['bufferView'], accessors[second]['bufferView'])
+        self.assertNotEqual(
+            accessors[first]['bufferView'], accessors[third]['bufferView'])
+        self.assertEqual(len(root['bufferViews']), 2)
+        self.assertEqual(len(data), 2 * values.size * 4)
+
+    def test_sparse(self):
+        buf = self.make_buffer(sparse_threshold=0.5)
+        values = np.zeros((8, 3))
+        values[5] = 1
+        sparse = self._add_channel(buf, values, sparse=True)
+        dense = self._add_channel(buf, np.ones((8, 3)), sparse=True)
+        empty = self._add_channel(buf, np.zeros((8, 3)), sparse=True)
+
+        root, data = self._export(buf)
+        accessor = root['accessors'][sparse]
+        self.assertNotIn('bufferView', accessor)
+        self.assertEqual(accessor['count'], 8)
+        self.assertEqual(accessor['sparse']['count'], 1)
+
+        indices_view = accessor['sparse']['indices']['bufferView']
+        values_view = accessor['sparse']['values']['bufferView']
+        for view_id, expected in (
+                (indices_view, bytes([5])),
+                (values_view, np.ones(3, dtype=np.float32).tobytes())):
+            view = root['bufferViews'][view_id]
+            offset = view['byteOffset']
+            self.assertEqual(
+                data[offset:offset + view['byteLength']], expected)
+
+        self.assertIn('bufferView', root['accessors'][dense])
+        self.assertNotIn('sparse', root['accessors'][dense])
+
+        # no elements at all
+        self.assertNotIn('bufferView', root['accessors'][empty])
+        self.assertNotIn('sparse', root['accessors'][empty])
+
+    def test_interleave(self):
+        buf = self.make_buffer()
+        positions = np.arange(12, dtype=np.float32).reshape(-1, 3)
+        normals = np.ones((4, 3), dtype=np.float32)
+        position = self._add_channel(
+            buf, positions, target=self.spec.ARRAY_BUFFER)
+        normal = self._add_channel(
+            buf, normals, target=self.spec.ARRAY_BUFFER,
+            interleave_with=position)
+
+        root, data = self._export(buf)
+        accessors = root['accessors']
+        self.assertEqual(
+            accessors[position]['bufferView'], accessors[normal]['bufferView'])
+        self.assertEqual(accessors[position]['byteOffset'], 0)
+        self.assertEqual(accessors[normal]['byteOffset'], 12)
+
+        view = root['bufferViews'][accessors[position]['bufferView']]
+        self.assertEqual(view['byteStride'], 24)
+        self.assertEqual(
+            self._get_view_data(root, data, position),
+            np.hstack([positions, normals]).tobytes())
+
+    def test_alignment(self):
+        for alignment in (None, 16):
+            buf = self.make_buffer(alignment=alignment)
+            self._add_channel(
+                buf, [1, 2, 3], self.spec.TYPE_UNSIGNED_BYTE, 'SCALAR',
+                target=self.spec.ELEMENT_ARRAY_BUFFER)
+            self._add_channel(
+                buf, [1, 2, 3], self.spec.TYPE_UNSIGNED_SHORT, 'SCALAR')
+            self._add_channel(
+                buf, np.ones((3, 2)), self.spec.TYPE_UNSIGNED_BYTE, 'VEC2',
+                target=self.spec.ARRAY_BUFFER)
+            self._add_channel(buf, np.ones((3, 3)))
+
+            root, _ = self._export(buf)
+            for view, item_size in zip(root['bufferViews'], (1, 2, 4, 4)):
+                self.assertEqual(
+                    view['byteOffset'] % max(alignment or 1, item_size), 0)
+
+    def test_misaligned(self):
+        buf = self.make_buffer()
+        self._add_channel(buf, np.ones((3, 3)))
+        root, _ = self._export(buf)
+
+        root['bufferViews'][0]['byteOffset'] = 2
+        with self.assertRaises(ValueError):
+            buf._check_alignment(root)
+
+    def test_meshopt(self):
+        spec = self.spec
+        for mode, expected in (
+                (None, 'TRIANGLES'),
+                (spec.MODE_TRIANGLES, 'TRIANGLES'),
+                (1, 'INDICES')):  # lines
+            buf = self.make_buffer(meshopt='required')
+            position = self._add_channel(
+                buf, np.zeros((300, 3)), target=spec.ARRAY_BUFFER)
+            indices = self._add_channel(
+                buf, np.arange(300), spec.TYPE_UNSIGNED_INT, 'SCALAR',
+                target=spec.ELEMENT_ARRAY_BUFFER)
+
+            gltf_primitive = {
+                'attributes': {'POSITION': position},
+                'indices': indices,
+            }
+            if mode is not None:
+                gltf_primitive['mode'] = mode
+
+            root, _ = self._export(
+                buf, {'meshes': [{'primitives': [gltf_primitive]}]})
+            views = root['bufferViews']
+            view = views[root['accessors'][indices]['bufferView']]
+            self.assertEqual(
+                view['extensions']['EXT_meshopt_compression']['mode'],
+                expected)
+            self.assertEqual(
+                root['extensionsRequired'], ['EXT_meshopt_compression'])
+
+            # uncompressed data goes to the fallback buffer
+            self.assertEqual(view['buffer'], 1)
+            self.assertEqual(
+                root['buffers'][1]['extensions'],
+                {'EXT_meshopt_compression': {'fallback': True}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from kitsunetsuki.base.cache import GeomCache
+
+
+HAS_BPY = importlib.util.find_spec('bpy') is not None
+HAS_PANDA3D = importlib.util.find_spec('panda3d') is not None
+
+
+class GeomCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache = GeomCache(self.path)
+
+    def _save(self, key):
+        self.cache.save(key, {'name': 'test'}, {
+            'positions': np.arange(12, dtype=np.float32).reshape(-1, 3),
+        })
+
+    def test_key(self):
+        positions = np.arange(12, dtype=np.float32).reshape(-1, 3)
+        key = self.cache.get_key({'z_up': False}, positions)
+
+        self.assertEqual(key, self.cache.get_key({'z_up': False}, positions.copy()))
+        self.assertNotEqual(key, self.cache.get_key({'z_up': True}, positions))
+        self.assertNotEqual(key, self.cache.get_key({'z_up': False}, positions + 1))
+        self.assertNotEqual(key, self.cache.get_key(
+            {'z_up': False}, positions.astype(np.float64)))
+        self.assertNotEqual(key, self.cache.get_key(
+            {'z_up': False}, positions.reshape(-1, 2)))
+
+    def test_load(self):
+        self._save('key')
+
+        header, arrays = self.cache.load('key')
+        self.assertEqual(header, {'name': 'test'})
+        self.assertEqual(arrays['positions'].tolist(), [
+            [0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]])
+        self.assertIsNone(self.cache.load('missing'))
+
+    def test_save(self):
+        self._save('key')
+        self._save('key')
+
+        self.assertEqual(os.listdir(self.path), ['key.npz'])
+        self.assertEqual(
+            self.cache._size, os.path.getsize(os.path.join(self.path, 'key.npz')))
+
+    def test_damaged(self):
+        self._save('key')
+        filepath = os.path.join(self.path, 'key.npz')
+        with open(filepath, 'rb') as f:
+            data = f.read()
+
+        for damaged in (b'', b'garbage', data[:len(data) // 2], data[:-1]):
+            with open(filepath, 'wb') as f:
+                f.write(damaged)
+            self.assertIsNone(self.cache.load('key'))
+
+        # damaged entry is replaced
+        self._save('key')
+        self.assertIsNotNone(self.cache.load('key'))
+
+    def test_removed(self):
+        self._save('key')
+
+        # entry is evicted by another process after it's read
+        with mock.patch('os.utime', side_effect=FileNotFoundError):
+            self.assertIsNone(self.cache.load('key'))
+
+    def test_evict(self):
+        self._save('key')
+        size = os.path.getsize(os.path.join(self.path, 'key.npz'))
+
+        cache = GeomCache(self.path, max_size=size * 2)
+        for i in range(4):
+            cache.save('key{}'.format(i), {}, {
+                'positions': np.zeros((4, 3), dtype=np.float32),
+            })
+
+        self.assertLessEqual(cache._size, size * 2)
+        self.assertNotIn('key.npz', os.listdir(self.path))
+        self.assertIn('key3.npz', os.listdir(self.path))
+
+
+def make_object(name):
+    import bpy
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(
+        [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)], [], [(0, 1, 2, 3)])
+    mesh.uv_layers.new(name='UVMap')
+    mesh.update()
+
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+@unittest.skipUnless(HAS_BPY, 'requires Blender as a Python module')
+class GLTFGeomKeyTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki import blend2gltf
+        from kitsunetsuki.exporter.gltf import GLTFExporter
+
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+        argv = ['blend2gltf', '-o', os.path.join(self.path, 'test.glb')]
+        with mock.patch.object(sys, 'argv', argv):
+            self.exporter = GLTFExporter(blend2gltf.parse_args())
+        self.exporter._root = self.exporter.make_root_node()
+        self.obj = make_object('GLTFGeomKey')
+
+    def _get_key(self):
+        return self.exporter.get_geom_key(
+            {}, {'extras': {'targetNames': []}}, self.obj, self.obj.data)
+
+    def test_key(self):
+        key = self._get_key()
+        self.assertEqual(key, self._get_key())
+
+        # VRM joints are always 16-bit
+        self.exporter._output = os.path.join(self.path, 'test.vrm')
+        self.assertNotEqual(key, self._get_key())
+
+    def test_flags(self):
+        key = self._get_key()
+        for name, value in (
+                ('_z_up', True),
+                ('_weld_tolerance', 0.01),
+                ('_interleave', True),
+                ('_short_indices', True),
+                ('_geom_scale', 2)):
+            with mock.patch.object(self.exporter, name, value):
+                self.assertNotEqual(key, self._get_key(), name)
+
+    def test_mesh(self):
+        key = self._get_key()
+        self.obj.data.vertices[0].co.x = 0.5
+        self.assertNotEqual(key, self._get_key())
+
+
+@unittest.skipUnless(
+    HAS_BPY and HAS_PANDA3D, 'requires Blender as a Python module and Panda3D')
+class EggGeomCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki import blend2egg
+
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache_dir = os.path.join(self.path, 'cache')
+
+        argv = [
+            'blend2egg', '-o', os.path.join(self.path, 'test.egg'),
+            '--cache-dir', self.cache_dir]
+        with mock.patch.object(sys, 'argv', argv):
+            self.args = blend2egg.parse_args()
+        self.obj = make_object('EggGeomCache')
+
+    def _make_exporter(self):
+        from kitsunetsuki.exporter.egg import EggExporter
+
+        exporter = EggExporter(self.args)
+        exporter._root = exporter.make_root_node()
+        return exporter
+
+    def _make_geom(self, exporter):
+        from panda3d.egg import EggGroup, EggPolygon
+
+        node = EggGroup(self.obj.name)
+        exporter.make_geom(node, self.obj)
+        return [
+            [tuple(child.get_vertex(i).get_pos3())
+             for i in range(child.get_num_vertices())]
+            for child in node.get_children() if isinstance(child, EggPolygon)]
+
+    def test_key(self):
+        import bpy
+
+        exporter = self._make_exporter()
+        key = exporter.get_geom_key(self.obj, self.obj.data)
+        self.assertEqual(key, exporter.get_geom_key(self.obj, self.obj.data))
+
+        # normals and tangents are transformed by the object matrix
+        self.obj.location.x = 1
+        bpy.context.view_layer.update()
+        self.assertNotEqual(key, exporter.get_geom_key(self.obj, self.obj.data))
+        self.obj.location.x = 0
+        bpy.context.view_layer.update()
+
+        for name, value in (
+                ('_no_extra_uv', True),
+                ('_weld_tolerance', 0.01),
+                ('_geom_scale', 2)):
+            with mock.patch.object(exporter, name, value):
+                self.assertNotEqual(
+                    key, exporter.get_geom_key(self.obj, self.obj.data), name)
+
+    def test_damaged(self):
+        polygons = self._make_geom(self._make_exporter())
+        self.assertTrue(os.listdir(self.cache_dir))
+
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                f.write(b'garbage')
+
+        # damaged entries are built again
+        self.assertEqual(polygons, self._make_geom(self._make_exporter()))
+        self.assertEqual(polygons, self._make_geom(self._make_exporter()))
+
+
+if __name__ == '__main__':
+    unittest.main()
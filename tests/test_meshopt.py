@@ -0,0 +1,171 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib.util
+import unittest
+
+import numpy as np
+
+
+HAS_BPY = importlib.util.find_spec('bpy') is not None
+HAS_MESHOPTIMIZER = importlib.util.find_spec('meshoptimizer') is not None
+
+
+def make_indices(rng):
+    """
+    Returns triangle list indices of the grid in the vertex cache order,
+    some random triangles and a strip.
+    """
+    size = 32
+    indices = []
+    for y in range(size):
+        for x in range(size):
+            a = y * (size + 1) + x
+            b, c, d = a + 1, a + size + 1, a + size + 2
+            indices += [a, b, d, a, d, c]
+    indices += rng.integers(0, 1000, 300).tolist()
+    for i in range(100):
+        indices += [i, i + 1, i + 2]
+    return np.array(indices)
+
+
+def get_triangles(indices):
+    """
+    Returns triangles rotated to the smallest index first,
+    the index buffer codec keeps the winding only.
+    """
+    results = []
+    for a, b, c in np.asarray(indices).reshape(-1, 3).tolist():
+        results.append(min((a, b, c), (b, c, a), (c, a, b)))
+    return results
+
+
+@unittest.skipUnless(HAS_BPY, 'requires Blender as a Python module')
+class MeshoptTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki.exporter.gltf import meshopt
+
+        self.meshopt = meshopt
+
+    def test_can_encode(self):
+        meshopt = self.meshopt
+
+        self.assertTrue(meshopt.can_encode(meshopt.MODE_ATTRIBUTES, 12))
+        self.assertFalse(meshopt.can_encode(meshopt.MODE_ATTRIBUTES, 6))
+        self.assertFalse(meshopt.can_encode(meshopt.MODE_ATTRIBUTES, 260))
+        for mode in (meshopt.MODE_TRIANGLES, meshopt.MODE_INDICES):
+            self.assertTrue(meshopt.can_encode(mode, 2))
+            self.assertTrue(meshopt.can_encode(mode, 4))
+            self.assertFalse(meshopt.can_encode(mode, 1))
+        self.assertFalse(meshopt.can_encode(None, 4))
+
+    def test_vertex_buffer(self):
+        vertices = np.array(
+            [[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]], dtype='<f4')
+
+        data = self.meshopt.encode_vertex_buffer(vertices.tobytes(), 12)
+        self.assertEqual(data, bytes.fromhex(
+            'a00000013f000000ffffff013f0000007e7d7e0000010c000000ff010c0000'
+            '007e' + '00' * 36))
+
+    def test_index_buffer(self):
+        indices = np.array([0, 1, 2, 2, 1, 3, 4, 5, 6])
+
+        for dtype, stride in (('<u2', 2), ('<u4', 4)):
+            data = self.meshopt.encode_index_buffer(
+                indices.astype(dtype).tobytes(), stride)
+            self.assertEqual(data, bytes.fromhex(
+                'e1f010f0007687566778a9866589689801690000'))
+
+    def test_index_sequence(self):
+        indices = np.array([0, 1, 2, 100, 3])
+
+        for dtype, stride in (('<u2', 2), ('<u4', 4)):
+            data = self.meshopt.encode_index_sequence(
+                indices.astype(dtype).tobytes(), stride)
+            self.assertEqual(data, bytes.fromhex('d100040491030400000000'))
+
+    def test_encode(self):
+        meshopt = self.meshopt
+        data = np.arange(6, dtype='<u2').tobytes()
+
+        self.assertEqual(
+            meshopt.encode(data, meshopt.MODE_TRIANGLES, 2),
+            meshopt.encode_index_buffer(data, 2))
+        self.assertEqual(
+            meshopt.encode(data, meshopt.MODE_INDICES, 2),
+            meshopt.encode_index_sequence(data, 2))
+        self.assertEqual(
+            meshopt.encode(data, meshopt.MODE_ATTRIBUTES, 4),
+            meshopt.encode_vertex_buffer(data, 4))
+
+
+@unittest.skipUnless(
+    HAS_BPY and HAS_MESHOPTIMIZER,
+    'requires Blender as a Python module and meshoptimizer')
+class MeshoptDecodeTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki.exporter.gltf import meshopt
+
+        self.meshopt = meshopt
+        self.rng = np.random.default_rng(0)
+
+    def _decode(self, decode, count, stride, data):
+        import meshoptimizer
+
+        results = getattr(meshoptimizer, decode)(count, stride, data)
+        results = np.asarray(results).tobytes()[:count * stride]
+        return np.frombuffer(results, dtype='<u{}'.format(stride))
+
+    def test_vertex_buffer(self):
+        import meshoptimizer
+
+        # bigger than a single block with a tail
+        vertices = np.cumsum(
+            self.rng.normal(size=(1000, 8)), axis=0).astype('<f4')
+        vertices[:, 3] = 1
+        vertices[500:600] = 0
+
+        for stride in (4, 16, 32):
+            data = vertices.reshape(-1)[:1000 * stride // 4].tobytes()
+            encoded = self.meshopt.encode_vertex_buffer(data, stride)
+            decoded = meshoptimizer.decode_vertex_buffer(
+                1000, stride, encoded)
+            self.assertEqual(np.asarray(decoded).tobytes(), data, stride)
+
+    def test_index_buffer(self):
+        indices = make_indices(self.rng)
+
+        for stride in (2, 4):
+            data = indices.astype('<u{}'.format(stride)).tobytes()
+            encoded = self.meshopt.encode_index_buffer(data, stride)
+            decoded = self._decode(
+                'decode_index_buffer', len(indices), stride, encoded)
+            self.assertEqual(
+                get_triangles(decoded), get_triangles(indices), stride)
+
+    def test_index_sequence(self):
+        indices = make_indices(self.rng)
+
+        for stride in (2, 4):
+            data = indices.astype('<u{}'.format(stride)).tobytes()
+            encoded = self.meshopt.encode_index_sequence(data, stride)
+            decoded = self._decode(
+                'decode_index_sequence', len(indices), stride, encoded)
+            self.assertEqual(decoded.tolist(), indices.tolist(), stride)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from kitsunetsuki.base.optimize import (
+    OVERDRAW_THRESHOLD, get_acmr, get_atvr, get_cache_misses,
+    optimize_overdraw, optimize_vertex_fetch, tipsify)
+
+
+def make_grid(size):
+    """
+    Returns vertex count and triangle list indices of the grid,
+    triangles are in the row order.
+    """
+    indices = []
+    for y in range(size):
+        for x in range(size):
+            a = y * (size + 1) + x
+            b, c, d = a + 1, a + size + 1, a + size + 2
+            indices += [a, b, d, a, d, c]
+    return (size + 1) ** 2, np.array(indices)
+
+
+def make_shuffled_grid(size):
+    vertex_count, indices = make_grid(size)
+    rng = np.random.default_rng(0)
+    triangles = indices.reshape(-1, 3)[rng.permutation(len(indices) // 3)]
+    return vertex_count, triangles.reshape(-1)
+
+
+def get_triangles(indices):
+    """
+    Returns sorted triangles, keeping their winding.
+    """
+    results = []
+    for a, b, c in np.asarray(indices).reshape(-1, 3).tolist():
+        results.append(min((a, b, c), (b, c, a), (c, a, b)))
+    return sorted(results)
+
+
+class CacheTestCase(unittest.TestCase):
+    def test_misses(self):
+        self.assertEqual(get_cache_misses([0, 1, 2, 0, 2, 3]), 4)
+        self.assertEqual(get_cache_misses([0, 1, 2, 3, 0], cache_size=3), 5)
+        self.assertEqual(get_acmr([0, 1, 2, 0, 2, 3]), 2)
+        self.assertEqual(get_atvr([0, 1, 2, 0, 2, 3]), 1)
+        self.assertEqual(get_acmr([]), 0)
+        self.assertEqual(get_atvr([]), 0)
+
+
+class TipsifyTestCase(unittest.TestCase):
+    def test_triangles(self):
+        vertex_count, indices = make_shuffled_grid(16)
+        result = tipsify(indices, vertex_count)
+
+        self.assertEqual(get_triangles(result), get_triangles(indices))
+
+    def test_acmr(self):
+        for vertex_count, indices in (
+                make_grid(16), make_grid(64), make_shuffled_grid(16)):
+            result = tipsify(indices, vertex_count)
+            self.assertLessEqual(get_acmr(result), get_acmr(indices))
+
+        vertex_count, indices = make_shuffled_grid(32)
+        self.assertLess(get_acmr(tipsify(indices, vertex_count)), 1)
+
+    def test_empty(self):
+        self.assertEqual(len(tipsify([], 0)), 0)
+
+
+class OverdrawTestCase(unittest.TestCase):
+    def _make_spheres(self):
+        """
+        Returns positions and shuffled triangles of the outer sphere
+        and the inner one, which is occluded by the outer sphere.
+        """
+        rings, segments = 16, 32
+        theta, phi = np.meshgrid(
+            np.linspace(0, np.pi, rings + 1),
+            np.linspace(0, 2 * np.pi, segments, endpoint=False),
+            indexing='ij')
+        sphere = np.stack([
+            np.sin(theta) * np.cos(phi),
+            np.sin(theta) * np.sin(phi),
+            np.cos(theta)], axis=-1).reshape(-1, 3)
+
+        indices = []
+        for ring in range(rings):
+            for segment in range(segments):
+                a = ring * segments + segment
+                b = ring * segments + (segment + 1) % segments
+                indices += [a, a + segments, b + segments, a, b + segments, b]
+        indices = np.array(indices)
+
+        positions = np.concatenate([sphere, sphere * 0.5])
+        indices = np.concatenate([indices, indices + len(sphere)])
+        rng = np.random.default_rng(0)
+        triangles = indices.reshape(-1, 3)
+        triangles = triangles[rng.permutation(len(triangles))]
+        return positions, triangles.reshape(-1), len(sphere)
+
+    def test_overdraw(self):
+        positions, indices, outer_count = self._make_spheres()
+        indices = tipsify(indices, len(positions))
+        result = optimize_overdraw(indices, positions)
+
+        self.assertEqual(get_triangles(result), get_triangles(indices))
+        # the threshold is the target ACMR of every cluster,
+        # the last cluster of the patch may exceed it
+        self.assertLessEqual(
+            get_acmr(result), get_acmr(indices) * OVERDRAW_THRESHOLD * 1.05)
+
+        # outer sphere is drawn first
+        outer = np.all(result.reshape(-1, 3) < outer_count, axis=1)
+        self.assertLess(
+            np.flatnonzero(outer).mean(), np.flatnonzero(~outer).mean())
+
+    def test_empty(self):
+        self.assertEqual(len(optimize_overdraw([], np.zeros((0, 3)))), 0)
+
+
+class VertexFetchTestCase(unittest.TestCase):
+    def test_fetch(self):
+        vertex_count, indices = make_shuffled_grid(8)
+        indices = tipsify(indices, vertex_count)
+        remapped, order = optimize_vertex_fetch(indices, vertex_count)
+
+        # vertices are in order of the first use
+        self.assertEqual(sorted(order.tolist()), list(range(vertex_count)))
+        _, first = np.unique(remapped, return_index=True)
+        self.assertTrue(np.all(np.diff(first) > 0))
+
+        # same triangles with remapped vertices
+        self.assertEqual(order[remapped].tolist(), indices.tolist())
+        self.assertEqual(get_acmr(remapped), get_acmr(indices))
+
+    def test_unused(self):
+        remapped, order = optimize_vertex_fetch([3, 1, 3], 5)
+
+        self.assertEqual(remapped.tolist(), [0, 1, 0])
+        self.assertEqual(order.tolist(), [3, 1, 0, 2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
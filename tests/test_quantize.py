@@ -0,0 +1,144 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib.util
+import unittest
+
+import numpy as np
+
+
+HAS_BPY = importlib.util.find_spec('bpy') is not None
+
+
+@unittest.skipUnless(HAS_BPY, 'requires Blender as a Python module')
+class QuantizeTestCase(unittest.TestCase):
+    def setUp(self):
+        from kitsunetsuki.exporter.gltf import buffer, quantize, spec
+
+        class Exporter(quantize.QuantizeMixin):
+            pass
+
+        self.spec = spec
+        self.exporter = Exporter()
+        self.exporter._buffer = buffer.GLTFBuffer(None)
+        self.exporter._quantize = {}
+        self.exporter._root = {
+            'meshes': [],
+            'nodes': [],
+        }
+
+    def _add_channel(self, values, vtype):
+        buf = self.exporter._buffer
+        channel_id = buf.add_channel({
+            'componentType': self.spec.TYPE_FLOAT,
+            'type': vtype,
+        })['bufferView']
+        buf.write_many(channel_id, values)
+        return channel_id
+
+    def _add_mesh(self, attributes, node=None):
+        root = self.exporter._root
+        root['meshes'].append({
+            'primitives': [{
+                'attributes': {
+                    name: self._add_channel(values, vtype)
+                    for name, (values, vtype) in attributes.items()
+                },
+            }],
+        })
+        gltf_node = {'mesh': len(root['meshes']) - 1}
+        gltf_node.update(node or {})
+        root['nodes'].append(gltf_node)
+        return root['meshes'][-1]['primitives'][0]['attributes']
+
+    def _make_weights(self, count, layers):
+        rng = np.random.default_rng(0)
+        weights = rng.random((count, layers * 4))
+        weights[:, 1::3] = 0  # unused influences
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+    def test_weights(self):
+        buf = self.exporter._buffer
+        positions = np.zeros((100, 3))
+
+        for bits, ctype, total in (
+                (8, self.spec.TYPE_UNSIGNED_BYTE, 255),
+                (16, self.spec.TYPE_UNSIGNED_SHORT, 65535)):
+            self.exporter._quantize = {'weights': bits}
+            self.exporter._root = {'meshes': [], 'nodes': []}
+            weights = self._make_weights(100, 2)
+            attributes = self._add_mesh({
+                'POSITION': (positions, 'VEC3'),
+                'WEIGHTS_0': (weights[:, :4], 'VEC4'),
+                'WEIGHTS_1': (weights[:, 4:], 'VEC4'),
+            }, {'skin': 0})
+            self.exporter.quantize()
+
+            quantized = np.hstack([
+                buf.get_array(attributes['WEIGHTS_0']),
+                buf.get_array(attributes['WEIGHTS_1'])]).astype(np.int64)
+            for name in ('WEIGHTS_0', 'WEIGHTS_1'):
+                metadata = buf._metadata[attributes[name]]
+                self.assertEqual(metadata['componentType'], ctype)
+                self.assertTrue(metadata['normalized'])
+
+            # sum of quantized weights is exact
+            self.assertTrue(np.all(quantized.sum(axis=1) == total))
+            self.assertTrue(np.all(quantized[:, 1::3] == 0))
+            self.assertLess(
+                np.abs(quantized / total - weights).max(), 2 / total)
+
+    def test_extension(self):
+        # core types only
+        self._add_mesh({
+            'POSITION': (np.zeros((3, 3)), 'VEC3'),
+            'TEXCOORD_0': (np.full((3, 2), 0.5), 'VEC2'),
+            'WEIGHTS_0': (self._make_weights(3, 1), 'VEC4'),
+        }, {'skin': 0})
+        self.exporter.quantize()
+        self.assertNotIn('extensionsUsed', self.exporter._root)
+
+        self.exporter._root = {'meshes': [], 'nodes': []}
+        self._add_mesh({
+            'POSITION': (np.zeros((3, 3)), 'VEC3'),
+            'NORMAL': (np.tile([0, 0, 1], (3, 1)), 'VEC3'),
+        }, {'skin': 0})
+        self.exporter.quantize()
+        for name in ('extensionsUsed', 'extensionsRequired'):
+            self.assertEqual(
+                self.exporter._root[name], ['KHR_mesh_quantization'])
+
+    def test_positions(self):
+        buf = self.exporter._buffer
+        positions = np.array([[0, 0, 0], [2, 1, 0], [4, 2, 2]])
+        attributes = self._add_mesh({
+            'POSITION': (positions, 'VEC3'),
+        }, {'translation': [1, 0, 0]})
+        self.exporter.quantize()
+
+        # dequantized by the node transform
+        gltf_node = self.exporter._root['nodes'][0]
+        quantized = buf.get_array(attributes['POSITION']) / 32767
+        self.assertEqual(
+            buf._metadata[attributes['POSITION']]['componentType'],
+            self.spec.TYPE_SHORT)
+        np.testing.assert_allclose(
+            quantized * gltf_node['scale'] + gltf_node['translation'],
+            positions + [1, 0, 0], atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
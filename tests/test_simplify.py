@@ -0,0 +1,111 @@
+# Copyright (c) 2020 kitsune.ONE team.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from kitsunetsuki.base.simplify import simplify
+
+
+def make_sphere(rings=16, segments=32):
+    """
+    Returns positions, UV and triangle list indices of the UV sphere.
+    Vertices of the UV seam and the poles are split by UV.
+    """
+    theta, phi = np.meshgrid(
+        np.linspace(0, np.pi, rings + 1),
+        np.linspace(0, 2 * np.pi, segments + 1),
+        indexing='ij')
+    positions = np.stack([
+        np.sin(theta) * np.cos(phi),
+        np.sin(theta) * np.sin(phi),
+        np.cos(theta)], axis=-1).reshape(-1, 3)
+    uvs = np.stack([
+        phi / (2 * np.pi), 1 - theta / np.pi], axis=-1).reshape(-1, 2)
+
+    # exactly the same positions of the split vertices
+    positions = np.round(positions, 6)
+
+    indices = []
+    for ring in range(rings):
+        for segment in range(segments):
+            a = ring * (segments + 1) + segment
+            b, c, d = a + 1, a + segments + 1, a + segments + 2
+            if ring > 0:
+                indices += [a, c, d]
+            if ring < rings - 1:
+                indices += [a, d, b]
+    return positions, uvs, np.array(indices)
+
+
+class SimplifyTestCase(unittest.TestCase):
+    def test_ratio(self):
+        positions, uvs, indices = make_sphere()
+        count = len(indices) // 3
+
+        for ratio in (0.5, 0.25):
+            result, error = simplify(positions, indices, ratio, attributes=uvs)
+            self.assertLessEqual(len(result) // 3, count * ratio)
+            self.assertGreater(len(result) // 3, count * ratio * 0.5)
+            self.assertGreater(error, 0)
+            self.assertLess(error, 0.1)
+
+            # original vertices are referenced
+            self.assertTrue(set(result.tolist()) <= set(indices.tolist()))
+
+    def test_flat(self):
+        # every triangle has its own vertices, like a flat shaded mesh
+        positions, uvs, indices = make_sphere()
+        count = len(indices) // 3
+
+        result, _ = simplify(
+            positions[indices], np.arange(len(indices)), 0.5,
+            attributes=uvs[indices])
+        self.assertLessEqual(len(result) // 3, count * 0.5)
+        self.assertGreater(len(result) // 3, count * 0.25)
+
+    def test_seams(self):
+        positions, uvs, indices = make_sphere()
+
+        result, _ = simplify(positions, indices, 0.25, attributes=uvs)
+        triangles = uvs[result.reshape(-1, 3)]
+
+        # no triangles across the UV seam
+        spans = triangles[..., 0].max(axis=1) - triangles[..., 0].min(axis=1)
+        self.assertLess(spans.max(), 0.5)
+
+    def test_max_error(self):
+        positions, uvs, indices = make_sphere()
+
+        result, error = simplify(
+            positions, indices, 0.25, max_error=0.01, attributes=uvs)
+        self.assertLessEqual(error, 0.01)
+        self.assertGreater(len(result) // 3, len(indices) // 3 * 0.25)
+        self.assertLess(len(result), len(indices))
+
+    def test_unchanged(self):
+        positions, uvs, indices = make_sphere()
+
+        result, error = simplify(positions, indices, 1)
+        self.assertEqual(result.tolist(), indices.tolist())
+        self.assertEqual(error, 0)
+
+        result, error = simplify(np.zeros((0, 3)), [], 0.5)
+        self.assertEqual(len(result), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()